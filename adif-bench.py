@@ -0,0 +1,225 @@
+"""A benchmark suite for adif.py on synthetic logs.
+
+Generates realistic LoTW/WSJT-X-style logs at several sizes, in both the single-field-per-line layout and the
+one-record-per-line layout, then measures parse throughput, peak RSS, get/set cost and write throughput. Each
+measurement runs in a fresh process so that its peak RSS is its own.
+
+Results can be saved as a baseline (per host, since timings are machine specific) and later runs report how far
+each number moved from it, flagging regressions beyond a threshold.
+
+Example usage:
+```python3 adif-bench.py --sizes 10k,100k --save_baseline```
+```python3 adif-bench.py --sizes 10k,100k```
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+from adif import ADIFFile, ADIFWriter, open_compressed
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+LAYOUTS = ["field-per-line", "record-per-line"]
+CASES = ["iter_records", "parse", "parse_cached", "get", "set", "write"]
+COMPRESSIONS = {"none": "", "gz": ".gz", "xz": ".xz", "bz2": ".bz2", "zst": ".zst"}
+
+# Metrics where a larger value is an improvement; for the rest (times, memory) smaller is better
+HIGHER_IS_BETTER = {"records_per_s", "mb_per_s"}
+
+BANDS = [("160m", 1.8), ("80m", 3.5), ("40m", 7.0), ("30m", 10.1), ("20m", 14.0), ("17m", 18.068),
+         ("15m", 21.0), ("12m", 24.89), ("10m", 28.0), ("6m", 50.0)]
+MODES = [("FT8", "DATA"), ("FT4", "DATA"), ("CW", "CW"), ("SSB", "PHONE"), ("RTTY", "DATA")]
+
+
+def synthetic_record(rng, i):
+    """Build the (name, value) fields of one LoTW-style QSO."""
+    band, base = rng.choice(BANDS)
+    mode, mode_group = rng.choice(MODES)
+    grid = f'{rng.choice("CDEFJKLP")}{rng.choice("LMNOP")}{rng.randint(0, 99):02d}'
+    confirmed = rng.choice("YN")
+    fields = [
+        ("APP_LoTW_OWNCALL", "W1AW"), ("STATION_CALLSIGN", "W1AW"), ("MY_DXCC", "291"),
+        ("MY_COUNTRY", "UNITED STATES OF AMERICA"), ("MY_GRIDSQUARE", rng.choice(["CM87", "CM88", "DM79"])),
+        ("CALL", f'{rng.choice(["K", "W", "JA", "DL", "VK", "ZL", "PY"])}{rng.randint(0, 9)}{i % 17576:04d}'),
+        ("BAND", band), ("FREQ", f'{base + rng.random() * 0.1:.5f}'), ("MODE", mode),
+        ("APP_LoTW_MODEGROUP", mode_group),
+        ("QSO_DATE", f'20{rng.randint(10, 24)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}'),
+        ("TIME_ON", f'{rng.randint(0, 23):02d}{rng.randint(0, 59):02d}{rng.randint(0, 59):02d}'),
+        ("QSL_RCVD", confirmed), ("DXCC", str(rng.randint(1, 522))),
+        ("COUNTRY", "FEDERAL REPUBLIC OF GERMANY"), ("CQZ", str(rng.randint(1, 40))),
+        ("ITUZ", str(rng.randint(1, 90))), ("GRIDSQUARE", grid),
+    ]
+    if confirmed == "Y":
+        fields.append(("QSLRDATE", "20240101"))
+    return fields
+
+
+def generate_log(path, count, layout, seed=1):
+    """Write a synthetic log of count QSOs in the given layout."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ARRL Logbook of the World Status Report\nGenerated by adif-bench.py\n\n")
+        f.write("<PROGRAMID:4>LoTW\n<APP_LoTW_NUMREC:{0}>{1}\n<eoh>\n".format(len(str(count)), count))
+        for i in range(count):
+            specs = [f'<{name}:{len(value)}>{value}' for name, value in synthetic_record(rng, i)]
+            if layout == "field-per-line":
+                f.write("\n".join(specs) + "\n<eor>\n\n")
+            else:
+                f.write(" ".join(specs) + " <eor>\n")
+
+
+def run_case(case, path):
+    """Run one measurement in this process and return its metrics."""
+    size_mb = os.path.getsize(path) / 1e6
+    metrics = {}
+    if case == "iter_records":
+        start = time.perf_counter()
+        count = sum(1 for _ in ADIFFile.iter_records(path))
+        elapsed = time.perf_counter() - start
+        metrics.update(records_per_s=count / elapsed, mb_per_s=size_mb / elapsed, seconds=elapsed)
+    elif case == "parse":
+        start = time.perf_counter()
+        log = ADIFFile()
+        log.parse(path)
+        elapsed = time.perf_counter() - start
+        metrics.update(records_per_s=len(log.records) / elapsed, mb_per_s=size_mb / elapsed, seconds=elapsed)
+    elif case == "parse_cached":
+        ADIFFile().parse_cached(path)  # make sure the cache is warm
+        start = time.perf_counter()
+        log = ADIFFile()
+        log.parse_cached(path)
+        elapsed = time.perf_counter() - start
+        metrics.update(records_per_s=len(log.records) / elapsed, seconds=elapsed)
+    elif case in ("get", "set", "write"):
+        log = ADIFFile()
+        log.parse(path)
+        records = [r for r in log.records if r.type == "record"]
+        start = time.perf_counter()
+        if case == "get":
+            for r in records:
+                r.get("DXCC"); r.get("MY_DXCC"); r.get("BAND"); r.get("QSL_RCVD"); r.get("MY_GRIDSQUARE")
+            metrics["ns_per_op"] = (time.perf_counter() - start) * 1e9 / (5 * len(records))
+        elif case == "set":
+            for r in records:
+                r.set("MY_SIG", "POTA")
+            metrics["ns_per_op"] = (time.perf_counter() - start) * 1e9 / len(records)
+        else:
+            out_path = f'{path}.out'
+            with open(out_path, "w", encoding="utf-8") as out:
+                with ADIFWriter(out) as writer:
+                    writer.write_all(log.records)
+            elapsed = time.perf_counter() - start
+            metrics.update(records_per_s=len(records) / elapsed,
+                           mb_per_s=os.path.getsize(out_path) / 1e6 / elapsed, seconds=elapsed)
+            os.remove(out_path)
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    metrics["peak_rss_mb"] = peak / (1e6 if sys.platform == "darwin" else 1e3)
+    return metrics
+
+
+def measure(case, path):
+    """Run one measurement in a fresh Python process so its peak RSS is not shared with other cases."""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run_case", case, path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """Print each metric next to its baseline and return the number of regressions beyond threshold."""
+    regressions = 0
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if not base:
+                print(f'   {name:<40} {metric:<14} {value:12.2f}')
+                continue
+            change = (value - base) / base
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f'   {name:<40} {metric:<14} {value:12.2f}  baseline {base:12.2f}  {change:+7.1%}{flag}')
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    prog='adif-bench',
+                    description="Benchmarks ADIF parsing and writing on synthetic logs",
+                    epilog='End Transmission')
+
+    parser.add_argument('--sizes', default="10k,100k,1M", help="Comma-separated log sizes from: " + ", ".join(SIZES))
+    parser.add_argument('--layouts', default=",".join(LAYOUTS), help="Comma-separated layouts from: " + ", ".join(LAYOUTS))
+    parser.add_argument('--cases', default=",".join(CASES), help="Comma-separated cases from: " + ", ".join(CASES))
+    parser.add_argument(
+        '--compressions',
+        default="none",
+        help="Comma-separated storage formats of the generated logs from: " + ", ".join(COMPRESSIONS)
+    )
+    parser.add_argument('--data_dir', default=".adif-bench", help="Where generated logs are kept between runs")
+    parser.add_argument('--baseline', default="adif-bench-baseline.json", help="Baseline file (keyed by host name)")
+    parser.add_argument('--save_baseline', action='store_true', help="Store this run as the baseline for this host")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Relative change counted as a regression")
+    parser.add_argument('--json', help="Also write this run's results as JSON to this path")
+    parser.add_argument('--run_case', nargs=2, metavar=("CASE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(*args.run_case)))
+        sys.exit(0)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {}
+    for size in args.sizes.split(","):
+        for layout in args.layouts.split(","):
+            path = os.path.join(args.data_dir, f'synthetic-{size}-{layout}.adi')
+            if not os.path.exists(path):
+                print(f'Generating {path} ...')
+                generate_log(path, SIZES[size], layout)
+            for compression in args.compressions.split(","):
+                stored_path = path + COMPRESSIONS[compression]
+                if not os.path.exists(stored_path):
+                    print(f'Compressing {stored_path} ...')
+                    with open(path, "rb") as plain, open_compressed(stored_path, "wb") as packed:
+                        shutil.copyfileobj(plain, packed)
+                if compression != "none":
+                    results[f'size/{size}/{layout}/{compression}'] = {
+                        "ratio": os.path.getsize(stored_path) / os.path.getsize(path)
+                    }
+                for case in args.cases.split(","):
+                    name = f'{case}/{size}/{layout}' + ("" if compression == "none" else f'/{compression}')
+                    print(f'Running {name} ...')
+                    results[name] = measure(case, stored_path)
+
+    host = socket.gethostname()
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    print()
+    print(f'Results on {host} (Python {sys.version.split()[0]}):')
+    regressions = compare(results, baselines.get(host, {}), args.threshold)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"host": host, "python": sys.version.split()[0], "results": results}, f, indent=2)
+    if args.save_baseline:
+        baselines.setdefault(host, {}).update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f'Saved baseline for {host} to {args.baseline}')
+    elif regressions:
+        print(f'{regressions} regression(s) beyond {args.threshold:.0%}')
+        sys.exit(1)
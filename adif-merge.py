@@ -0,0 +1,65 @@
+"""A tool for merging ADIF logs (LoTW downloads, WSJT-X logs, contest logs) into one log without duplicate QSOs."""
+
+import argparse
+import sys
+
+from adif import ADIFMerger, fill_missing_fields, prefer_confirmed
+
+RESOLVERS = {
+    "confirmed": prefer_confirmed,
+    "fill": fill_missing_fields,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    prog='adif-merge',
+                    description="Merges ADIF logs into one, dropping duplicate QSOs",
+                    epilog='End Transmission')
+
+    parser.add_argument('inputs', nargs='+', help="ADIF files to merge, in order of preference")
+    parser.add_argument(
+        '-o', '--output_filename',
+        required=True,
+        help="The output ADIF filepath to write to"
+    )
+    parser.add_argument(
+        '-k', '--key',
+        default=",".join(ADIFMerger.DEFAULT_KEY),
+        help="Comma-separated fields that identify the same QSO (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--time_tolerance',
+        type=int,
+        default=2,
+        help="Minutes that TIME_ON may differ between duplicates, if TIME_ON is in the key (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--prefer',
+        choices=sorted(RESOLVERS),
+        default="confirmed",
+        help="How to resolve duplicates: keep the LoTW-confirmed one, or fill in fields missing from the first"
+    )
+    args = parser.parse_args()
+
+    merger = ADIFMerger(args.key.split(","), args.time_tolerance, RESOLVERS[args.prefer])
+    for path in args.inputs:
+        print(f'Reading from {path}...')
+        try:
+            merger.merge(path, verbose=True)
+        except FileNotFoundError:
+            print(f"ERROR: Could not find file {path}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"ERROR: Failed to parse ADIF file {path}: {str(e)}")
+            sys.exit(1)
+    print(f'   Dropped {merger.duplicates} duplicate records')
+
+    print(f'Starting write to "{args.output_filename}" ...')
+    try:
+        with open(args.output_filename, "w", encoding='utf-8') as f:
+            merger.to_adif_file().write(f)
+    except (IOError, PermissionError) as e:
+        print(f"ERROR: Failed to write to {args.output_filename}: {str(e)}")
+        sys.exit(1)
+    print('   [DONE]')
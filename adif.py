@@ -2,20 +2,210 @@
     It is not a complete implementation of the ADIF specification and has only been tested with LoTW and WSJT-X ADIF
     files.
 
-    Note: this implementation chooses to read and write single fields per line, though many ADIF files use multiple
-    fields per line.
+    Note: this implementation chooses to write single fields per line, though many ADIF files use multiple fields per
+    line. Both layouts are read, since the tokenizer is driven by the <NAME:LEN> length prefix rather than by lines.
 
     Note: Field type and comments are very minimally tested.
 
     See https://www.adif.org/
 """
 
+import bz2
+import concurrent.futures
+import datetime
+import gc
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import marshal
+import mmap
+import os
 import re
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for ADIFTable
+    np = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is only needed for .zst files
+    zstandard = None
 
 #TODO: add validation test cases
-#TODO: add read and write test cases
 #TODO: add minimum field set warning
 
+CHUNK_SIZE = 1 << 20  # bytes read per call when streaming an ADIF file
+WRITE_BUFFER_SIZE = 1 << 20  # characters buffered by ADIFWriter between writes
+PARALLEL_CHUNK_SIZE = 16 << 20  # bytes of log per worker task in ADIFFile.parse_parallel
+
+# Persisted ADIFMappedFile index: magic, file size, file mtime_ns, header end offset, offset count
+_INDEX_MAGIC = b'ADIFIDX1'
+_INDEX_HEADER = struct.Struct('<8sqqqq')
+
+_CACHE_MAGIC = b'ADIFCACHE3'  # version tag of the ADIFFile.parse_cached format
+
+# Compressed formats understood by open_compressed: magic bytes for reading, extensions for writing
+_MAGIC = {"gzip": b'\x1f\x8b', "xz": b'\xfd7zXZ\x00', "bzip2": b'BZh', "zstd": b'\x28\xb5\x2f\xfd'}
+_EXTENSIONS = {"gzip": ".gz", "xz": ".xz", "bzip2": ".bz2", "zstd": ".zst"}
+
+# Matches a data specifier (<NAME:LEN:TYPE>, <NAME:LEN>) or a bare tag like <eor>/<eoh>
+_TAG_RE = re.compile(rb'<(\w+)(?::(\d+)(?::(\w+))?)?>')
+
+
+def _scan(buf, pos=0, final=True):
+    """Yield (name, type, tag_start, data_start, data_end) for each tag in buf[pos:].
+
+    Field data is skipped using the declared length, so values may contain '<' or newlines. Tags without a length
+    (<eor>, <eoh>) have a data_start of None. If final is False, scanning stops quietly before a tag that is not
+    completely in the buffer yet; everything before the first '<' after the last yielded tag has been consumed.
+    """
+    search = _TAG_RE.search
+    size = len(buf)
+    while True:
+        m = search(buf, pos)
+        if m is None:
+            return
+        name, length, field_type = m.groups()
+        data_start = m.end()
+        if length is None:
+            yield name, field_type, m.start(), None, data_start
+            pos = data_start
+            continue
+        data_end = data_start + int(length)
+        if data_end > size:
+            if not final:
+                return
+            data_end = size
+        yield name, field_type, m.start(), data_start, data_end
+        pos = data_end
+
+
+def _compression(file_path):
+    """Get the compression of a file from its magic bytes, or None if it is not compressed (or does not exist)."""
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(6)
+    except (OSError, TypeError):
+        return None
+    for name, magic in _MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_compressed(file_path, mode="rb", encoding="utf-8", errors="strict"):
+    """Open a file, transparently decompressing or compressing gzip, xz, bzip2 or zstd data.
+
+    When reading, the compression is sniffed from the file's magic bytes, so plain files open as usual. When
+    writing, it is chosen from the extension (.gz, .xz, .bz2, .zst). Data is (de)compressed as it streams, so
+    memory use stays bounded. zstd needs the optional zstandard package. Text modes ("rt", "wt") return a text
+    stream with the given encoding.
+    """
+    if "r" in mode:
+        compression = _compression(file_path)
+    else:
+        compression = next((name for name, ext in _EXTENSIONS.items() if str(file_path).endswith(ext)), None)
+    if compression is None:
+        if "b" in mode:
+            return open(file_path, mode)
+        return open(file_path, mode.replace("t", ""), encoding=encoding, errors=errors)
+    binary_mode = mode.replace("t", "").replace("b", "") + "b"
+    if compression == "gzip":
+        stream = gzip.open(file_path, binary_mode, compresslevel=6)
+    elif compression == "xz":
+        stream = lzma.open(file_path, binary_mode)
+    elif compression == "bzip2":
+        stream = bz2.open(file_path, binary_mode)
+    else:
+        if zstandard is None:
+            raise ImportError(f"{file_path} is zstd compressed, which requires the zstandard package")
+        stream = zstandard.open(file_path, binary_mode)
+    if "b" in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, errors=errors)
+
+
+def _open_input(input_file):
+    """Return a binary file object for a path or an already open file, and whether the caller must close it."""
+    if hasattr(input_file, "read"):
+        return getattr(input_file, "buffer", input_file), False
+    return open_compressed(input_file, "rb"), True
+
+
+def _wanted_fields(fields):
+    """Return the set of upper-cased field names to keep, or None to keep every field."""
+    return None if fields is None else {f.upper() for f in fields}
+
+
+def tokenize(input_file, chunk_size=CHUNK_SIZE, fields=None):
+    """Stream (field_name, field_data, field_type) tuples from an ADIF path or file.
+
+    The file is read in chunk_size blocks, so memory use does not depend on the size of the log. Markers such as
+    <eor> and <eoh> are yielded with field_data set to None. If fields is given, only those fields (matched
+    case-insensitively) are yielded; the data of all others is skipped by its length without being decoded.
+    """
+    stream, close = _open_input(input_file)
+    return _tokenize(stream, close, chunk_size, _wanted_fields(fields))
+
+
+def _decode_tokens(buf, final=True, names=None, wanted=None, lengths=False):
+    """Yield decoded (field_name, field_data, field_type) tuples for the tags in buf, skipping fields not in wanted.
+
+    With lengths, each tuple also carries the field's length specifier (see _declared_length). Returns the offset at
+    which scanning should resume once more data has been appended to buf.
+    """
+    if names is None:
+        names = {}
+    pos = 0
+    for name, field_type, _, data_start, data_end in _scan(buf, 0, final):
+        pos = data_end
+        entry = names.get(name)
+        if entry is None:
+            field_name = sys.intern(name.decode('ascii'))
+            entry = names[name] = (field_name, wanted is None or field_name.upper() in wanted)
+        field_name, keep = entry
+        if data_start is None:
+            if lengths:
+                yield field_name, None, field_type and field_type.decode('ascii'), None
+            else:
+                yield field_name, None, field_type and field_type.decode('ascii')
+        elif keep:
+            field_data = buf[data_start:data_end].decode('utf-8', 'replace')
+            if lengths:
+                yield (field_name, field_data, field_type and field_type.decode('ascii'),
+                       _declared_length(field_data, data_end - data_start))
+            else:
+                yield field_name, field_data, field_type and field_type.decode('ascii')
+    # Resume at the first tag that was not complete in this buffer
+    pos = buf.find(b'<', pos)
+    return len(buf) if pos < 0 else pos
+
+
+def _tokenize(stream, close, chunk_size, wanted=None, lengths=False):
+    """Generator behind tokenize(), which opens the input eagerly so that I/O errors surface at call time."""
+    names = {}
+    try:
+        buf = b''
+        pos = 0
+        final = False
+        while not final:
+            chunk = stream.read(chunk_size)
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            final = not chunk
+            buf = buf[pos:] + chunk
+            pos = yield from _decode_tokens(buf, final, names, wanted, lengths)
+    finally:
+        if close:
+            stream.close()
+
+
 class ADIFRow:
     """A single row (field) of an ADIF QSO."""
     def __init__(self, string):
@@ -110,64 +300,440 @@ class ADIFRecord:
 
         if not found:
             new_row = ADIFRow(None)
-            new_row.set(field_name.upper(), field_data)
+            new_row.set(field_name.upper(), field_data, field_type, comment)
             self += new_row
 
+class CompactADIFRecord:
+    """A memory-compact ADIF record with O(1) field lookup.
+
+    Fields are stored in a dict keyed by the interned, upper-cased field name. Each value is a
+    (field_name, field_data, field_type) tuple that keeps the name as written in the file, and the dict keeps
+    insertion order for __str__. A field read with a length specifier other than the number of characters of its
+    value (non-ASCII values, or ones cut short by the end of the file) has that length as a fourth item, so it is
+    written back as it was read. A comment given to set() is kept as a fifth item (the fourth then being None if
+    there is no length to keep); like ADIFRow's, it is not written out. A repeated field name is kept as well, its
+    n-th repeat under the key (upper-cased name, n), so get() returns the first value as ADIFRecord's does.
+    """
+    __slots__ = ("fields", "type")
+
+    def __init__(self, record_type="record"):
+        """Initialize a CompactADIFRecord object."""
+        self.fields = {}
+        self.type = record_type
+
+    def add(self, field_name, field_data, field_type=None, comment=None):
+        """Append a field, as a repeat if one with the same name is already present."""
+        key = sys.intern(field_name.upper())
+        if key in self.fields:
+            key = _repeat_key(self.fields, key)
+        if comment is None:
+            self.fields[key] = (field_name, field_data, field_type)
+        else:
+            self.fields[key] = (field_name, field_data, field_type, None, comment)
+
+    def __add__(self, row):
+        """Add an ADIFRow to the record."""
+        self.add(row.field_name, row.field_data, row.field_type, row.comment)
+        return self
+
+    def __len__(self):
+        """Get the number of fields in the record."""
+        return len(self.fields)
+
+    @property
+    def rows(self):
+        """Get the fields as a list of ADIFRow objects."""
+        rows = []
+        for field in self.fields.values():
+            row = ADIFRow(None)
+            row.set(*field[:3], comment=field[4] if len(field) > 4 else None)
+            if len(field) > 3 and field[3] is not None:
+                row.field_length = field[3]
+            rows.append(row)
+        return rows
+
+    def get(self, field_name):
+        """Get the data for a field name."""
+        field = self.fields.get(field_name)
+        if field is None:
+            field = self.fields.get(field_name.upper())
+            if field is None:
+                return None
+        return field[1]
+
+    def __str__(self):
+        """Get the string representation of the record, identical to ADIFRecord's."""
+        parts = [_field_str(*field) + " " for field in self.fields.values()]
+        if self.type == "record":
+            parts.append("<eor>")
+        elif self.type == "header":
+            parts.append("<eoh>\n\n")
+        return "".join(parts)
+
+    def remove_except(self, allowed_fields):
+        """Remove all fields except the allowed fields."""
+        allowed = {f.upper() for f in allowed_fields}
+        fields = {}
+        for k, v in self.fields.items():
+            name = k if isinstance(k, str) else k[0]
+            if name in allowed:
+                fields[k] = (name,) + v[1:]
+        self.fields = fields
+
+    def set(self, field_name, field_data, field_type=None, comment=None):
+        """Set the data for a field name, including any repeats of it as ADIFRecord does."""
+        key = sys.intern(field_name.upper())
+        if comment is None:
+            field = (key, field_data, field_type)
+        else:
+            field = (key, field_data, field_type, None, comment)
+        self.fields[key] = field
+        n = 1
+        while (key, n) in self.fields:
+            self.fields[key, n] = field
+            n += 1
+
+
+def _repeat_key(fields, key):
+    """Get the key under which to keep the next repeat of the field key in a CompactADIFRecord's fields."""
+    n = 1
+    while (key, n) in fields:
+        n += 1
+    return key, n
+
+
+def _declared_length(field_data, length):
+    """Get the length specifier to keep with a field read as length bytes, or None if it is len(field_data).
+
+    Writing len(field_data) back, as ADIFRow does, reproduces ASCII values; other values keep what was read.
+    """
+    return None if len(field_data) == length else length
+
+
+def _field_str(field_name, field_data, field_type, length=None, comment=None):
+    """Get the string representation of a field, matching ADIFRow.__str__ (which leaves out the comment)."""
+    if length is None:
+        length = len(field_data)
+    if field_name == "CALL":
+        field_data = field_data.ljust(8, " ")
+    if field_type:
+        return f'<{field_name}:{length}:{field_type}>{field_data}'
+    return f'<{field_name}:{length}>{field_data}'
+
+def _build_records(tokens, verbose=False):
+    """Group a stream of (field_name, field_data, field_type, length) tokens into CompactADIFRecords.
+
+    length is the field's length specifier, or None where it is len(field_data) (see _declared_length).
+    """
+    keys = {}
+    current_entry = CompactADIFRecord()
+    for field_name, field_data, field_type, length in tokens:
+        if field_data is not None:
+            key = keys.get(field_name)
+            if key is None:
+                key = keys[field_name] = sys.intern(field_name.upper())
+            fields = current_entry.fields
+            if key in fields:
+                key = _repeat_key(fields, key)
+            if length is None:
+                fields[key] = (field_name, field_data, field_type)
+            else:
+                fields[key] = (field_name, field_data, field_type, length)
+            if verbose: print(f'parsed row into {_field_str(field_name, field_data, field_type, length)}')
+            continue
+        marker = field_name.lower()
+        if marker == "eor":
+            if verbose: print('found <eor>')
+            yield current_entry
+            current_entry = CompactADIFRecord()
+        elif marker == "eoh":
+            if verbose: print('found <eoh>')
+            current_entry.type = "header"
+            yield current_entry
+            current_entry = CompactADIFRecord()
+        elif verbose:
+            print(f'skipping tag "<{field_name}>"')
+
+
+def _scan_records(buf, pos=0, final=True, wanted=None):
+    """Yield (record, end) for each record in buf[pos:] closed by <eor> or <eoh>, end being the offset after it.
+
+    Fields whose upper-cased name is not in wanted (if given) are skipped without being decoded.
+    """
+    keys = {}
+    record = CompactADIFRecord()
+    for name, field_type, _, data_start, data_end in _scan(buf, pos, final):
+        if data_start is None:
+            marker = name.lower()
+            if marker == b'eor':
+                yield record, data_end
+                record = CompactADIFRecord()
+            elif marker == b'eoh':
+                record.type = "header"
+                yield record, data_end
+                record = CompactADIFRecord()
+            continue
+        key = keys.get(name)
+        if key is None:
+            field_name = sys.intern(name.decode('ascii'))
+            upper = sys.intern(field_name.upper())
+            key = keys[name] = (field_name, upper) if wanted is None or upper in wanted else False
+        if not key:
+            continue
+        if field_type is not None:
+            field_type = field_type.decode('ascii')
+        field_data = buf[data_start:data_end].decode('utf-8', 'replace')
+        length = _declared_length(field_data, data_end - data_start)
+        fields = record.fields
+        upper = key[1]
+        if upper in fields:
+            upper = _repeat_key(fields, upper)
+        if length is None:
+            fields[upper] = (key[0], field_data, field_type)
+        else:
+            fields[upper] = (key[0], field_data, field_type, length)
+
+
+def _parse_span(file_path, start, stop, wanted=None):
+    """Parse whole records from a record boundary at start until the first record ending at or after stop.
+
+    Runs in ADIFFile.parse_parallel worker processes. Returns the records as (type, fields) tuples, which pickle much
+    faster than objects, and the offset at which parsing stopped.
+    """
+    entries = []
+    end = start
+    with open(file_path, "rb") as input_file:
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for record, end in _scan_records(buf, start, wanted=wanted):
+                entries.append((record.type, record.fields))
+                if end >= stop:
+                    break
+    return entries, end
+
+
+def _cache_key(file_path):
+    """Fingerprint a file as (absolute path, size, mtime_ns, sha256) for ADIFFile.parse_cached."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as input_file:
+        stat = os.fstat(input_file.fileno())
+        for block in iter(lambda: input_file.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+class ADIFWriter:
+    """A buffered ADIF writer that serializes records into a reusable buffer and flushes it in large blocks.
+
+    In exact mode (the default) the output is byte-for-byte what str(record) + "\n" per record produces, including
+    the CALL padding and the space after every field. With exact=False records are written compactly: no CALL
+    padding, and one space between fields but none after the last.
+    """
+    def __init__(self, output_file, exact=True, buffer_size=WRITE_BUFFER_SIZE):
+        """Initialize an ADIFWriter writing to an open text or binary file."""
+        self.output_file = output_file
+        self.exact = exact
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._binary = not isinstance(output_file, io.TextIOBase)
+        self._parts = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def write(self, record):
+        """Serialize one record into the buffer, flushing it when full."""
+        fields = getattr(record, "fields", None)
+        if fields is None:
+            # ADIFRecord keeps ADIFRow objects, whose own __str__ defines the output
+            text = str(record) + "\n"
+        else:
+            exact = self.exact
+            parts = []
+            for field in fields.values():
+                field_name, field_data, field_type = field[:3]
+                length = field[3] if len(field) > 3 and field[3] is not None else len(field_data)
+                if exact and field_name == "CALL":
+                    field_data = field_data.ljust(8, " ")
+                if field_type:
+                    parts.append(f'<{field_name}:{length}:{field_type}>{field_data}')
+                else:
+                    parts.append(f'<{field_name}:{length}>{field_data}')
+            text = " ".join(parts)
+            if exact and parts:
+                text += " "  # str(record) ends every field with a space
+            if record.type == "record":
+                text += "<eor>\n"
+            elif record.type == "header":
+                text += "<eoh>\n\n\n" if exact else "<eoh>\n\n"
+            else:
+                text += "\n"
+        self._parts.append(text)
+        self._size += len(text)
+        self.count += 1
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, records, test=None):
+        """Write every header and every record passing test (if given) from any iterable. Returns the count."""
+        count = self.count
+        write = self.write
+        for r in records:
+            if test is None or r.type == "header" or test(r):
+                write(r)
+        return self.count - count
+
+    def flush(self):
+        """Write the buffered records to the output file in one call."""
+        if self._parts:
+            block = "".join(self._parts)
+            self.output_file.write(block.encode('utf-8') if self._binary else block)
+            self._parts.clear()
+            self._size = 0
+
+
 class ADIFFile:
     """A collection of ADIF records."""
     def __init__(self):
         """Initialize an ADIFFile object."""
         self.records = []
 
-    def parse(self, file_path, verbose=False):
-        """Parse an ADIF file from a given path."""
-        current_entry = ADIFRecord()
-        input_rows = []
-        with open(file_path, 'r') as input_file:
-            for i,row in enumerate(input_file):
-            # If format uses single lines, split into multiple lines
-                if row.count("<") > 1:
-
-                    content = row.replace("<","\n<")
-                    for r in content.splitlines():
-                        input_rows.append(r)
-                else:
-                    input_rows.append(row)
-
-        for row in input_rows:
-            r = ADIFRow(row)
-            if r.parse():
-                current_entry += r
-                if verbose: print(f'parsed row into {r}')
-                if not r.validate():
-                    if verbose: print(f'Row "{row.strip()}" didn\'t validate')
-            elif "<eor>" in row:
-                if verbose: print('found <eor>')
-                self.records.append(current_entry)
-                current_entry = ADIFRecord()
-                continue
-            elif "<eoh>" in row:
-                if verbose: print('found <eoh>')
-                current_entry.type = "header"
-                self.records.append(current_entry)
-                current_entry = ADIFRecord()
-                continue
-            else:
-                if verbose: print(f'skipping row "{row.strip()}"')
+    @staticmethod
+    def iter_records(file_path, verbose=False, fields=None):
+        """Yield the records of an ADIF file one at a time as CompactADIFRecords from a path or open file.
+
+        If fields is given, records only contain those fields; leave it as None when records will be rewritten.
+        """
+        stream, close = _open_input(file_path)
+        return _build_records(_tokenize(stream, close, CHUNK_SIZE, _wanted_fields(fields), lengths=True), verbose)
+
+    def parse(self, file_path, verbose=False, fields=None):
+        """Parse an ADIF file from a given path or open file, keeping only the given fields if any."""
+        self.records.extend(self.iter_records(file_path, verbose, fields))
         if verbose:
             print(f'   Parsed {len(self.records)} records into ADIFFile')
             for r in self.records:
                 print(len(r), r)
 
-    def write(self, output_file, test=None, verbose=True):
-        """Write an ADIF file to a given path."""
-        count = 0
+    def parse_parallel(self, file_path, workers=None, chunk_size=PARALLEL_CHUNK_SIZE, verbose=False, fields=None):
+        """Parse an ADIF file from a given path using a pool of worker processes.
+
+        After the header, the file is cut into chunk_size spans at <eor> tags and each span is parsed in a separate
+        process. A cut point is only trusted if the span before it really ended there, which is not the case when
+        "<eor>" appears inside a field value; otherwise that span is re-parsed in this process from where the
+        previous one ended. The records are therefore identical to those of parse(), in the same order.
+        Compressed files cannot be cut at byte offsets, so they are parsed serially.
+        """
+        if _compression(file_path):
+            self.parse(file_path, verbose, fields)
+            return
+        wanted = _wanted_fields(fields)
+        with open(file_path, "rb") as input_file:
+            size = os.fstat(input_file.fileno()).st_size
+            if not size:
+                return
+            with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                start = 0
+                for record, end in _scan_records(buf, wanted=wanted):
+                    if record.type == "header":
+                        self.records.append(record)
+                        start = end
+                    break
+                cuts = [start]
+                eor = re.compile(rb'<eor>', re.IGNORECASE)
+                while cuts[-1] + chunk_size < size:
+                    m = eor.search(buf, cuts[-1] + chunk_size)
+                    if m is None:
+                        break
+                    cuts.append(m.end())
+        cuts.append(size)
+        spans = list(zip(cuts[:-1], cuts[1:]))
+        if verbose:
+            print(f'   Parsing {len(spans)} spans of {file_path} with {workers or os.cpu_count()} workers')
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_parse_span, file_path, span_start, span_stop, wanted)
+                       for span_start, span_stop in spans]
+            expected = start
+            for (span_start, span_stop), future in zip(spans, futures):
+                if span_stop <= expected:
+                    future.cancel()  # already covered by an earlier span that ran past its cut
+                    continue
+                if span_start == expected:
+                    entries, expected = future.result()
+                else:
+                    if verbose: print(f'   Cut at {span_start} was inside a value, re-parsing from {expected}')
+                    future.cancel()
+                    entries, expected = _parse_span(file_path, expected, span_stop, wanted)
+                for record_type, fields in entries:
+                    record = CompactADIFRecord(record_type)
+                    record.fields = fields
+                    self.records.append(record)
+        if verbose:
+            print(f'   Parsed {len(self.records)} records into ADIFFile')
+
+    def parse_cached(self, file_path, cache_path=None, verbose=False, fields=None):
+        """Parse an ADIF file through an on-disk cache of its parsed records, stored next to the file by default.
+
+        The cache is keyed by the file's absolute path, size, mtime and SHA-256 (and the fields projection, if
+        any), so any rewrite of the log invalidates it. It starts with the format tag and the key as a line of JSON,
+        which are checked before the records, stored with marshal (which only builds plain data, unlike pickle), are
+        loaded. Returns True if the records came from the cache, and False if the file was parsed (and the cache
+        rewritten).
+        """
+        cache_path = cache_path or f'{file_path}.cache'
+        key = _cache_key(file_path) + (None if fields is None else tuple(sorted(_wanted_fields(fields))),)
+        header = _CACHE_MAGIC + b'\n' + json.dumps(key).encode('utf-8') + b'\n'
+        # Loading allocates millions of small tuples; cyclic GC passes over them are wasted work
+        gc_enabled = gc.isenabled()
+        gc.disable()
         try:
-            for r in self.records:
-                if (r.type == "header") or (test == None) or (test and test(r)):
-                    output_file.write(str(r))
-                    output_file.write("\n")
-                    count += 1
+            with open(cache_path, "rb") as cache_file:
+                if cache_file.read(len(header)) == header:
+                    entries = marshal.loads(cache_file.read())
+                else:
+                    entries = None
+            if entries is not None:
+                records = []
+                for record_type, fields in entries:
+                    if not isinstance(fields, dict):
+                        raise TypeError(f"unexpected {type(fields).__name__} in place of a record's fields")
+                    record = CompactADIFRecord(record_type)
+                    record.fields = fields
+                    records.append(record)
+                self.records.extend(records)
+                if verbose: print(f'   Loaded {len(records)} records from cache {cache_path}')
+                return True
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            if verbose: print(f'   Ignoring cache {cache_path}: {e}')
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        records = list(self.iter_records(file_path, verbose, fields))
+        self.records.extend(records)
+        tmp_path = f'{cache_path}.tmp'
+        try:
+            with open(tmp_path, "wb") as cache_file:
+                cache_file.write(header)
+                cache_file.write(marshal.dumps([(r.type, r.fields) for r in records]))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Unable to write ADIF cache {cache_path}: {e}")
+        return False
+
+    def write(self, output_file, test=None, verbose=True, records=None):
+        """Write an ADIF file to an open file.
+
+        Records come from self.records unless another iterable (such as iter_records) is given, in which case
+        they are streamed through without being held in memory.
+        """
+        try:
+            with ADIFWriter(output_file) as writer:
+                count = writer.write_all(self.records if records is None else records, test)
             if verbose:
                 print(f'   Wrote {count} records')
         except IOError as e:
@@ -185,3 +751,500 @@ class ADIFFile:
         for r in self.records:
             if r.type == "record":
                 r.set(field_name, field_data)
+
+
+def prefer_confirmed(existing, new):
+    """ADIFMerger conflict resolution: keep the earlier record unless only the new one has QSL_RCVD=Y."""
+    if new.get("QSL_RCVD") == "Y" and existing.get("QSL_RCVD") != "Y":
+        return new
+    return existing
+
+
+def fill_missing_fields(existing, new):
+    """ADIFMerger conflict resolution: keep the earlier record, adding any fields only the new one has."""
+    for key, field in new.fields.items():
+        existing.fields.setdefault(key, field)
+    return existing
+
+
+class ADIFMerger:
+    """Merges any number of ADIF logs into one, dropping duplicate QSOs.
+
+    Duplicates are found by hashing a key built from key_fields (compared upper-cased and stripped). If TIME_ON is
+    one of them, times within time_tolerance minutes of each other match: records are hashed into tolerance-sized
+    time buckets and only the neighbouring buckets are compared. If QSO_DATE is also one of them, the buckets are
+    keyed on the full date and time, so QSOs either side of midnight UTC match too. A new record is compared with
+    the record kept for each earlier duplicate, and resolve(existing, new) returns the record to keep. Inputs are
+    streamed, so only the unique records are held in memory.
+    """
+    DEFAULT_KEY = ("CALL", "QSO_DATE", "TIME_ON", "BAND", "MODE")
+
+    def __init__(self, key_fields=DEFAULT_KEY, time_tolerance=0, resolve=prefer_confirmed):
+        """Initialize an ADIFMerger object."""
+        self.key_fields = [f.upper() for f in key_fields if f.upper() != "TIME_ON"]
+        self.use_time = any(f.upper() == "TIME_ON" for f in key_fields)
+        self.use_date = self.use_time and "QSO_DATE" in self.key_fields
+        self.time_tolerance = time_tolerance
+        self.resolve = resolve
+        self.header = None
+        self.records = []
+        self.duplicates = 0
+        self._index = {}  # (key, time bucket) -> positions in self.records
+
+    @staticmethod
+    def _minutes(time_on, qso_date=None):
+        """Convert an ADIF HHMM[SS] time to minutes (seconds are dropped): since midnight, or if an ADIF YYYYMMDD
+        date is given, since the start of the proleptic Gregorian calendar."""
+        try:
+            minutes = int(time_on[0:2]) * 60 + int(time_on[2:4])
+            if qso_date is not None:
+                day = datetime.date(int(qso_date[0:4]), int(qso_date[4:6]), int(qso_date[6:8]))
+                minutes += day.toordinal() * 24 * 60
+            return minutes
+        except (TypeError, ValueError):
+            return None
+
+    def _key(self, record):
+        """Get the index key and time in minutes of a record (None if the time is not used or does not parse)."""
+        minutes = None
+        if self.use_time:
+            minutes = self._minutes(record.get("TIME_ON"), record.get("QSO_DATE") if self.use_date else None)
+        # with a parsed date and time, the date is part of the time rather than of the key
+        fields = [f for f in self.key_fields if not (minutes is not None and self.use_date and f == "QSO_DATE")]
+        return tuple((record.get(f) or "").strip().upper() for f in fields), minutes
+
+    def _bucket(self, minutes):
+        """Get the time bucket for a time in minutes, so duplicates fall in the same or a neighbouring bucket."""
+        return None if minutes is None else minutes // (self.time_tolerance + 1)
+
+    def add(self, record):
+        """Add one record, returning False if it duplicated (and was resolved against) an existing record."""
+        if record.type == "header":
+            if self.header is None:
+                self.header = record
+            return False
+        if not hasattr(record, "fields"):
+            compact = CompactADIFRecord(record.type)
+            for row in record.rows:
+                compact += row
+            record = compact
+        key, minutes = self._key(record)
+        bucket = self._bucket(minutes)
+        candidates = [(key, None)] if bucket is None else [(key, bucket), (key, bucket - 1), (key, bucket + 1)]
+
+        for candidate in candidates:
+            positions = self._index.get(candidate, ())
+            for position in positions:
+                existing = self.records[position]
+                if minutes is not None:
+                    other = self._key(existing)[1]
+                    if abs(other - minutes) > self.time_tolerance:
+                        continue
+                kept = self.records[position] = self.resolve(existing, record)
+                self.duplicates += 1
+                # the kept record may have a different time (or key) from the one it was indexed under
+                kept_key, kept_minutes = self._key(kept)
+                kept_candidate = (kept_key, self._bucket(kept_minutes))
+                if kept_candidate != candidate:
+                    positions.remove(position)
+                    self._index.setdefault(kept_candidate, []).append(position)
+                return False
+
+        self._index.setdefault(candidates[0], []).append(len(self.records))
+        self.records.append(record)
+        return True
+
+    def merge(self, *inputs, verbose=False):
+        """Stream records from each input (a path, open file or iterable of records) into the merge."""
+        for source in inputs:
+            if isinstance(source, (str, os.PathLike)) or hasattr(source, "read"):
+                records = ADIFFile.iter_records(source)
+            else:
+                records = source
+            before = len(self.records)
+            for r in records:
+                self.add(r)
+            if verbose:
+                print(f'   Merged {len(self.records) - before} new records from {source}')
+        return self
+
+    def to_adif_file(self):
+        """Get the merged log as an ADIFFile, header first."""
+        adif_file = ADIFFile()
+        if self.header is not None:
+            adif_file.records.append(self.header)
+        adif_file.records.extend(self.records)
+        return adif_file
+
+
+class ADIFTail:
+    """Incrementally reads records appended to a growing ADIF log, such as WSJT-X's wsjtx_log.adi.
+
+    Each poll reads only the bytes after the last complete record consumed, and yields the complete records found
+    there; a partially written record is left for the next poll. If the file is replaced (new inode), truncated, or
+    rewritten in place (the bytes just before the saved offset changed), reading restarts from the beginning and
+    resets is incremented so that callers can rebuild any state derived from the records.
+    """
+    _CHECK_BYTES = 32  # bytes before the offset remembered to detect an in-place rewrite
+
+    def __init__(self, file_path, fields=None):
+        """Initialize an ADIFTail object, optionally keeping only the given fields. Nothing is read until polled."""
+        self.file_path = file_path
+        self.wanted = _wanted_fields(fields)
+        self.offset = 0
+        self.identity = None
+        self.header = None
+        self.records_read = 0
+        self.resets = 0
+        self._check = b''
+
+    def rewind(self):
+        """Read the whole file again from the beginning on the next poll."""
+        self.offset = 0
+        self.header = None
+        self.records_read = 0
+        self._check = b''
+
+    def iter_new(self):
+        """Return a generator of the complete records appended since the last poll.
+
+        Replacement, truncation and in-place rewrites are detected immediately, so resets is up to date as soon as
+        this returns. The file is only held open while the generator is being consumed.
+        """
+        try:
+            with open(self.file_path, "rb") as input_file:
+                stat = os.fstat(input_file.fileno())
+                identity = (stat.st_dev, stat.st_ino)
+                restart = identity != self.identity or stat.st_size < self.offset
+                if not restart and self._check:
+                    input_file.seek(self.offset - len(self._check))
+                    restart = input_file.read(len(self._check)) != self._check
+        except FileNotFoundError:
+            return iter(())
+        if restart:
+            if self.identity is not None:
+                self.resets += 1
+            self.rewind()
+        self.identity = identity
+        return self._read(identity)
+
+    def _read(self, identity):
+        """Generator behind iter_new(), reading from the current offset of the file with the given identity."""
+        try:
+            input_file = open(self.file_path, "rb")
+        except FileNotFoundError:
+            return
+        with input_file:
+            stat = os.fstat(input_file.fileno())
+            if (stat.st_dev, stat.st_ino) != identity:
+                return  # replaced since iter_new(): the next poll starts it over
+            input_file.seek(self.offset)
+            buf = b''
+            while True:
+                chunk = input_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                buf += chunk
+                consumed = 0
+                for record, consumed in _scan_records(buf, 0, False, self.wanted):
+                    if record.type == "header":
+                        self.header = record
+                        continue
+                    self.records_read += 1
+                    yield record
+                if consumed:
+                    self._check = (self._check + buf[:consumed])[-self._CHECK_BYTES:]
+                    self.offset += consumed
+                    buf = buf[consumed:]
+
+    def poll(self):
+        """Get a list of the complete records appended since the last poll."""
+        return list(self.iter_new())
+
+
+class ADIFMappedFile:
+    """Random access to the records of a large ADIF file through mmap and an index of record offsets.
+
+    The index of <eor> offsets is built on first open by scanning tags with their length prefixes, and can be
+    persisted next to the file so that later opens skip the scan. Records are only decoded when they are accessed.
+    The header, if any, is available as the header attribute and is not counted as a record.
+    """
+    def __init__(self, file_path, persist_index=False, index_path=None, fields=None):
+        """Open and index an ADIF file. The index is stored at index_path (default file_path + ".idx").
+
+        If fields is given, decoded records only contain those fields.
+        """
+        self.file_path = file_path
+        self.wanted = _wanted_fields(fields)
+        self.index_path = index_path or f'{file_path}.idx'
+        if _compression(file_path):
+            raise ValueError(f"{file_path} is compressed and cannot be memory-mapped")
+        self._file = open(file_path, "rb")
+        stat = os.fstat(self._file.fileno())
+        self._fingerprint = (stat.st_size, stat.st_mtime_ns)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self.header_end = 0
+        if not self._load_index():
+            self._build_index()
+            if persist_index:
+                self._save_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Release the memory map and file handle."""
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _build_index(self):
+        """Scan the file once and record where each record starts and ends."""
+        offsets = array('q', [0])
+        for name, _, _, data_start, data_end in _scan(self._map):
+            if data_start is not None:
+                continue
+            marker = name.lower()
+            if marker == b'eor':
+                offsets.append(data_end)
+            elif marker == b'eoh' and len(offsets) == 1:
+                self.header_end = data_end
+                offsets[0] = data_end
+        self.offsets = offsets
+
+    def _load_index(self):
+        """Load a persisted index if it matches the file's size and mtime."""
+        try:
+            with open(self.index_path, "rb") as index_file:
+                magic, size, mtime_ns, header_end, count = _INDEX_HEADER.unpack(index_file.read(_INDEX_HEADER.size))
+                if magic != _INDEX_MAGIC or (size, mtime_ns) != self._fingerprint:
+                    return False
+                offsets = array('q')
+                offsets.frombytes(index_file.read(count * offsets.itemsize))
+        except (OSError, struct.error, ValueError):
+            return False
+        if len(offsets) != count:
+            return False
+        self.header_end = header_end
+        self.offsets = offsets
+        return True
+
+    def _save_index(self):
+        """Persist the index next to the file."""
+        try:
+            with open(self.index_path, "wb") as index_file:
+                header = _INDEX_HEADER.pack(_INDEX_MAGIC, *self._fingerprint, self.header_end, len(self.offsets))
+                index_file.write(header)
+                index_file.write(self.offsets.tobytes())
+        except OSError as e:
+            print(f"Unable to write ADIF index {self.index_path}: {e}")
+
+    def _decode(self, start, end, record_type="record"):
+        """Decode the bytes between two offsets into a CompactADIFRecord."""
+        for record in _build_records(_decode_tokens(self._map[start:end], wanted=self.wanted, lengths=True)):
+            record.type = record_type
+            return record
+        return CompactADIFRecord(record_type)
+
+    @property
+    def header(self):
+        """Get the header record, or None if the file has no <eoh>."""
+        return self._decode(0, self.header_end, "header") if self.header_end else None
+
+    def __len__(self):
+        """Get the number of records (not counting the header)."""
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """Get a record by number, or a list of records for a slice."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return self._decode(self.offsets[index], self.offsets[index + 1])
+
+    def __iter__(self):
+        """Decode every record in order."""
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ADIFTable:
+    """A parsed ADIF log stored as per-field columns for vectorized filtering. Requires NumPy.
+
+    Every field is dictionary-encoded: codes[name] is an int32 array indexing categories[name], with -1 where a
+    record lacks the field. Fields in NUMERIC_FIELDS are also decoded into NumPy arrays (see numeric()), with NaN
+    for missing floats and -1 for missing integers. Each record's field order, spelling and types are kept as a
+    dictionary-encoded layout, so converting back to an ADIFFile reproduces the original records.
+    """
+    NUMERIC_FIELDS = {
+        "DXCC": int, "MY_DXCC": int, "FREQ": float, "FREQ_RX": float, "QSO_DATE": int, "TIME_ON": int,
+        "QSO_DATE_OFF": int, "TIME_OFF": int, "CQZ": int, "ITUZ": int, "MY_CQ_ZONE": int, "MY_ITU_ZONE": int,
+    }
+
+    def __init__(self):
+        """Initialize an empty ADIFTable object."""
+        if np is None:
+            raise ImportError("ADIFTable requires NumPy")
+        self.header = None
+        self.codes = {}
+        self.categories = {}
+        self.layouts = []
+        self.layout_codes = np.zeros(0, dtype=np.int32)
+        self._numeric = {}
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a table from an iterable of records. A header record is kept aside as the header attribute."""
+        table = cls()
+        rows = {}      # field key -> array('i') of row numbers having the field
+        values = {}    # field key -> array('i') of category codes for those rows
+        lookups = {}   # field key -> {value: code}
+        layout_lookup = {}
+        layout_codes = array('i')
+        n = 0
+        for r in records:
+            if r.type == "header":
+                table.header = r
+                continue
+            if not hasattr(r, "fields"):
+                compact = CompactADIFRecord(r.type)
+                for row in r.rows:
+                    compact += row
+                r = compact
+            fields = r.fields
+            # a field's kept length specifier (see CompactADIFRecord) goes with the layout: it is rare
+            layout = tuple((key, field[0]) + field[2:] for key, field in fields.items())
+            code = layout_lookup.get(layout)
+            if code is None:
+                code = layout_lookup[layout] = len(table.layouts)
+                table.layouts.append(layout)
+            layout_codes.append(code)
+            for key, field in fields.items():
+                data = field[1]
+                lookup = lookups.get(key)
+                if lookup is None:
+                    lookup = lookups[key] = {}
+                    rows[key] = array('i')
+                    values[key] = array('i')
+                value_code = lookup.get(data)
+                if value_code is None:
+                    value_code = lookup[data] = len(lookup)
+                rows[key].append(n)
+                values[key].append(value_code)
+            n += 1
+        table.layout_codes = np.frombuffer(layout_codes, dtype=np.int32).copy() if n else np.zeros(0, np.int32)
+        for key, lookup in lookups.items():
+            codes = np.full(n, -1, dtype=np.int32)
+            codes[np.frombuffer(rows[key], dtype=np.int32)] = np.frombuffer(values[key], dtype=np.int32)
+            table.codes[key] = codes
+            table.categories[key] = list(lookup)
+        return table
+
+    @classmethod
+    def from_file(cls, file_path):
+        """Build a table by streaming an ADIF file."""
+        return cls.from_records(ADIFFile.iter_records(file_path))
+
+    @classmethod
+    def from_adif_file(cls, adif_file):
+        """Build a table from a parsed ADIFFile."""
+        return cls.from_records(adif_file.records)
+
+    def __len__(self):
+        """Get the number of records (not counting the header)."""
+        return len(self.layout_codes)
+
+    def field_names(self):
+        """Get the upper-cased names of all fields present in the log."""
+        return [key for key in self.codes if isinstance(key, str)]
+
+    def _codes(self, field_name):
+        """Get the code array of a field, or all -1 if no record has it."""
+        codes = self.codes.get(field_name.upper())
+        return np.full(len(self), -1, dtype=np.int32) if codes is None else codes
+
+    def _map_categories(self, field_name, func, missing, dtype):
+        """Apply func to each distinct value of a field and broadcast the results to every record."""
+        key = field_name.upper()
+        categories = self.categories.get(key, [])
+        table = np.array([func(c) for c in categories] + [missing], dtype=dtype)
+        return table[self._codes(key)]  # code -1 picks the trailing missing entry
+
+    def column(self, field_name):
+        """Get a field as an object array of strings, with None where it is missing."""
+        return self._map_categories(field_name, lambda c: c, None, object)
+
+    def numeric(self, field_name):
+        """Get a NUMERIC_FIELDS field as a float (NaN if missing) or int64 (-1 if missing) array."""
+        key = field_name.upper()
+        result = self._numeric.get(key)
+        if result is None:
+            kind = self.NUMERIC_FIELDS.get(key, float)
+            if kind is float:
+                result = self._map_categories(key, lambda c: _to_number(c, float, np.nan), np.nan, np.float64)
+            else:
+                if key.startswith("TIME"):
+                    convert = lambda c: _to_number(c.ljust(6, "0"), int, -1)  # HHMM means HHMM00
+                else:
+                    convert = lambda c: _to_number(c, int, -1)
+                result = self._map_categories(key, convert, -1, np.int64)
+            self._numeric[key] = result
+        return result
+
+    def eq(self, field_name, value):
+        """Get a mask of records whose field equals value."""
+        key = field_name.upper()
+        try:
+            code = self.categories.get(key, []).index(value)
+        except ValueError:
+            return np.zeros(len(self), dtype=bool)
+        return self._codes(key) == code
+
+    def isin(self, field_name, values):
+        """Get a mask of records whose field is one of values."""
+        values = set(values)
+        return self._map_categories(field_name, lambda c: c in values, False, bool)
+
+    def contains(self, field_name, substring):
+        """Get a mask of records whose field contains substring."""
+        return self._map_categories(field_name, lambda c: substring in c, False, bool)
+
+    def matches(self, field_name, pattern):
+        """Get a mask of records whose field matches a regular expression (re.search)."""
+        regex = re.compile(pattern)
+        return self._map_categories(field_name, lambda c: regex.search(c) is not None, False, bool)
+
+    def records(self, mask=None):
+        """Yield the (selected) records as CompactADIFRecords."""
+        indices = range(len(self)) if mask is None else np.flatnonzero(mask)
+        codes = {key: c.tolist() for key, c in self.codes.items()}
+        layout_codes = self.layout_codes.tolist()
+        categories = self.categories
+        layouts = self.layouts
+        for i in indices:
+            record = CompactADIFRecord()
+            record.fields = {entry[0]: (entry[1], categories[entry[0]][codes[entry[0]][i]]) + entry[2:]
+                             for entry in layouts[layout_codes[i]]}
+            yield record
+
+    def to_adif_file(self, mask=None):
+        """Convert the (selected) records back to an ADIFFile, header first."""
+        adif_file = ADIFFile()
+        if self.header is not None:
+            adif_file.records.append(self.header)
+        adif_file.records.extend(self.records(mask))
+        return adif_file
+
+
+def _to_number(text, kind, missing):
+    """Convert text to int or float, returning missing if it is not a number."""
+    try:
+        return kind(text)
+    except ValueError:
+        return missing
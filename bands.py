@@ -0,0 +1,104 @@
+"""Amateur band plans for classifying frequencies into bands.
+
+The band edges live in the BAND_PLAN table below, one row per band and set of IARU regions. A BandPlan for a
+region keeps the rows sorted by their lower edge, so a single frequency is classified with a bisect, and a whole
+NumPy array of spot frequencies with one searchsorted call.
+
+Frequencies are in MHz. Besides the band names, a lookup can return "GHZ" (above the highest band in the plan),
+"0m" (below 0.1 MHz, which is a bad report) or "UNK" (between bands).
+"""
+
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for BandPlan.bands
+    np = None
+
+DEFAULT_REGION = 2  # the Americas
+
+# name, lower edge, upper edge (MHz), IARU regions, counts as HF for --hf
+BAND_PLAN = [
+    ("2200m", 0.1357, 0.1378, (1, 2, 3), False),
+    ("630m", 0.472, 0.479, (1, 2, 3), False),
+    ("160m", 1.81, 2.0, (1,), False),
+    ("160m", 1.8, 2.0, (2, 3), False),
+    ("80m", 3.5, 3.8, (1,), True),
+    ("80m", 3.5, 4.0, (2,), True),
+    ("80m", 3.5, 3.9, (3,), True),
+    ("60m", 5.3515, 5.3665, (1, 3), False),
+    ("60m", 5.3, 5.5, (2,), False),
+    ("40m", 7.0, 7.2, (1, 3), True),
+    ("40m", 7.0, 7.3, (2,), True),
+    ("30m", 10.1, 10.15, (1, 2, 3), True),
+    ("20m", 14.0, 14.35, (1, 2, 3), True),
+    ("17m", 18.068, 18.168, (1, 2, 3), True),
+    ("15m", 21.0, 21.45, (1, 2, 3), True),
+    ("12m", 24.89, 24.99, (1, 2, 3), True),
+    ("10m", 28.0, 29.7, (1, 2, 3), True),
+    ("6m", 50.0, 52.0, (1,), True),
+    ("6m", 50.0, 54.0, (2, 3), True),
+    ("4m", 70.0, 70.5, (1,), False),
+    ("2m", 144.0, 146.0, (1,), False),
+    ("2m", 144.0, 148.0, (2, 3), False),
+    ("1.25m", 219.0, 225.0, (2,), False),
+    ("70cm", 430.0, 440.0, (1, 3), False),
+    ("70cm", 420.0, 450.0, (2,), False),
+    ("33cm", 902.0, 928.0, (2,), False),
+    ("23cm", 1240.0, 1300.0, (1, 2, 3), False),
+    ("13cm", 2300.0, 2450.0, (1, 2, 3), False),
+]
+
+# Every band name a lookup can return in any region, highest frequency first, then the catch-all names
+ALL_BANDS = [name for name, *_ in sorted({row[0]: row for row in BAND_PLAN}.values(), key=lambda row: -row[1])]
+ALL_BANDS += ["GHZ", "UNK", "0m"]
+HF_BANDS = [name for name in reversed(ALL_BANDS) if any(row[0] == name and row[4] for row in BAND_PLAN)]
+
+
+class BandPlan:
+    """The bands of one IARU region, sorted for bisect/searchsorted lookups."""
+
+    _plans = {}
+
+    def __init__(self, region=DEFAULT_REGION):
+        rows = sorted((row for row in BAND_PLAN if region in row[3]), key=lambda row: row[1])
+        if not rows:
+            raise ValueError(f"No band plan for IARU region {region}")
+        self.region = region
+        self.names = [row[0] for row in rows]
+        self.lows = [row[1] for row in rows]
+        self.highs = [row[2] for row in rows]
+        self.hf_bands = [row[0] for row in rows if row[4]]
+
+    @classmethod
+    def for_region(cls, region=DEFAULT_REGION):
+        """Return the (shared) BandPlan of an IARU region."""
+        if region not in cls._plans:
+            cls._plans[region] = cls(region)
+        return cls._plans[region]
+
+    def band(self, freq):
+        """Return the band name for a frequency in MHz."""
+        i = bisect_right(self.lows, freq) - 1
+        if i >= 0 and freq <= self.highs[i]:
+            return self.names[i]
+        if freq > self.highs[-1]:
+            return "GHZ"
+        if freq < 0.1:  # an error
+            return "0m"
+        return "UNK"
+
+    def bands(self, freqs):
+        """Return a NumPy array of band names for an array of frequencies in MHz, classified in one pass."""
+        if np is None:
+            raise ImportError("BandPlan.bands requires NumPy")
+        freqs = np.asarray(freqs, dtype=np.float64)
+        lows = np.array(self.lows)
+        highs = np.array(self.highs)
+        names = np.array(self.names + ["UNK", "GHZ", "0m"], dtype=object)
+        i = np.searchsorted(lows, freqs, side="right") - 1
+        in_band = (i >= 0) & (freqs <= highs[np.maximum(i, 0)])
+        codes = np.where(in_band, i, len(self.names))
+        codes[freqs > self.highs[-1]] = len(self.names) + 1
+        codes[freqs < 0.1] = len(self.names) + 2
+        return names[codes]
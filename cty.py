@@ -0,0 +1,128 @@
+"""Callsign -> DXCC entity resolution from a cty.dat prefix table (https://www.country-files.com/).
+
+cty.dat lists each entity as a header line of colon-separated fields followed by its prefixes, ending in ';':
+
+    Fed. Rep. of Germany:     14:  28:  EU:   51.00:   -10.00:    -1.0:  DL:
+        DA,DB,DC,DD,DE,DF,DG,DH,DI,DJ,DK,DL,DM,DN,DO,DP,DQ,DR,=DL0IU(15)[27];
+
+Prefixes go into a character trie, so a callsign resolves to the entity of its longest matching prefix in one walk
+over its characters; "=CALL" entries override the trie for that exact callsign. Zone and position overrides in
+(), [], <>, {} and ~~ are ignored, as are the WAE-only entities marked with '*' (their callsigns fall back to the
+DXCC entity whose prefix they share).
+"""
+
+import re
+
+MEMO_SIZE = 100000  # resolved callsigns kept; the memo starts over when it fills up
+NO_ENTITY_SUFFIXES = frozenset(["MM", "AM"])  # maritime and aeronautical mobile count for no entity
+OPERATING_SUFFIXES = frozenset(["P", "M", "A", "QRP", "QRPP", "LH", "LGT", "J", "R", "T"])
+OVERRIDES = re.compile(r"\(.*?\)|\[.*?\]|<.*?>|\{.*?\}|~.*?~")
+
+
+class CtyEntity:
+    """A cty.dat entity: its name, primary prefix, zones, continent and position (degrees, east positive)."""
+
+    __slots__ = ("name", "prefix", "cq_zone", "itu_zone", "continent", "latitude", "longitude")
+
+    def __init__(self, name, prefix, cq_zone, itu_zone, continent, latitude, longitude):
+        self.name = name
+        self.prefix = prefix
+        self.cq_zone = cq_zone
+        self.itu_zone = itu_zone
+        self.continent = continent
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __repr__(self):
+        return f"CtyEntity({self.name!r}, {self.prefix!r})"
+
+
+def parse_cty(file_path):
+    """Parse a cty.dat file into (prefix -> CtyEntity, exact callsign -> CtyEntity) dicts.
+
+    Raises OSError if the file cannot be read and ValueError if an entity is malformed.
+    """
+    prefixes = {}
+    exact = {}
+    with open(file_path, "r", encoding="latin-1") as f:
+        text = f.read()
+    for record in text.split(";"):
+        if not record.strip():
+            continue
+        fields = record.split(":")
+        if len(fields) != 9:
+            raise ValueError(f"{file_path}: expected 8 ':'-terminated fields before the prefixes of "
+                             f"{record.strip()[:40]!r}")
+        name, cq_zone, itu_zone, continent, latitude, longitude, _, primary, aliases = (x.strip() for x in fields)
+        if primary.startswith("*"):
+            continue
+        try:
+            # cty.dat longitudes are positive to the west
+            entity = CtyEntity(name, primary, int(cq_zone), int(itu_zone), continent, float(latitude),
+                               -float(longitude))
+        except ValueError:
+            raise ValueError(f"{file_path}: malformed zone or position fields for {name!r}")
+        for alias in aliases.split(","):
+            alias = OVERRIDES.sub("", alias).strip().upper()
+            if alias.startswith("="):
+                exact[alias[1:]] = entity
+            elif alias:
+                prefixes[alias] = entity
+    return prefixes, exact
+
+
+class CallsignResolver:
+    """Longest-prefix callsign -> CtyEntity lookups over a character trie, memoized per callsign."""
+
+    def __init__(self, prefixes, exact=None):
+        """Build the trie from a prefix -> entity dict; exact maps whole callsigns to entities ahead of the trie."""
+        self.trie = {}  # char -> child node; a node's None key holds the entity of the prefix ending there
+        for prefix, entity in prefixes.items():
+            node = self.trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[None] = entity
+        self.exact = exact or {}
+        self._memo = {}
+
+    @classmethod
+    def load(cls, file_path="cty.dat"):
+        """Build a resolver from a cty.dat file (see parse_cty for the errors raised)."""
+        return cls(*parse_cty(file_path))
+
+    def resolve(self, callsign):
+        """Return the CtyEntity of a callsign, or None if no prefix matches or it is maritime/aeronautical mobile.
+
+        A portable designator in front or behind ("EA8/DL1ABC", "DL1ABC/EA8") decides the entity, and operating
+        suffixes such as /P, /M, /QRP and bare call area digits are ignored.
+        """
+        memo = self._memo
+        if callsign in memo:
+            return memo[callsign]
+        if len(memo) >= MEMO_SIZE:
+            memo.clear()
+        entity = memo[callsign] = self._resolve(callsign.strip().upper())
+        return entity
+
+    def _resolve(self, callsign):
+        if callsign in self.exact:
+            return self.exact[callsign]
+        if "/" in callsign:
+            parts = [part for part in callsign.split("/") if part]
+            if any(part in NO_ENTITY_SUFFIXES for part in parts[1:]):
+                return None
+            parts = [part for part in parts if part not in OPERATING_SUFFIXES and not part.isdigit()] or parts
+            if len(parts) > 1:
+                # the designator is the shorter part (EA8/DL1ABC); a tie goes to the first, as written
+                parts = [min(parts[:2], key=len)]
+            callsign = parts[0]
+            if callsign in self.exact:
+                return self.exact[callsign]
+        node = self.trie
+        entity = None
+        for char in callsign:
+            node = node.get(char)
+            if node is None:
+                break
+            entity = node.get(None, entity)
+        return entity
@@ -26,35 +26,34 @@ most_wanted.txt file to set a rank for these.
 """
 
 import argparse
+import gc
 import json
+import os
 import sys
+import threading
+import time
 import urllib.request
-from typing import Dict, Any
-
-from adif import ADIFFile
-
-# TODO make band list more exhaustive
-ALL_BANDS = [
-    "13cm", "23cm", "70cm", "2m", "6m", "10m", "12m", "15m", "17m", "20m",
-    "30m", "40m", "60m", "80m", "160m", "630m", "2200m", "GHZ",
-    "UNK", "0m",
-]
-
-# TODO be more pedantic about definition of HF bands
-HF_BANDS = [
-    "80m", "40m", "30m", "20m", "17m", "15m", "12m", "10m", "6m"
-]
-MAX_DXCC_NUM = 600
-IGNORED_CALLSIGNS = ["D1FF"] # Certain callsigns are annoying and not DX
-
-def dxcc_name_strip(dxcc_input):
-    """Strip and normalize DXCC entity names for consistent comparison."""
-    return (dxcc_input.strip().upper()
-            .replace(".", "")
-            .replace(" ISLANDS", "")
-            .replace(" ISLAND", "")
-            .replace(" IS", ""))
 
+import numpy as np
+
+from adif import ADIFFile, ADIFMappedFile, ADIFTail, open_compressed
+from bands import ALL_BANDS, HF_BANDS, DEFAULT_REGION, BandPlan
+from cty import CallsignResolver
+from hub import HubServer, SpotHub
+from maidenhead import GridMatcher, bearing, distance_km, home_latlon, parse_sector, sector_mask, to_latlon
+from needs import MAX_DXCC_NUM, NeedsMatrix, mode_group
+from pskreporter import (DEFAULT_CACHE_DIR, MIN_POLL_INTERVAL, PSKR_QUERY_URL, RATE_LIMITER, ReportReader,
+                         ResponseCache, current_seconds, fetch_many, fetch_to_file, query_url, sequence_number)
+from refdata import ReferenceData, dxcc_name_strip
+from spots import SpotAggregator, SpotTable, SpotWindow
+from stats import RunStats
+
+LOG_FIELDS = ["DXCC", "MY_DXCC", "BAND", "MODE", "APP_LoTW_MODEGROUP", "QSL_RCVD"]  # the only log fields load_logs reads
+IGNORED_CALLSIGNS = ["D1FF"] # Certain callsigns are annoying and not DX
+band_plan = BandPlan.for_region(DEFAULT_REGION)  # replaced by the --iaru_region plan at startup
+home = None  # (latitude, longitude) of --my_grid, set at startup
+resolver = None  # callsign -> entity lookups from --cty, set at startup when a cty.dat is available
+run_stats = RunStats("dx.py")  # stage timings and counters for --profile and --stats_json
 
 def get_pskr_url(callsign, timerange=900):
     """Generate a PSKReporter URL for viewing spots for a given callsign within the last timerange seconds."""
@@ -65,74 +64,51 @@ def get_pskr_url(callsign, timerange=900):
     )
 
 
-def fetch_reports(tmp_file_path, app_contact, seconds=60*5, grid="FN"):
-    """Query PSKReporter for reports in the last N seconds for a given grid and write to a filepath."""
-    print("Fetching reports...")
-    email = app_contact
-    url = (
-        'https://pskreporter.info/cgi-bin/pskquery5.pl?'
-        'encap=1&callback=doNothing&statistics=1&noactive=true&'
-        f'rronly=true&nolocator=1&flowStartSeconds=-{seconds}&'
-        f'modify=grid&receiverCallsign={grid}&'
-        'appcontact={email}'
-    )
-
-    user_agent = (
-        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
-        '(KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
-    )
+def fetch_reports(tmp_file_path, app_contact, seconds=60*5, grid="FN", lastseqno=None, base_url=PSKR_QUERY_URL):
+    """Query PSKReporter for reports in the last N seconds for a given grid and stream them to a filepath.
 
-    request = urllib.request.Request(
-        url,
-        data=None,
-        headers={'User-Agent': user_agent}
-    )
+    With lastseqno, only reports newer than the response that carried that sequence number are requested.
+    """
+    print("Fetching reports...")
+    url = query_url(app_contact, grid, seconds, lastseqno, base_url)
 
     try:
-        r = urllib.request.urlopen(request, timeout=120)
-
-        try:
-            with open(tmp_file_path, "w") as f:
-                f.write(r.read().decode('utf-8'))
-            print("   [Done]")
-        except IOError as e:
-            print(f"Error writing to temporary file {tmp_file_path}: {e}")
-            raise
-        except UnicodeDecodeError as e:
-            print(f"Error decoding response from PSKReporter: {e}")
-            raise
-
-    except urllib.error.URLError as e:
-        print(f"Error connecting to PSKReporter: {e}")
-        raise
+        received = fetch_to_file(url, tmp_file_path)
+        print(f"   [Done] {received} bytes")
+        run_stats.count("fetch_queries")
+        run_stats.count("fetch_bytes", received)
     except urllib.error.HTTPError as e:
         print(f"HTTP error from PSKReporter (code {e.code}): {e.reason}")
         raise
+    except urllib.error.URLError as e:
+        print(f"Error connecting to PSKReporter: {e}")
+        raise
     except TimeoutError:
         print("Timeout while connecting to PSKReporter")
         raise
+    except IOError as e:
+        print(f"Error writing to temporary file {tmp_file_path}: {e}")
+        raise
     except Exception as e:
         print(f"Unexpected error fetching reports: {e}")
         raise
 
 def load_reports(tmp_file_path):
-    """Load PSKReporter spots from file and return dict."""
+    """Load PSKReporter spots from file and return dict.
+
+    The response is read incrementally (see ReportReader), so only the decoded reports are held in memory.
+    """
     try:
-        with open(tmp_file_path, "r", encoding="UTF-8") as f:
-            try:
-                # trim the non-json part of the response
-                json_string = f.read()[46:-12]
-                reports = json.loads(json_string)
-                return reports
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from PSKReporter response: {e}")
-                raise
-            except IndexError as e:
-                print(f"Error trimming PSKReporter response - response format may have changed: {e}")
-                raise
-            except Exception as e:
-                print(f"Unexpected error processing PSKReporter response: {e}")
-                raise
+        reader = ReportReader(tmp_file_path)
+        reports = {"receptionReport": list(reader)}
+        reports.update(reader.meta)
+        return reports
+    except UnicodeDecodeError as e:
+        print(f"Error decoding response from PSKReporter: {e}")
+        raise
+    except ValueError as e:
+        print(f"Error decoding JSON from PSKReporter response - response format may have changed: {e}")
+        raise
     except IOError as e:
         print(f"Error reading temporary file {tmp_file_path}: {e}")
         raise
@@ -140,273 +116,572 @@ def load_reports(tmp_file_path):
         print(f"Unexpected error loading reports: {e}")
         raise
 
-def load_logs(paths) -> Dict[int, Dict[str, Dict[str, Any]]]:
-    """Load log files and return a dictionary of DXCC statuses."""
-    dxcc2status: Dict[int, Dict[str, Dict[str, Any]]] = {}
-    for i in range(1, MAX_DXCC_NUM):
-        dxcc2status[i] = {}
-        for band in ALL_BANDS:
-            dxcc2status[i][band] = {
-                "LOTW": 0,
-                "IN LOG": 0,
-                "lotw-example": None
-            }
 
-    for p in paths:
-        try:
-            with open(p, "r", encoding='utf-8', errors='ignore') as file_in:
-                try:
-                    log = ADIFFile()
-                    log.parse(file_in, verbose=False)
-                except Exception as e:
-                    print(f"Error parsing ADIF file {p}: {e}")
-                    continue
+def grid_file_path(tmp_file_path, grid, grids):
+    """Return the file a grid's reports are fetched to.
+
+    With a single grid that is the -t path itself; otherwise the grid goes before the -t path's last extension
+    (.temp.CM, spots.CM.json, spots.json.CM.gz).
+    """
+    if len(grids) == 1:
+        return tmp_file_path
+    root, ext = os.path.splitext(tmp_file_path)
+    return f"{root}.{grid or 'all'}{ext}"
+
+
+def fetch_grid_reports(tmp_file_path, app_contact, grids, seconds=60*5, lastseqnos=None, base_url=PSKR_QUERY_URL,
+                       limiter=RATE_LIMITER, cache=None):
+    """Query PSKReporter for several receiver grids concurrently, each streamed to its own file (see grid_file_path).
+
+    The queries share limiter (a TokenBucket, or None for no limit), which spaces them out to PSKReporter's one query
+    every MIN_POLL_INTERVAL seconds. lastseqnos maps grids to the lastseqno to send. With a ResponseCache, grids with a
+    fresh cached response are not queried and the responses are read from the cache rather than tmp_file_path.
+    Per-grid timings are printed and a dict of grid -> file path is returned for the grids fetched successfully.
+    """
+    print(f"Fetching reports for {', '.join(grid or 'all' for grid in grids)}...")
+    lastseqnos = lastseqnos or {}
+    jobs = {
+        grid: (query_url(app_contact, grid, seconds, lastseqnos.get(grid), base_url),
+               None if cache else grid_file_path(tmp_file_path, grid, grids))
+        for grid in grids
+    }
+    started = time.perf_counter()
+    stats = fetch_many(jobs, limiter, cache=cache)
+    for grid, grid_stats in stats.items():
+        label = grid or "all"
+        if grid_stats["error"] is not None:
+            print(f"   [{label}] failed after {grid_stats['seconds']:.2f}s: {grid_stats['error']}")
+            run_stats.count("fetch_errors")
+        elif grid_stats["age"] is not None:
+            print(f"   [{label}] using the response cached {grid_stats['age']:.0f}s ago")
+            run_stats.count("cache_hits")
+        else:
+            print(f"   [{label}] {grid_stats['bytes']} bytes in {grid_stats['seconds']:.2f}s "
+                  f"(waited {grid_stats['wait']:.2f}s for the rate limit)")
+            run_stats.count("fetch_queries")
+            run_stats.count("fetch_bytes", grid_stats["bytes"])
+    print(f"   [Done] {len(grids)} grids in {time.perf_counter() - started:.2f}s")
+    return {grid: stats[grid]["path"] for grid in grids if stats[grid]["error"] is None}
+
+
+def cached_grid_reports(cache, grids, seconds=60*5, base_url=PSKR_QUERY_URL):
+    """Return a dict of grid -> cached response file for the grids with a cached response of any age, printing ages."""
+    paths = {}
+    for grid in grids:
+        path, age = cache.get(query_url("", grid, seconds, base_url=base_url))
+        if path is None:
+            print(f"   [{grid or 'all'}] no cached response")
+            continue
+        print(f"   [{grid or 'all'}] using the response cached {age:.0f}s ago")
+        run_stats.count("cache_hits")
+        paths[grid] = path
+    return paths
+
+
+def load_grid_reports(paths):
+    """Load the reports of several grids (a dict of grid -> file path) into one response dict.
+
+    A report already seen in an earlier grid (same sender, receiver, frequency, mode and time, as happens with
+    overlapping grids) is dropped. Top-level values other than the reports are taken from the first grid.
+    """
+    merged = {}
+    seen = set()
+    for grid, path in paths.items():
+        response = load_reports(path)
+        reports = response.pop("receptionReport")
+        unique = []
+        for r in reports:
+            key = SpotWindow.key(r)
+            if key not in seen:
+                seen.add(key)
+                unique.append(r)
+        print(f"   [{grid or 'all'}] {len(reports)} reports, {len(reports) - len(unique)} duplicates")
+        run_stats.count("reports_duplicate", len(reports) - len(unique))
+        if not merged:
+            merged = response
+            merged["receptionReport"] = []
+        merged["receptionReport"].extend(unique)
+    return merged or {"receptionReport": []}
+
+
+def save_reports(tmp_file_path, reports):
+    """Write a response dict (as returned by load_reports) to a file in the form load_reports reads."""
+    try:
+        with open_compressed(tmp_file_path, "wt", encoding="utf-8") as f:
+            json.dump(reports, f, separators=(",", ":"))
+    except IOError as e:
+        print(f"Error writing temporary file {tmp_file_path}: {e}")
+        raise
 
-            for r in log.records:
-                if r.type == "header":
-                    continue
 
-                dxcc_number = r.get("DXCC")
-                my_dxcc_number = r.get("MY_DXCC")
-                if dxcc_number:
-                    dxcc_number = int(dxcc_number)
-                if my_dxcc_number:
-                    my_dxcc_number = int(my_dxcc_number)
-                band = r.get("BAND").lower()
+def update_log_status(needs, records, path, first_record_number=0):
+    """Count the QSOs in records into the needs matrix and return how many records were read.
 
-                if my_dxcc_number is None:
-                    print("skipping over log for no MY_DXCC", r)
-                    continue
-                if dxcc_number is None or dxcc_number == 0:
-                    # print("skipping over log for no DXCC", r)
-                    continue
+    Confirmed slots remember (path, record number) as their example, with numbering starting at
+    first_record_number and skipping the header.
+    """
+    slots, confirmed, record_numbers = [], [], []
+    record_number = first_record_number - 1
+    for r in records:
+        if r.type == "header":
+            continue
+        record_number += 1
+
+        dxcc_number = r.get("DXCC")
+        my_dxcc_number = r.get("MY_DXCC")
+        if dxcc_number:
+            dxcc_number = int(dxcc_number)
+        if my_dxcc_number:
+            my_dxcc_number = int(my_dxcc_number)
+        band = r.get("BAND")
+
+        if my_dxcc_number is None:
+            print("skipping over log for no MY_DXCC", r)
+            continue
+        if dxcc_number is None or dxcc_number == 0:
+            # print("skipping over log for no DXCC", r)
+            continue
+        if dxcc_number >= MAX_DXCC_NUM:
+            print(f"skipping over log for DXCC number {dxcc_number} beyond {MAX_DXCC_NUM - 1}")
+            continue
 
-                if band is None:
-                    print(f"QSO in log without band: {r}")
-                if band not in ALL_BANDS:
-                    print(f"ERROR!!! UNKNOWN BAND: {band}")
-                    sys.exit(1)
-                if not int(my_dxcc_number) == args.my_dxcc_num:
-                    continue  # skip since I'm a US HAM in my DXCC account
-                status = r.get("QSL_RCVD")
-                if status == "Y":
-                    dxcc2status[dxcc_number][band]['LOTW'] += 1
-                    dxcc2status[dxcc_number][band]['lotw-example'] = r
-                else:
-                    # print(dxcc_number, my_dxcc_number, status)
-                    dxcc2status[dxcc_number][band]['IN LOG'] += 1  # TODO: ARG (count worked)
+        if band is None:
+            print(f"QSO in log without band: {r}")
+            continue
+        band = band.lower()
+        if band not in ALL_BANDS:
+            print(f"ERROR!!! UNKNOWN BAND: {band}")
+            sys.exit(1)
+        if not int(my_dxcc_number) == args.my_dxcc_num:
+            continue  # skip since I'm a US HAM in my DXCC account
+        slots.append((dxcc_number, band, mode_group(r.get("MODE"), r.get("APP_LoTW_MODEGROUP"))))
+        confirmed.append(r.get("QSL_RCVD") == "Y")
+        record_numbers.append(record_number)
+    needs.add_many(slots, confirmed, path, record_numbers)
+    return record_number + 1 - first_record_number
+
+
+def load_logs(paths, use_cache=True) -> NeedsMatrix:
+    """Load log files and return their merged needs matrix.
+
+    With use_cache, each log is read through its parsed-record cache (see ADIFFile.parse_cached), so unchanged
+    logs are not re-parsed on every run.
+    """
+    needs = NeedsMatrix()
+    for p in paths:
+        try:
+            if use_cache:
+                log = ADIFFile()
+                log.parse_cached(p, fields=LOG_FIELDS)
+                records = log.records
+            else:
+                records = ADIFFile.iter_records(p, fields=LOG_FIELDS)
+            log_needs = NeedsMatrix()
+            run_stats.count("log_records_parsed", update_log_status(log_needs, records, p))
+            needs.merge(log_needs)
         except IOError as e:
             print(f"Error opening log file {p}: {e}")
             continue
         except Exception as e:
             print(f"Unexpected error processing log file {p}: {e}")
             continue
-    # print("log summary", dxcc2status)
-    return dxcc2status
+    return needs
 
 
-def relevant_rx(grid, grids):
-    """Return relevant reports based on receiver grid string of comma-separated grids."""
-    if grids is None or grids == []:
-        return True
+def follow_logs(paths):
+    """Return an ADIFTail per log file for use with poll_logs."""
+    return [ADIFTail(p, fields=LOG_FIELDS) for p in paths]
 
-    grids = grids.split(",")
-    for g in grids:
-        if g in grid[0:4]:  # Note: future bug report... make regex against start to fix
-            return True
 
-    return False
+def poll_logs(needs, tails):
+    """Count QSOs appended to the followed logs since the last poll into the needs matrix, returning how many were read.
 
+    The first poll reads each log in full. If any log was truncated, rotated or rewritten, the matrix is rebuilt
+    from scratch from all of the logs.
+    """
+    pending = []
+    rebuild = False
+    for tail in tails:
+        resets = tail.resets
+        pending.append((tail, tail.iter_new()))
+        rebuild = rebuild or tail.resets != resets
+    if rebuild:
+        needs.clear()
+        for tail, records in pending:
+            records.close()
+            tail.rewind()
+        pending = [(tail, tail.iter_new()) for tail in tails]
 
-def get_rank(tx_dxcc_code, most_wanted):
-    """Get the rank of a DXCC entity based on its code."""
-    lookup = [i for i, x in enumerate(most_wanted) if x == tx_dxcc_code]
-    if not lookup:
-        return None
-    return lookup[0]
+    count = 0
+    for tail, records in pending:
+        count += update_log_status(needs, records, tail.file_path, tail.records_read)
+    run_stats.count("log_records_parsed", count)
+    return count
 
 
-def relevant_tx(dxcc, most_wanted):
-    """Determine if a DXCC entity is relevant based on its rank."""
-    rank = get_rank(dxcc, most_wanted)
-    # Return True if rank is None or less than max_rank
-    # Lower ranks are more desirable DX entities (rank 1 = most wanted)
-    # max_rank represents the worldwide rank threshold of the least interesting
-    # DX entity to report
-    if rank is None or rank < args.max_rank:
-        return True
+def get_rank(tx_dxcc_code, refdata):
+    """Get the rank of a DXCC entity based on its code."""
+    return refdata.get_rank(tx_dxcc_code)
 
-    return False
 
+def get_interesting_reports(reports, needs, bands=None, verbose=False, by_mode=False):
+    """Return a list of reports that are interesting based on the receiver grid, band, and DXCC status.
 
-def get_interesting_reports(reports, dxcc2status, bands=None, verbose=False):
-    """Return a list of reports that are interesting based on the receiver grid, band, and DXCC status."""
-    if not dxcc2status:
+    With a needs matrix, a report is interesting while its DXCC entity is unconfirmed on its band (or, with by_mode,
+    on its band in its mode group). Without one, entities ranked --max_rank or worse are dropped. The reports are
+    filtered as NumPy columns (see SpotTable); reports missing a field are returned separately as odd reports.
+    """
+    if needs is None:
         print("Did not receive log status input")
-    interesting_reports = []
-    odd_reports = []
-
-    for r in reports['receptionReport']:
-        if ("senderDXCCCode" not in r
-                or "senderDXCC" not in r
-                or "receiverLocator" not in r
-                or "senderLocator" not in r
-                or "frequency" not in r):
-
-            if "frequency" not in r:
-                continue  # skip the frequency-less reports
-
-            if verbose:
-                print("ODD SITUATION: ", r)
-            if not r["senderCallsign"] in IGNORED_CALLSIGNS:
-                odd_reports.append(r)
-            continue
-
-        rx_locator = r["receiverLocator"]
-        tx_dxcc_code = r["senderDXCCCode"]
-        tx_dxcc_name = dxcc_name_strip(r["senderDXCC"])
-        tx_callsign = r["senderCallsign"]
-        tx_locator = "UNK"
-        if "senderLocator" in r.keys():
-            tx_locator = r["senderLocator"]
+    spots = SpotTable(reports['receptionReport'], band_plan, refdata, resolver)
+
+    # frequency-less reports are skipped; other incomplete reports are odd
+    incomplete = ~spots.complete & spots.has_frequency
+    odd = incomplete & ~spots.callsign_mask(IGNORED_CALLSIGNS)
+
+    candidates = spots.complete
+    unknown = candidates & (spots.dxcc < 0)
+    out_of_range = candidates & (spots.dxcc >= MAX_DXCC_NUM) if needs is not None else np.zeros_like(unknown)
+    # reports of entities that neither dxcc.txt nor the callsign (with --cty) identify are skipped, not fatal
+    for name in dict.fromkeys(spots.dxcc_name[unknown].tolist()):
+        print("!!!")
+        print(f"UNKNOWN DXCC: `{name}` (its reports are skipped; add it to dxcc.txt)")
+        print("!!!")
+    for dxcc in dict.fromkeys(spots.dxcc[out_of_range].tolist()):
+        print(f"Encountered unknown tx_dxcc_number {dxcc} (its reports are skipped)")
+    candidates = candidates & ~unknown & ~out_of_range
+    run_stats.count("reports_seen", len(spots))
+    run_stats.count("reports_resolved_by_callsign", spots.resolved)
+    run_stats.count("reports_incomplete", int(np.count_nonzero(~spots.complete)))
+    run_stats.count("reports_unknown_dxcc", int(np.count_nonzero(unknown | out_of_range)))
+
+    non_us = np.zeros_like(candidates)
+    if needs is not None:
+        non_us = candidates & (spots.band_index == ALL_BANDS.index("UNK"))
+    candidates = candidates & ~non_us
+    unranked = candidates & (spots.rank < 0)
+    # report notes in report order
+    for i in np.flatnonzero(non_us | unranked | (incomplete if verbose else False)):
+        if incomplete[i]:
+            print("ODD SITUATION: ", spots.reports[i])
+        elif non_us[i]:
+            print("Received NON-US band report:")
+            print(spots.reports[i])
         else:
-            r["senderLocator"] = tx_locator
-
-        mode = r["mode"]
-        frequency = "UNKNOWN"
-        band = None
-        if "frequency" in r:
-            frequency = int(r["frequency"])/1000000
-            r["frequency"] = frequency
-            band = get_band(r["frequency"])
-            r["band"] = band
-        snr = r['sNR']
-
-        if tx_dxcc_name not in name2dxcc.keys():
-            print("!!!")
-            print(f"UNKNOWN DXCC: `{tx_dxcc_name}`")
-            print("!!!")
-            sys.exit(1)
-        tx_dxcc_number = name2dxcc[tx_dxcc_name]
-
-        rank = get_rank(tx_dxcc_code, most_wanted)
-        lotw_confirmed = None
-        if dxcc2status and band: # ignore null band reports
-            if tx_dxcc_number in dxcc2status.keys():
-                if band == "UNK":
-                    print("Received NON-US band report:")
-                    print(r)
-                    continue
-                if dxcc2status[tx_dxcc_number][band]['LOTW'] > 0:
-                    # LOTW QSL in log
-                    lotw_confirmed = True
-                else:
-                    lotw_confirmed = False
-            else:
-                print(f"Encountered unknown tx_dxcc_number {tx_dxcc_number}")
-                sys.exit(1)
-
-        if rank is None:
-            print(f"Using #200 priority for report from {tx_dxcc_code}")
-            rank = 200
-        r['rank'] = rank
-
-        if dxcc2status and lotw_confirmed:
-            continue
-        if dxcc2status is None:
-            if not relevant_tx(tx_dxcc_code, most_wanted):
-                continue
-
-        # filter out reports not near rx of interest / add info
-        if not relevant_rx(rx_locator, args.rx_grid):
-            continue
-
-        if bands and band and band not in bands:
-            continue
-
-        interesting_reports.append(r)
-
-    return (interesting_reports, odd_reports)
-
-
-def get_interesting_dx(interesting_reports):
-    """Extract and organize interesting DX opportunities from reports."""
+            print(f"Using #200 priority for report from {spots.dxcc_code[i]}")
+    ranks = np.where(unranked, 200, spots.rank)[candidates].tolist()
+    for i, rank in zip(np.flatnonzero(candidates).tolist(), ranks):
+        spots.reports[i]['rank'] = rank
+
+    interesting = interesting_mask(spots, candidates, needs, bands, by_mode, args.max_rank, args.rx_grid, home,
+                                   args.rx_radius, args.bearing)
+    run_stats.count("reports_outside_band_plan", int(np.count_nonzero(non_us)))
+    run_stats.count("reports_interesting", int(np.count_nonzero(interesting)))
+    return (spots.select(interesting), spots.select(odd))
+
+
+def interesting_mask(spots, candidates, needs, bands=None, by_mode=False, max_rank=None, rx_grid=None, home=None,
+                     rx_radius=None, sector=None, count=True):
+    """Mask of the candidate reports in a SpotTable that are unconfirmed in needs (or, without needs, ranked better
+    than max_rank), heard in rx_grid and on one of bands.
+
+    With a home (latitude, longitude), reports can also be limited to those heard within rx_radius km of home and
+    those sent from a (start, end) bearing sector as seen from home. With count, each criterion counts the reports it
+    removes as reports_filtered_<criterion>.
+    """
+    def drop(name, mask):
+        kept = interesting & mask
+        if count:
+            run_stats.count(f"reports_filtered_{name}",
+                            int(np.count_nonzero(interesting)) - int(np.count_nonzero(kept)))
+        return kept
+
+    interesting = candidates
+    if needs is not None:
+        interesting = drop("confirmed", ~spots.confirmed_mask(needs, by_mode))
+    else:
+        interesting = drop("rank", spots.rank_mask(max_rank))
+    # filter out reports not near rx of interest
+    interesting = drop("rx_grid", spots.rx_mask(rx_grid))
+    if bands:
+        interesting = drop("band", spots.band_mask(bands))
+    if home is not None and rx_radius is not None:
+        interesting = drop("rx_radius", spots.rx_radius_mask(home, rx_radius))
+    if home is not None and sector is not None:
+        interesting = drop("bearing", sector_mask(spots.tx_bearing(home), sector))
+    return interesting
+
+
+def get_interesting_dx(interesting_reports, max_receivers=20, home=None):
+    """Extract and organize interesting DX opportunities from reports.
+
+    Reports are folded into per-(callsign, band, mode) SpotAggregates, so each callsign's entry lists its distinct
+    modes, bands and 1 kHz frequency clusters (in first-seen order) and at most max_receivers receiver grids, however
+    many times it was heard. "aggregates" holds the statistics behind the entry. With a home (latitude, longitude),
+    entries also get the "distance" (km) and "bearing" (degrees) from home, or None for an unknown locator.
+    """
+    aggregator = SpotAggregator(max_receivers=max_receivers).add_all(interesting_reports)
     interesting_dx = {}
-    for r in interesting_reports:
-        rx_locator = r["receiverLocator"]
-        tx_dxcc_code = r["senderDXCCCode"]
-        tx_dxcc_name = r["senderDXCC"]
-        tx_callsign = r["senderCallsign"]
-        tx_locator = r["senderLocator"]
-        mode = r["mode"]
-        frequency = r["frequency"]
-        snr = r['sNR']
-        rank = r['rank']
-        band = r['band']
-        if tx_callsign not in interesting_dx.keys():
+    # a summary is a handful of small containers per callsign; cyclic GC passes over them are wasted work
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for tx_callsign, aggregates in aggregator.by_callsign().items():
+            r = aggregates[0].report
+            modes, bands, frequencies, receivers, spots = aggregator.summary(tx_callsign)
             interesting_dx[tx_callsign] = {
-                    "senderDXCCCode": tx_dxcc_code,
-                    "senderDXCC": tx_dxcc_name,
+                    "senderDXCCCode": r["senderDXCCCode"],
+                    "senderDXCC": r["senderDXCC"],
                     "senderCallsign": tx_callsign,
-                    "mode": [mode,],
-                    "frequency": [frequency,],
-                    "rank": rank,
-                    "receiverLocator": [rx_locator[0:4]],
-                    "senderLocator": tx_locator[0:4],
-                    "band": band
+                    "mode": modes,
+                    "frequency": frequencies,
+                    "rank": r["rank"],
+                    "receiverLocator": receivers,
+                    "senderLocator": r["senderLocator"][0:4],
+                    "band": r["band"],
+                    "bands": bands,
+                    "spots": spots,
+                    "aggregates": aggregates,
             }
-        else:
-            interesting_dx[tx_callsign]['receiverLocator'].append(rx_locator[0:4])
-            interesting_dx[tx_callsign]['mode'].append(mode)
-            interesting_dx[tx_callsign]['frequency'].append(frequency)
-
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    if home is not None:
+        entries = list(interesting_dx.values())
+        lat, lon = to_latlon([r["aggregates"][0].report["senderLocator"] for r in entries])
+        distances = distance_km(home[0], home[1], lat, lon).tolist()
+        bearings = bearing(home[0], home[1], lat, lon).tolist()
+        for r, distance, heading in zip(entries, distances, bearings):
+            known = distance == distance  # NaN for an unknown locator
+            r["distance"] = round(distance) if known else None
+            r["bearing"] = round(heading) if known else None
     return interesting_dx
 
 
+def sorted_dx(interesting_dx, by="frequency"):
+    """Return the DX entries in listing order: by frequency, or by distance (nearest first, unknown last)."""
+    if by == "distance":
+        return sorted(interesting_dx.values(), key=lambda r: (r.get("distance") is None, r.get("distance") or 0,
+                                                              r["frequency"], r["senderCallsign"]))
+    return sorted(interesting_dx.values(), key=lambda r: (r["frequency"], r["senderCallsign"]))
+
+
+def format_dx(r, verbose=False):
+    """Format one entry of get_interesting_dx as a report line, with spot and SNR statistics when verbose."""
+    mode_str = ",".join(r["mode"])
+    freq_str = ",".join(format(f, "6.3f") for f in r["frequency"])
+    band_str = ",".join(r["bands"])
+    rx_str = ",".join(r["receiverLocator"])
+    dxcc_number = refdata.name2dxcc[dxcc_name_strip(r["senderDXCC"])]
+    line = (
+        f'Relevant: {r["senderDXCCCode"].ljust(4)} '
+        f'{str(dxcc_number).ljust(3)} '
+        f'{r["senderDXCC"].ljust(20)[-20:]} {mode_str.ljust(5)} {freq_str} '
+        f'{band_str} #{str(r["rank"]).ljust(3)} {r["senderCallsign"].ljust(10)} '
+        f'{r["senderLocator"]} heard in {rx_str}'
+    )
+    if r.get("distance") is not None:
+        line += f' {r["distance"]} km at {r["bearing"]} deg'
+    if verbose:
+        stats = [
+            f'{a.report["band"]} {a.report["mode"]}: {a.count} spots, SNR best {a.best_snr} median {a.median_snr}'
+            for a in r["aggregates"]
+        ]
+        line += f' ({"; ".join(stats)})'
+    return line
+
+
+def dx_state(r):
+    """Return what a DX entry's listing depends on, ignoring the receivers: new bands, modes or frequencies change it."""
+    return frozenset(r["mode"]), frozenset(r["frequency"]), frozenset(r["bands"]), r["rank"]
+
+
+class Poller:
+    """What --watch and --hub keep between polls: the spot window, each grid's last sequence number and the logs.
+
+    Reference data, the needs matrix and the followed logs stay in memory between polls; QSOs appended to the logs
+    (tails, from follow_logs, whose records so far are counted in log_needs) are counted in before each poll and
+    other_needs (a NeedsMatrix or None) is merged on top. The first poll asks
+    for window_seconds of reports; later polls ask only for reports after each grid's previous sequence number (or,
+    without one, for the time since the previous poll). Reports are kept for window_seconds.
+    """
+
+    def __init__(self, tmp_file_path, app_contact, grids, tails, log_needs, other_needs, window_seconds, base_url,
+                 limiter=RATE_LIMITER, cache=None):
+        """Initialize a poller with an empty window."""
+        self.tmp_file_path = tmp_file_path
+        self.app_contact = app_contact
+        self.grids = grids
+        self.tails = tails
+        self.log_needs = log_needs
+        self.other_needs = other_needs
+        self.window = SpotWindow(window_seconds)
+        self.base_url = base_url
+        self.limiter = limiter
+        self.cache = cache
+        self.lastseqnos = {}  # grid -> lastSequenceNumber of its previous response
+        self.last_poll = None
+
+    def needs(self):
+        """Count newly logged QSOs and return the needs matrix (None without logs or saved matrices)."""
+        if not self.tails:
+            return self.other_needs
+        poll_logs(self.log_needs, self.tails)
+        needs = NeedsMatrix().merge(self.log_needs)  # rebuilt each poll: it is small, and the logs may have rotated
+        if self.other_needs is not None:
+            needs.merge(self.other_needs)
+        return needs
+
+    def poll(self):
+        """Fetch new reports into the window, evict old ones, and return (received, added, evicted) counts."""
+        started = time.time()
+        seconds = self.window.seconds
+        if self.last_poll is not None and any(self.lastseqnos.get(grid) is None for grid in self.grids):
+            seconds = min(self.window.seconds, int(started - self.last_poll) + 1)
+        received = added = 0
+        server_times = []
+        for grid, path in fetch_grid_reports(self.tmp_file_path, self.app_contact, self.grids, seconds,
+                                             self.lastseqnos, self.base_url, self.limiter, self.cache).items():
+            try:
+                reader = ReportReader(path)
+                added += self.window.add(reader, int(started))
+            except (IOError, ValueError) as e:
+                print(f"   [{grid or 'all'}] could not read the response: {e}")
+                continue
+            received += reader.count
+            if sequence_number(reader.meta) is not None:
+                self.lastseqnos[grid] = sequence_number(reader.meta)
+            if current_seconds(reader.meta) is not None:
+                server_times.append(current_seconds(reader.meta))
+        self.last_poll = started
+        # age reports by server time, or by the newest report when replaying recorded responses
+        now = max(server_times, default=None) or self.window.newest() or int(started)
+        run_stats.count("reports_received", received)
+        return received, added, self.window.evict(now)
+
+
+def watch(poller, bands, interval, by_mode=False, verbose=False, show_url=False, sort="frequency"):
+    """Poll PSKReporter every interval seconds and print DX that is new or changed since the previous poll.
+
+    DX drops out of the listing once its reports have aged out of the poller's window.
+    """
+    shown = {}  # callsign -> dx_state of its last printed line
+    while True:
+        started = time.time()
+        with run_stats.stage("poll_logs"):
+            needs = poller.needs()
+        with run_stats.stage("poll"):
+            received, added, evicted = poller.poll()
+
+        with run_stats.stage("get_interesting_reports"):
+            interesting_reports, _ = get_interesting_reports(
+                {"receptionReport": poller.window.reports()}, needs, bands=bands, verbose=verbose, by_mode=by_mode
+            )
+        with run_stats.stage("get_interesting_dx"):
+            interesting_dx = get_interesting_dx(interesting_reports, home=home)
+        print(
+            f'{time.strftime("%H:%M:%S")} {received} reports ({added} new, {evicted} expired), '
+            f'{len(poller.window)} in window, {len(interesting_dx)} interesting DX'
+        )
+        with run_stats.stage("render"):
+            for r in sorted_dx(interesting_dx, sort):
+                callsign = r["senderCallsign"]
+                state = dx_state(r)
+                if shown.get(callsign) == state:
+                    continue
+                print(("CHANGED " if callsign in shown else "NEW     ") + format_dx(r, verbose))
+                if show_url:
+                    print(f"{get_pskr_url(callsign)}")
+                shown[callsign] = state
+                run_stats.count("dx_printed")
+            for callsign in set(shown) - set(interesting_dx):
+                del shown[callsign]
+
+        time.sleep(max(0.0, interval - (time.time() - started)))
+
+
+def hub_snapshot(reports):
+    """Load a poll's reports into a SpotTable for --hub, with the masks the clients' filters start from.
+
+    Unlike get_interesting_reports, nothing is printed about reports from unknown DXCC entities, which are skipped.
+    """
+    spots = SpotTable(reports, band_plan, refdata, resolver)
+    candidates = spots.complete & (spots.dxcc >= 0) & (spots.dxcc < MAX_DXCC_NUM)
+    unranked = candidates & (spots.rank < 0)
+    ranks = np.where(unranked, 200, spots.rank)[candidates].tolist()
+    for i, rank in zip(np.flatnonzero(candidates).tolist(), ranks):
+        spots.reports[i]['rank'] = rank
+    return {
+        "spots": spots,
+        "candidates": candidates,
+        "in_band_plan": spots.band_index != ALL_BANDS.index("UNK"),
+        "time": int(time.time()),
+    }
+
+
+def render_hub(snapshot, query, needs):
+    """Render a hub snapshot for one client's query and needs matrix: its interesting DX, by frequency or distance.
+
+    Renders run on the hub's client threads, so they are timed as a thread stage and do not add to the
+    reports_filtered_* counters, which would otherwise grow with the number of distinct client filters.
+    """
+    with run_stats.stage("hub_render", thread=True):
+        spots = snapshot["spots"]
+        candidates = snapshot["candidates"]
+        if needs is not None:
+            candidates = candidates & snapshot["in_band_plan"]
+        client_home = home_latlon(query["my_grid"]) if query["my_grid"] else None
+        interesting = interesting_mask(spots, candidates, needs, query["bands"], query["by_mode"], query["max_rank"],
+                                       query["rx_grid"], client_home, query["rx_radius"], query["bearing"],
+                                       count=False)
+        interesting_dx = get_interesting_dx(spots.select(interesting), home=client_home)
+        dx = []
+        for r in sorted_dx(interesting_dx, query["sort"]):
+            entry = {k: v for k, v in r.items() if k != "aggregates"}
+            entry["dxcc"] = refdata.name2dxcc.get(dxcc_name_strip(r["senderDXCC"]))
+            entry["stats"] = [
+                {"band": a.report["band"], "mode": a.report["mode"], "spots": a.count, "best_snr": a.best_snr,
+                 "median_snr": a.median_snr}
+                for a in r["aggregates"]
+            ]
+            dx.append(entry)
+        return {"time": snapshot["time"], "reports": len(spots), "dx": dx}
+
+
+def run_hub(poller, server, interval):
+    """Poll PSKReporter every interval seconds and publish each poll to the clients of a HubServer."""
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    while True:
+        started = time.time()
+        with run_stats.stage("poll_logs"):
+            needs = poller.needs()
+        with run_stats.stage("poll"):
+            received, added, evicted = poller.poll()
+        with run_stats.stage("hub_snapshot"):
+            snapshot = hub_snapshot(poller.window.reports())
+        server.hub.publish(snapshot, None if needs is None else {"default": needs})
+        print(
+            f'{time.strftime("%H:%M:%S")} {received} reports ({added} new, {evicted} expired), '
+            f'{len(poller.window)} in window, {server.hub.clients} clients streaming'
+        )
+        time.sleep(max(0.0, interval - (time.time() - started)))
+
+
+def emit_stats(profile=False, stats_json=None):
+    """Print the run's stage timings and counters with --profile, and save them as JSON with --stats_json."""
+    if profile:
+        run_stats.print_report()
+    if stats_json:
+        try:
+            run_stats.save(stats_json)
+        except OSError as e:
+            print(f"Error writing stats to {stats_json}: {e}")
+
+
 def get_band(freq):
-    """Determine the amateur radioband for a given frequency."""
-    if freq > 2300:
-        return "GHZ"
-    if freq > 144 and freq < 148:
-        return "2m"
-    if freq > 219 and freq < 225:
-        return "1.25"
-    if freq > 420 and freq < 450:
-        return "70cm"
-    if freq > 902 and freq < 928:
-        return "33cm"
-    if freq > 1240 and freq < 1300:
-        return "23cm"
-    if freq > 50.0 and freq < 54.0:
-        return "6m"
-    if freq > 28.0 and freq < 29.7:
-        return "10m"
-    if freq > 24.890 and freq < 24.990:
-        return "12m"
-    if freq > 21.00 and freq < 21.45:
-        return "15m"
-    if freq > 17.068 and freq < 18.168:
-        return "17m"
-    if freq > 14.00 and freq < 14.35:
-        return "20m"
-    if freq > 10.1 and freq < 10.15:
-        return "30m"
-    if freq > 7.0 and freq < 7.3:
-        return "40m"
-    if freq > 5.3 and freq < 5.5:
-        return "60m"
-    if freq > 3.5 and freq < 4.0:
-        return "80m"
-    if freq > 1.8 and freq < 2.0:
-        return "160m"
-    if freq > 0.472 and freq < 479:
-        return "630m"
-    if freq > 0.135 and freq < 0.1378:
-        return "2200m"
-    if freq < 0.1:  # an error
-        return "0m"
-    else:
-        return "UNK"
+    """Determine the amateur radio band for a given frequency in MHz."""
+    return band_plan.band(freq)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -416,8 +691,85 @@ if __name__ == "__main__":
 
     parser.add_argument('-f', '--fetch', action="store_true", help="Fetch PSKReporter data from the server instead of using the cache.")
     parser.add_argument('--app_contact', default="not-provided", help="Email address to use for PSKReporter API")
-    parser.add_argument('--adi', help="Path to your LoTW ADIF file containing log to use for finding useful DX")
-    parser.add_argument('--rx_grid', default=None, help="2-character or 4-character grid to filter reports by")
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help="Keep running: poll PSKReporter every --interval seconds and print only DX that is new or has changed"
+    )
+    parser.add_argument(
+        '--hub',
+        type=int,
+        metavar='PORT',
+        help="Keep running like --watch, but serve each poll's DX over HTTP on this port (JSON at /spots, Server-Sent"
+             " Events at /events) to clients that pick their own bands and needs; see hub.py"
+    )
+    parser.add_argument('--hub_host', default="127.0.0.1", help="Address --hub listens on (0.0.0.0 for the network)")
+    parser.add_argument(
+        '--interval',
+        type=int,
+        default=MIN_POLL_INTERVAL,
+        help=f"Seconds between --watch and --hub polls (at least {MIN_POLL_INTERVAL} against pskreporter.info)"
+    )
+    parser.add_argument(
+        '--window',
+        type=int,
+        default=15*60,
+        help="Seconds of reports --watch and --hub keep and consider (default 900)"
+    )
+    parser.add_argument(
+        '--pskr_url',
+        default=PSKR_QUERY_URL,
+        help="pskquery5.pl URL to query, e.g. a local pskr-replay.py server for testing --watch"
+    )
+    parser.add_argument(
+        '--adi',
+        action='append',
+        help="Path to your LoTW ADIF file containing log to use for finding useful DX (repeat to merge several logs)"
+    )
+    parser.add_argument(
+        '--needs',
+        action='append',
+        help="Path to a needs matrix saved with --save_needs to merge in, e.g. for another callsign (repeatable)"
+    )
+    parser.add_argument('--save_needs', help="Save the merged needs matrix of the --adi logs to this path")
+    parser.add_argument(
+        '--by_mode',
+        action='store_true',
+        help="Treat DXCC entities as needed per band and mode group (CW, PHONE, DATA) rather than per band"
+    )
+    parser.add_argument(
+        '--no_log_cache',
+        action='store_true',
+        help="Always re-parse the --adi log instead of using the parsed-log cache stored next to it"
+    )
+    parser.add_argument(
+        '--rx_grid',
+        default=None,
+        help="Grid (2, 4 or 6 characters) whose receivers' reports to use; a comma-separated list (e.g. CM,DM,FN42) is"
+             " fetched in one query for their common prefix (or all receivers) and filtered locally"
+    )
+    parser.add_argument(
+        '--my_grid',
+        help="Your Maidenhead locator (e.g. FN42 or FN42ab); DX is listed with its distance and bearing from it"
+    )
+    parser.add_argument(
+        '--rx_radius',
+        type=float,
+        metavar='KM',
+        help="Only consider reports heard within this many km of --my_grid"
+    )
+    parser.add_argument(
+        '--bearing',
+        type=parse_sector,
+        metavar='START-END',
+        help="Only consider DX whose bearing from --my_grid is in this clockwise sector of degrees (e.g. 300-60)"
+    )
+    parser.add_argument(
+        '--sort',
+        choices=["frequency", "distance"],
+        default="frequency",
+        help="List DX by frequency (default) or by distance from --my_grid, nearest first"
+    )
     parser.add_argument('-u', '--url', action='store_true', help="Print PSK URLs for each report")
     parser.add_argument('--modes', default=[]) #TODO: Implement
     parser.add_argument(
@@ -435,6 +787,13 @@ if __name__ == "__main__":
         type=lambda x: [b for b in x.split(',') if b in ALL_BANDS],
         help="Comma-separated list of bands to filter reports by (must be one of the following: " + ", ".join(ALL_BANDS) + "). Overrides --hf if specified."
     )
+    parser.add_argument(
+        '--iaru_region',
+        type=int,
+        choices=[1, 2, 3],
+        default=DEFAULT_REGION,
+        help="IARU region whose band plan is used to classify spot frequencies into bands (default 2, the Americas)"
+    )
     parser.add_argument(
         '--dxcc_file',
         type=str,
@@ -442,9 +801,40 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         '-t', '--temp_filename',
-        required=True,
-        default=".pskr-tmp.xml",
-        help="Path to the temporary file containing PSKReporter data after fetch to avoid re-fetching (use --fetch to fetch)"
+        default=None,
+        help="Path to a file of PSKReporter data to read instead of the response cache; with --fetch, the fetched reports"
+             " are also saved there. A .gz, .xz, .bz2 or .zst extension stores it compressed"
+    )
+    parser.add_argument(
+        '--cache_dir',
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of cached PSKReporter responses, which can be shared between operators (default .pskr-cache)"
+    )
+    parser.add_argument(
+        '--cache_ttl',
+        type=int,
+        default=MIN_POLL_INTERVAL,
+        help=f"Seconds a cached response is used by --fetch instead of querying again (default {MIN_POLL_INTERVAL})"
+    )
+    parser.add_argument(
+        '--no_cache',
+        action='store_true',
+        help="Do not use the response cache: --fetch always queries PSKReporter and -t is required"
+    )
+    parser.add_argument(
+        '--cty',
+        help="cty.dat prefix table (from country-files.com) used to resolve the DXCC entity of reports whose entity is"
+             " missing or not in dxcc.txt from their callsign (default cty.dat, if present)"
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="Print the wall time, CPU time and peak memory of each stage of the run, and its counters"
+    )
+    parser.add_argument(
+        '--stats_json',
+        metavar='PATH',
+        help="Save the --profile stage timings and counters as JSON (appended as one line per run to a .jsonl file)"
     )
     parser.add_argument(
         '--my_dxcc_num',
@@ -459,68 +849,108 @@ if __name__ == "__main__":
         help="Maximum rank of DX entities to report if no --adi. 300 is the default."
     )
     args = parser.parse_args()
-
-    most_wanted = []
+    band_plan = BandPlan.for_region(args.iaru_region)
     try:
-        most_wanted_file = open("most_wanted.txt", "r", encoding="utf-8")
-    except IOError as e:
-        print(f"Error opening most_wanted.txt file: {e}")
+        if args.rx_grid:
+            GridMatcher(args.rx_grid)
+        if args.my_grid:
+            home = home_latlon(args.my_grid)
+    except ValueError as e:
+        print(f"Error: {e}")
         sys.exit(1)
-    except Exception as e:
-        print(f"Unexpected error opening most_wanted.txt: {e}")
+    if home is None and (args.rx_radius is not None or args.bearing is not None or args.sort == "distance"):
+        print("Error: --rx_radius, --bearing and --sort distance need --my_grid")
         sys.exit(1)
-    for line in most_wanted_file:
-        if line.startswith("#"):
-            continue
-        items = line.split(" ")
-        most_wanted.append(items[1])
 
-    dxcc2name = {}
-    name2dxcc = {}
-    try:
-        dxcc_file = open("dxcc.txt", "r", encoding="utf-8")
-    except IOError as e:
-        print(f"Error opening dxcc.txt file: {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Unexpected error opening dxcc.txt: {e}")
-        sys.exit(1)
-    for line in dxcc_file:
-        if line.startswith("#"):
-            continue
-        items = line.split(",")
-        dxcc_number = int(items[0])
-        dxcc_name = dxcc_name_strip(" ".join(items[1:]))
-        dxcc2name[dxcc_number] = dxcc_name
-        name2dxcc[dxcc_name] = dxcc_number
-    dxcc2status = None
-    if args.adi is not None:
-        dxcc2status = load_logs([args.adi,])
+    with run_stats.stage("reference_data"):
+        try:
+            refdata = ReferenceData.load("dxcc.txt", "most_wanted.txt", verbose=args.verbose)
+        except IOError as e:
+            print(f"Error opening reference data file: {e}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Unexpected error loading dxcc.txt / most_wanted.txt: {e}")
+            sys.exit(1)
+        name2dxcc = refdata.name2dxcc
+        cty_path = args.cty or ("cty.dat" if os.path.exists("cty.dat") else None)
+        if cty_path is not None:
+            try:
+                resolver = CallsignResolver.load(cty_path)
+            except (IOError, ValueError) as e:
+                print(f"Error loading {cty_path}: {e}")
+                sys.exit(1)
+    needs = None
+    other_needs = None
+    # --watch and --hub follow the logs from here on, so they are read once, as the first poll of their tails
+    log_tails = follow_logs(args.adi or []) if args.watch or args.hub is not None else None
+    log_needs = NeedsMatrix()
+    if args.adi or args.needs:
+        with run_stats.stage("load_logs"):
+            if log_tails is not None:
+                poll_logs(log_needs, log_tails)
+                needs = NeedsMatrix().merge(log_needs)
+            else:
+                needs = load_logs(args.adi or [], use_cache=not args.no_log_cache)
+            if args.needs:
+                other_needs = NeedsMatrix()
+                for path in args.needs:
+                    try:
+                        other_needs.merge(NeedsMatrix.load(path))
+                    except (IOError, ValueError) as e:
+                        print(f"Error loading needs matrix {path}: {e}")
+                        sys.exit(1)
+                needs.merge(other_needs)
+            if args.save_needs:
+                needs.save(args.save_needs)
 
     input_file = args.temp_filename
+    cache = None
+    if args.no_cache:
+        if input_file is None:
+            print("Error: -t/--temp_filename is required with --no_cache")
+            sys.exit(1)
+    else:
+        cache = ResponseCache(args.cache_dir, args.cache_ttl)
 
     if args.dxcc_file:
         try:
             dxcc_log = ADIFFile()
+            readers = {}  # examples are (path, record number), read back through an indexed mmap of each log
             with open(args.dxcc_file, "w", encoding="utf-8") as dxcc_out_file:
-                if dxcc2status is not None:
-                    for v, k in enumerate(dxcc2status):
-                        for v2, b in enumerate(dxcc2status[k]):
-                            example = dxcc2status[k][b]['lotw-example']
-                            if example:
-                                dxcc_log.records.append(example)
+                if needs is not None:
+                    # one example per DXCC entity and band: the latest confirmed QSO of any mode group
+                    examples = {}
+                    for dxcc, band, group, path, record_number in needs.examples():
+                        if (dxcc, band) not in examples or record_number > examples[(dxcc, band)][1]:
+                            examples[(dxcc, band)] = (path, record_number)
+                    streamed = {}  # path -> {record number: record} for logs that cannot be memory-mapped
+                    for path, record_number in examples.values():
+                        if path not in readers and path not in streamed:
+                            try:
+                                readers[path] = ADIFMappedFile(path, persist_index=True)
+                            except ValueError:
+                                # a compressed log: stream it once, keeping only its example records
+                                wanted = {n for p, n in examples.values() if p == path}
+                                records = (r for r in ADIFFile.iter_records(path) if r.type != "header")
+                                streamed[path] = {n: r for n, r in enumerate(records) if n in wanted}
+                        if path in readers:
+                            dxcc_log.records.append(readers[path][record_number])
+                        else:
+                            dxcc_log.records.append(streamed[path][record_number])
                 try:
                     dxcc_log.write(dxcc_out_file)
                     print(f"Wrote DXCC example QSLs to {args.dxcc_file}")
                 except Exception as e:
                     print(f"Error writing DXCC file: {e}")
+            for reader in readers.values():
+                reader.close()
         except IOError as e:
             print(f"Error opening DXCC output file {args.dxcc_file}: {e}")
         except Exception as e:
             print(f"Unexpected error processing DXCC file: {e}")
     odd_reports = []
 
-    if args.fetch:
+    if args.fetch or args.watch or args.hub is not None:
         # Validate app_contact is a valid email address
         import re
         email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -528,26 +958,6 @@ if __name__ == "__main__":
             print("Error: --app-contact must be a valid email address")
             sys.exit(1)
 
-        app_contact = args.app_contact.replace('@', '%40')
-        fetch_reports(input_file, app_contact, grid=args.rx_grid)
-
-    reports = load_reports(input_file)
-    for r in reports['receptionReport']:
-        lookup1 = None
-        lookup2 = None
-        if "senderDXCC" in r.keys():
-            tx_dxcc = dxcc_name_strip(r["senderDXCC"])
-            if tx_dxcc in name2dxcc.keys():
-                lookup1 = name2dxcc[tx_dxcc]
-            else:
-                print("UNKNOWN DXCC", dxcc_name_strip(r["senderDXCC"]))
-        if "receiverDXCC" in r.keys():
-            rx_dxcc = dxcc_name_strip(r["receiverDXCC"])
-            if rx_dxcc in name2dxcc.keys():
-                lookup2 = name2dxcc[rx_dxcc]
-            else:
-                print("UNKNOWN DXCC", rx_dxcc)
-
     # Determine which bands to filter on
     filter_bands = None
     if args.bands:
@@ -556,69 +966,142 @@ if __name__ == "__main__":
         filter_bands = HF_BANDS
     else:
         filter_bands = ALL_BANDS
-    print(f"Filtering reports for bands: {filter_bands}")
 
-    interesting_reports, odd_reports = get_interesting_reports(
-        reports,
-        dxcc2status,
-        bands=filter_bands,
-        verbose=args.verbose
-    )
+    # one query covers every --rx_grid: PSKReporter is asked for the grids' common prefix (or every receiver) and
+    # the reports are matched to the grids locally, so several grids cost no more of its rate limit than one
+    grids = [GridMatcher(args.rx_grid).common_prefix() if args.rx_grid else None]
+    if args.rx_grid and "," in args.rx_grid and (args.fetch or args.watch or args.hub is not None):
+        print(f"Querying PSKReporter for {grids[0] or 'all receivers'} and keeping the reports heard in {args.rx_grid}")
+    limiter = RATE_LIMITER if "pskreporter.info" in args.pskr_url else None
+
+    if args.watch or args.hub is not None:
+        interval = args.interval
+        if limiter is not None and interval < MIN_POLL_INTERVAL:
+            print(f"PSKReporter asks for at most one query every {MIN_POLL_INTERVAL} seconds; using that interval")
+            interval = MIN_POLL_INTERVAL
+        poller = Poller(input_file, args.app_contact, grids, log_tails, log_needs, other_needs, args.window,
+                        args.pskr_url, limiter=limiter, cache=cache)
+        try:
+            if args.hub is not None:
+                defaults = {
+                    "bands": args.bands or (HF_BANDS if args.hf else None),
+                    "needs": "default" if args.adi or args.needs else None,
+                    "by_mode": args.by_mode,
+                    "max_rank": args.max_rank,
+                    "rx_grid": args.rx_grid,
+                    "my_grid": args.my_grid,
+                    "rx_radius": args.rx_radius,
+                    "bearing": args.bearing,
+                    "sort": args.sort,
+                }
+                try:
+                    server = HubServer((args.hub_host, args.hub), SpotHub(render_hub, defaults), verbose=args.verbose)
+                except OSError as e:
+                    print(f"Error listening on {args.hub_host}:{args.hub}: {e}")
+                    sys.exit(1)
+                print(f"Serving DX at http://{args.hub_host}:{args.hub}/spots and /events, polling every {interval}"
+                      f" seconds over a {args.window} second window (Ctrl-C to stop)")
+                run_hub(poller, server, interval)
+            else:
+                print(f"Filtering reports for bands: {filter_bands}")
+                print(f"Watching every {interval} seconds over a {args.window} second window (Ctrl-C to stop)")
+                watch(poller, filter_bands, interval, by_mode=args.by_mode, verbose=args.verbose, show_url=args.url,
+                      sort=args.sort)
+        except KeyboardInterrupt:
+            pass
+        emit_stats(args.profile, args.stats_json)
+        sys.exit(0)
+
+    if args.fetch and cache is None and len(grids) == 1:
+        with run_stats.stage("fetch"):
+            fetch_reports(input_file, args.app_contact, grid=grids[0], base_url=args.pskr_url)
+        with run_stats.stage("load_reports"):
+            reports = load_reports(input_file)
+    elif args.fetch:
+        with run_stats.stage("fetch"):
+            grid_paths = fetch_grid_reports(input_file, args.app_contact, grids, base_url=args.pskr_url,
+                                            limiter=limiter, cache=cache)
+        with run_stats.stage("load_reports"):
+            reports = load_grid_reports(grid_paths)
+            if input_file is not None:
+                # the merged reports become the -t file, so later runs reading it see them as usual
+                save_reports(input_file, reports)
+            if cache is None:
+                for path in grid_paths.values():
+                    os.remove(path)
+    elif input_file is None:
+        with run_stats.stage("load_reports"):
+            grid_paths = cached_grid_reports(cache, grids, base_url=args.pskr_url)
+            if not grid_paths:
+                print("Error: no cached PSKReporter response for this query (use --fetch to fetch one)")
+                sys.exit(1)
+            reports = load_grid_reports(grid_paths)
+    else:
+        with run_stats.stage("load_reports"):
+            reports = load_reports(input_file)
+    # the reports live until exit; keep later cyclic GC passes from rescanning them
+    gc.freeze()
+    with run_stats.stage("check_dxcc_names"):
+        for r in reports['receptionReport']:
+            lookup1 = None
+            lookup2 = None
+            if "senderDXCC" in r.keys():
+                tx_dxcc = dxcc_name_strip(r["senderDXCC"])
+                lookup1 = name2dxcc.get(tx_dxcc)
+                if lookup1 is None and resolver is None:  # with --cty, the sender's callsign is tried first
+                    print("UNKNOWN DXCC", dxcc_name_strip(r["senderDXCC"]))
+            if "receiverDXCC" in r.keys():
+                rx_dxcc = dxcc_name_strip(r["receiverDXCC"])
+                lookup2 = name2dxcc.get(rx_dxcc)
+                if lookup2 is None:
+                    print("UNKNOWN DXCC", rx_dxcc)
 
-    interesting_dx = get_interesting_dx(interesting_reports)
+    print(f"Filtering reports for bands: {filter_bands}")
 
-    report_count = len(reports['receptionReport'])
-    interesting_report_count = len(interesting_reports)
+    with run_stats.stage("get_interesting_reports"):
+        interesting_reports, odd_reports = get_interesting_reports(
+            reports,
+            needs,
+            bands=filter_bands,
+            verbose=args.verbose,
+            by_mode=args.by_mode
+        )
 
-    print(
-        f'Fetched {report_count} reports. '
-        f'{interesting_report_count}/{report_count} '
-        f'({round(interesting_report_count*100.0/report_count,1)}%) interesting'
-    )
-    print()
-    print(
-        '          Code DXCC Name                Mode  Freq  Band Rank '
-        'Callsign   Grid          Grid'
-    )
+    with run_stats.stage("get_interesting_dx"):
+        interesting_dx = get_interesting_dx(interesting_reports, home=home)
 
-    for r in sorted(interesting_dx.values(), key=lambda r: (r["frequency"], r["senderCallsign"])):
-        rx_locator = r["receiverLocator"]
-        tx_dxcc_code = r["senderDXCCCode"]
-        tx_dxcc_name = r["senderDXCC"]
-        tx_dxcc_name_strip = dxcc_name_strip(tx_dxcc_name)
-        tx_callsign = r["senderCallsign"]
-        tx_locator = r["senderLocator"]
-        mode = r["mode"]
-        frequency = r["frequency"]
-        band = r["band"]
-        rank = r['rank']
-        dxcc_number = name2dxcc[tx_dxcc_name_strip]
-
-        # Format the output components
-        mode_str = ",".join(set(mode))
-        freq_str = ",".join(set([format(round(f, 3), "6.3f") for f in frequency]))
-        band_str = ",".join(set([get_band(f) for f in frequency]))
-        rx_str = ",".join(sorted(set(rx_locator))[0:20])
+    with run_stats.stage("render"):
+        report_count = len(reports['receptionReport'])
+        interesting_report_count = len(interesting_reports)
 
         print(
-            f'Relevant: {tx_dxcc_code.ljust(4)} '
-            f'{str(name2dxcc[tx_dxcc_name_strip]).ljust(3)} '
-            f'{tx_dxcc_name.ljust(20)[-20:]} {mode_str.ljust(5)} {freq_str} '
-            f'{band_str} #{str(rank).ljust(3)} {tx_callsign.ljust(10)} '
-            f'{tx_locator} heard in {rx_str}'
+            f'Fetched {report_count} reports. '
+            f'{interesting_report_count}/{report_count} '
+            f'({round(interesting_report_count*100.0/report_count,1)}%) interesting'
         )
-        if args.url:
-            print(f"{get_pskr_url(tx_callsign)}")
-
-    if args.verbose:
         print()
-        print("ODD REPORTS:")
-        odd_summary = {}
-        for o in odd_reports:
-            summary = {}
-            callsign = o["senderCallsign"]
-            summary["senderCallsign"] = callsign
-            odd_summary[callsign] = summary
-
-        for k, v in enumerate(odd_summary):
-            print(f"{v}")
+        print(
+            '          Code DXCC Name                Mode  Freq  Band Rank '
+            'Callsign   Grid          Grid'
+        )
+
+        for r in sorted_dx(interesting_dx, args.sort):
+            print(format_dx(r, args.verbose))
+            if args.url:
+                print(f"{get_pskr_url(r['senderCallsign'])}")
+
+        if args.verbose:
+            print()
+            print("ODD REPORTS:")
+            odd_summary = {}
+            for o in odd_reports:
+                summary = {}
+                callsign = o["senderCallsign"]
+                summary["senderCallsign"] = callsign
+                odd_summary[callsign] = summary
+
+            for k, v in enumerate(odd_summary):
+                print(f"{v}")
+    run_stats.count("dx_printed", len(interesting_dx))
+
+    emit_stats(args.profile, args.stats_json)
@@ -0,0 +1,279 @@
+"""A local HTTP hub that serves the DX from one PSKReporter poll to many clients (dx.py --hub).
+
+The poller publishes one snapshot per poll. Clients pick their own filter in the query string and the hub renders each
+distinct filter at most once per snapshot, so dozens of clients with the same needs cost one filter pass, not dozens.
+
+    GET  /spots?bands=20m,40m&needs=default&by_mode=1&max_rank=300&rx_grid=CM,DM   the current DX as JSON
+    GET  /spots?my_grid=FN42&rx_radius=1500&bearing=300-60&sort=distance          ... near and in a direction
+    GET  /events?...                                                               the same, as Server-Sent Events
+    POST /needs/<name>                                                             register a NeedsMatrix.to_bytes blob
+    GET  /status                                                                   snapshot version, clients, needs
+
+Omitted parameters take the hub's defaults (dx.py's command line); bands=all, needs=none and an empty rx_grid, my_grid,
+rx_radius or bearing clear them.
+"""
+
+import json
+import re
+import threading
+import time
+import urllib.parse
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bands import ALL_BANDS, HF_BANDS
+from maidenhead import GridMatcher, home_latlon, parse_sector
+from needs import NeedsMatrix
+
+KEEPALIVE_INTERVAL = 15  # seconds between SSE comments, which also notice clients that went away
+MAX_NEEDS_BYTES = 8*1024*1024  # a compressed needs matrix is a few tens of kilobytes
+MAX_NEEDS = 64
+NEEDS_NAME = re.compile(r"^[A-Za-z0-9_.-]{1,32}$")
+QUERY_PARAMETERS = ("bands", "needs", "by_mode", "max_rank", "rx_grid", "my_grid", "rx_radius", "bearing", "sort")
+
+
+class SpotHub:
+    """The latest snapshot, the registered needs matrices and the rendered results of each filter.
+
+    render(snapshot, query, needs) turns a snapshot into a JSON-serializable result for one query (a dict of
+    QUERY_PARAMETERS, as parsed by parse_query) and one needs matrix or None. version counts the changes to either
+    snapshot or needs; results are kept for the current version only.
+    """
+
+    def __init__(self, render, defaults):
+        """Initialize a hub with no snapshot; defaults holds the value of each query parameter when omitted."""
+        self.render = render
+        self.defaults = defaults
+        self.snapshot = None
+        self.version = 0
+        self.needs = {}  # name -> NeedsMatrix
+        self.clients = 0  # open /events streams
+        self.changed = threading.Condition()
+        self._results = {}  # query -> JSON bytes, for the current version
+        self._render_lock = threading.Lock()  # one render at a time: a small host has little CPU to spare
+
+    def publish(self, snapshot, needs=None):
+        """Replace the snapshot and the needs matrices given as {name: matrix}, and wake the /events streams."""
+        with self.changed:
+            self.snapshot = snapshot
+            self.needs.update(needs or {})
+            self._bump()
+
+    def set_needs(self, name, needs):
+        """Register or replace a client's needs matrix, raising ValueError when too many are registered."""
+        with self.changed:
+            if name not in self.needs and len(self.needs) >= MAX_NEEDS:
+                raise ValueError(f"At most {MAX_NEEDS} needs matrices can be registered")
+            self.needs[name] = needs
+            self._bump()
+
+    def _bump(self):
+        self.version += 1
+        self._results = {}
+        self.changed.notify_all()
+
+    def parse_query(self, query_string):
+        """Parse a query string into a hashable tuple of the QUERY_PARAMETERS values.
+
+        Raises ValueError for unknown bands, needs names, grids or malformed values.
+        """
+        params = {k: v[-1] for k, v in urllib.parse.parse_qs(query_string, keep_blank_values=True).items()}
+        unknown = set(params) - set(QUERY_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        query = dict(self.defaults, **params)
+
+        bands = query["bands"]
+        if isinstance(bands, str):
+            if bands.lower() in ("", "all"):
+                bands = None
+            elif bands.lower() == "hf":
+                bands = HF_BANDS
+            else:
+                bands = bands.split(",")
+                for band in bands:
+                    if band not in ALL_BANDS:
+                        raise ValueError(f"Unknown band {band}")
+        bands = tuple(bands) if bands else None
+
+        needs = query["needs"]
+        if needs in ("", "none"):
+            needs = None
+        if needs is not None and needs not in self.needs:
+            raise ValueError(f"Unknown needs matrix {needs}")
+
+        by_mode = query["by_mode"]
+        if isinstance(by_mode, str):
+            if by_mode.lower() not in ("0", "1", "false", "true", "no", "yes"):
+                raise ValueError(f"by_mode must be 0 or 1, not {by_mode}")
+            by_mode = by_mode.lower() in ("1", "true", "yes")
+
+        try:
+            max_rank = int(query["max_rank"])
+        except ValueError:
+            raise ValueError(f"max_rank must be a number, not {query['max_rank']}")
+
+        rx_grid = query["rx_grid"] or None
+        if rx_grid is not None:
+            GridMatcher(rx_grid)
+
+        my_grid = query["my_grid"] or None
+        if my_grid is not None:
+            home_latlon(my_grid)
+
+        rx_radius = query["rx_radius"]
+        if rx_radius in ("", None):
+            rx_radius = None
+        else:
+            try:
+                rx_radius = float(rx_radius)
+            except ValueError:
+                raise ValueError(f"rx_radius must be a number of km, not {rx_radius}")
+
+        bearing = query["bearing"]
+        if isinstance(bearing, str):
+            bearing = parse_sector(bearing) if bearing else None
+
+        sort = query["sort"]
+        if sort not in ("frequency", "distance"):
+            raise ValueError(f"sort must be frequency or distance, not {sort}")
+        if my_grid is None and (rx_radius is not None or bearing is not None or sort == "distance"):
+            raise ValueError("rx_radius, bearing and sort=distance need my_grid")
+
+        return bands, needs, by_mode, max_rank, rx_grid, my_grid, rx_radius, bearing, sort
+
+    def result(self, query):
+        """Return (version, JSON bytes) of the current snapshot for a parsed query, or (version, None) before the
+        first snapshot."""
+        with self.changed:
+            version, snapshot = self.version, self.snapshot
+            body = self._results.get(query)
+        if body is not None or snapshot is None:
+            return version, body
+        with self._render_lock:
+            with self.changed:
+                if self.version != version:  # published while waiting for the lock: render the new snapshot
+                    version, snapshot = self.version, self.snapshot
+                body = self._results.get(query)
+                needs = self.needs.get(query[1]) if query[1] is not None else None  # query[1] is the needs name
+            if body is None:
+                params = dict(zip(QUERY_PARAMETERS, query))
+                params["bands"] = list(params["bands"]) if params["bands"] else None
+                result = self.render(snapshot, params, needs)
+                body = json.dumps(dict(result, version=version)).encode()
+                with self.changed:
+                    if self.version == version:
+                        self._results[query] = body
+        return version, body
+
+    def wait(self, version, timeout):
+        """Wait up to timeout seconds for a version other than the given one, and return the current version."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+class HubHandler(BaseHTTPRequestHandler):
+    """Serve /spots, /events, /status and /needs/<name> for the server's SpotHub."""
+
+    def do_GET(self):
+        path, _, query_string = self.path.partition("?")
+        if path == "/status":
+            hub = self.server.hub
+            with hub.changed:
+                status = {"version": hub.version, "clients": hub.clients, "needs": sorted(hub.needs),
+                          "snapshot": hub.snapshot is not None}
+            return self.send_body(200, json.dumps(status).encode())
+        if path not in ("/spots", "/events"):
+            return self.send_error(404)
+        try:
+            query = self.server.hub.parse_query(query_string)
+        except ValueError as e:
+            return self.send_error(400, explain=str(e))
+        if path == "/spots":
+            _, body = self.server.hub.result(query)
+            if body is None:
+                return self.send_error(503, explain="No PSKReporter poll has completed yet")
+            return self.send_body(200, body)
+        self.stream_events(query)
+
+    def do_POST(self):
+        match = re.match(r"^/needs/(.*)$", self.path)
+        if not match:
+            return self.send_error(404)
+        name = match.group(1)
+        if not NEEDS_NAME.match(name):
+            return self.send_error(400, explain="Needs names are 1-32 letters, digits, '_', '.' or '-'")
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            return self.send_error(411)
+        if length < 0:
+            return self.send_error(400, explain="Content-Length must not be negative")
+        if length > MAX_NEEDS_BYTES:
+            return self.send_error(413)
+        try:
+            needs = NeedsMatrix.from_bytes(self.rfile.read(length))
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            return self.send_error(400, explain=f"Could not load the needs matrix: {e}")
+        try:
+            self.server.hub.set_needs(name, needs)
+        except ValueError as e:
+            return self.send_error(400, explain=str(e))
+        self.send_body(200, json.dumps({"needs": name}).encode())
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_events(self, query):
+        """Send the query's result now and after every change, as "spots" events, until the client goes away.
+
+        A client reconnecting with the Last-Event-ID of the current version is not sent the same result again.
+        """
+        hub = self.server.hub
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            sent = int(self.headers.get("Last-Event-ID", ""))
+        except ValueError:
+            sent = None
+        with hub.changed:
+            hub.clients += 1
+        try:
+            while True:
+                version, body = hub.result(query)
+                if body is not None and version != sent:
+                    self.wfile.write(b"event: spots\nid: %d\ndata: %s\n\n" % (version, body))
+                    sent = version
+                else:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+                hub.wait(version, KEEPALIVE_INTERVAL)
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
+            pass
+        finally:
+            with hub.changed:
+                hub.clients -= 1
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            print(f"{time.strftime('%H:%M:%S')} {self.address_string()} {format % args}")
+
+
+class HubServer(ThreadingHTTPServer):
+    """A threaded HTTP server for a SpotHub; each client, including each /events stream, has a thread."""
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, address, hub, verbose=False):
+        super().__init__(address, HubHandler)
+        self.hub = hub
+        self.verbose = verbose
@@ -7,7 +7,10 @@ import requests
 import sys
 import time
 
-from adif import ADIFFile
+from adif import ADIFFile, open_compressed
+from stats import RunStats
+
+run_stats = RunStats("lotw-sync.py")  # stage timings and counters for --profile and --stats_json
 
 
 def load_auth(filepath):
@@ -87,6 +90,7 @@ def lotw_fetch(qso_time_horizon, callsign, details=True):
         return None
 
     print("   Fetch completed successfully in %0.1f seconds"%(end_time-start_time))
+    run_stats.count("fetch_bytes", len(r.content))
     print("   [Done]")
     return r
 
@@ -94,27 +98,29 @@ def lotw_fetch(qso_time_horizon, callsign, details=True):
 def fetch_lotw_to_file(temp_filename, since, callsign, details=True):
     """Fetch logs from LoTW and save to a temporary ADIF file."""
     try:
-        with open(temp_filename, 'w', encoding='utf-8') as out:
-            raw = lotw_fetch(since, callsign, details)
+        with open_compressed(temp_filename, 'wt', encoding='utf-8') as out:
+            with run_stats.stage("fetch"):
+                raw = lotw_fetch(since, callsign, details)
             if raw is None:
                 print("ERROR: Stopping after failed fetch")
                 sys.exit(1)
 
             print(f'Starting write to "{temp_filename}" ...')
-            found_eoh = False
-            for line in raw.text.splitlines(True):
-                if "PROGRAMID" in line:
-                    found_eoh = True
-                    print("   Found header...")
+            with run_stats.stage("write_temp"):
+                found_eoh = False
+                for line in raw.text.splitlines(True):
+                    if "PROGRAMID" in line:
+                        found_eoh = True
+                        print("   Found header...")
 
-                if "<APP_LoTW_EOF>" in line:
-                    break
+                    if "<APP_LoTW_EOF>" in line:
+                        break
 
-                if found_eoh:
-                    out.write(line)
+                    if found_eoh:
+                        out.write(line)
 
-                if not found_eoh:
-                    continue
+                    if not found_eoh:
+                        continue
             print("   [Done]")
     except PermissionError:
         print(f"ERROR: Permission denied accessing {temp_filename}")
@@ -124,16 +130,13 @@ def fetch_lotw_to_file(temp_filename, since, callsign, details=True):
         sys.exit(1)
 
 def read_adif_file(filename):
-    """Read and parse an ADIF file, returning ADIFFile object."""
+    """Open an ADIF file and return a generator streaming its records.
+
+    The file is parsed as the records are consumed, so errors reading it are reported (and exit) from the generator.
+    """
     print(f'Reading from {filename}...')
-    adif = ADIFFile()
     try:
-        with open(filename, "r", encoding='utf-8') as f:
-            try:
-                adif.parse(f)
-            except Exception as e:
-                print(f"ERROR: Failed to parse ADIF file: {str(e)}")
-                sys.exit(1)
+        records = ADIFFile.iter_records(filename)
     except FileNotFoundError:
         print(f"ERROR: Could not find file {filename}")
         sys.exit(1)
@@ -143,20 +146,33 @@ def read_adif_file(filename):
     except Exception as e:
         print(f"ERROR: Failed to open {filename}: {str(e)}")
         sys.exit(1)
-    print("   [DONE]")
-    return adif
+    return _report_read_errors(records, filename)
+
+
+def _report_read_errors(records, filename):
+    """Pass records through, reporting an error raised while reading or parsing them as such rather than as a
+    failed write."""
+    try:
+        yield from records
+    except Exception as e:  # a corrupt log or compressed stream: ValueError, EOFError, OSError, LZMAError, ...
+        print(f"ERROR: Failed to read {filename}: {str(e)}")
+        sys.exit(1)
 
 
-def write_filtered_adif(adif, output_filename, grid_filter):
-    """Write ADIF data to file, filtered by grid square."""
+def write_filtered_adif(records, output_filename, grid_filter):
+    """Write ADIF records to file, filtered by grid square."""
     print(f'Starting write to "{output_filename}" ...')
+    counts = {"records_parsed": 0, "records_written": 0}
     try:
-        with open(output_filename, "w", encoding='utf-8') as f2:
+        with open_compressed(output_filename, "wt", encoding='utf-8') as f2, run_stats.stage("filter_write"):
             print(f'   Filtering down to gridsquare: {grid_filter}')
             def grid_filter_func(r):
-                return (r.get("MY_GRIDSQUARE") and
-                       grid_filter in r.get("MY_GRIDSQUARE"))
-            adif.write(f2, grid_filter_func)
+                grid = r.get("MY_GRIDSQUARE")
+                keep = grid and grid_filter in grid
+                counts["records_parsed"] += 1
+                counts["records_written"] += bool(keep)
+                return keep
+            ADIFFile().write(f2, grid_filter_func, records=records)
     except FileNotFoundError:
         print(f"ERROR: Could not create output file {output_filename}")
         sys.exit(1)
@@ -166,6 +182,8 @@ def write_filtered_adif(adif, output_filename, grid_filter):
     except Exception as e:
         print(f"ERROR: Failed to write to {output_filename}: {str(e)}")
         sys.exit(1)
+    for name, count in counts.items():
+        run_stats.count(name, count)
     print('   [DONE]')
 
 
@@ -179,12 +197,12 @@ if __name__ == "__main__":
     parser.add_argument(
         '-o', '--output_filename',
         required=True,
-        help="The output ADIF filepath to write to"
+        help="The output ADIF filepath to write to (a .gz, .xz, .bz2 or .zst extension compresses it)"
     )
     parser.add_argument(
         '-t', '--temp_filename',
         default=".lotw-tmp.adi",
-        help="A temporary ADIF filepath to write to for caching purposes"
+        help="A temporary ADIF filepath to write to for caching purposes (may be compressed, see --output_filename)"
     )
     parser.add_argument(
         "--details",
@@ -205,6 +223,16 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--since", default="1970-01-01", help="The date after which to fetch QSOs")
     parser.add_argument("-c", "--callsign", default=None, help="Fetch QSOs for a specific callsign or leave blank for all")
     parser.add_argument("-g", "--my_grid", default="", help="Filter to only include QSOs from a specific grid square")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the wall time, CPU time and peak memory of each stage of the run, and its counters"
+    )
+    parser.add_argument(
+        "--stats_json",
+        metavar="PATH",
+        help="Save the --profile stage timings and counters as JSON (appended as one line per run to a .jsonl file)"
+    )
     args = parser.parse_args()
 
     temp_filename = args.temp_filename
@@ -220,7 +248,15 @@ if __name__ == "__main__":
     else:
         print("Skipping fetch.")
 
-    adif = read_adif_file(temp_filename)
-    write_filtered_adif(adif, output_filename, grid_filter)
+    records = read_adif_file(temp_filename)
+    write_filtered_adif(records, output_filename, grid_filter)
     print("   [DONE]")
 
+    if args.profile:
+        run_stats.print_report()
+    if args.stats_json:
+        try:
+            run_stats.save(args.stats_json)
+        except OSError as e:
+            print(f"Error writing stats to {args.stats_json}: {e}")
+
@@ -0,0 +1,133 @@
+"""Maidenhead locators: grid prefix matching, and conversion to latitude/longitude with great-circle distance and
+bearing over NumPy arrays.
+
+A locator is read pair by pair (field A-R, square 0-9, subsquare A-X, extended square 0-9) and stands for the centre of
+the smallest square it names, so "FN" and "FN42" and "FN42ab" are progressively more precise points. Letters are
+case-insensitive. Locators that do not start with a valid field convert to NaN.
+"""
+
+import os
+import re
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# the longitude and latitude span of a square at each precision, in degrees
+LON_STEPS = np.array([20.0, 2.0, 2.0/24, 2.0/240])
+LAT_STEPS = np.array([10.0, 1.0, 1.0/24, 1.0/240])
+
+# a valid locator, or a prefix of one (FN, FN4, FN42a, ...)
+GRID_PREFIX = re.compile(r"^[A-R]([A-R]([0-9]([0-9]([A-X]([A-X]([0-9][0-9]?)?)?)?)?)?)?$", re.IGNORECASE)
+
+
+class GridMatcher:
+    """A set of grid prefixes (e.g. "CM,DM,FN42") that a locator matches when it starts with one of them.
+
+    Unlike a substring test, "M7" does not match CM79, and FN42 matches FN42ab as well as FN42.
+    """
+
+    def __init__(self, grids):
+        """Build a matcher from a comma-separated string or an iterable of prefixes, raising ValueError for one that
+        cannot start a locator."""
+        if isinstance(grids, str):
+            grids = grids.split(",")
+        self.prefixes = set()
+        for grid in grids:
+            grid = grid.strip()
+            if not GRID_PREFIX.match(grid):
+                raise ValueError(f"Not a Maidenhead grid: {grid!r}")
+            self.prefixes.add(grid.upper())
+        self.lengths = sorted(set(len(prefix) for prefix in self.prefixes))
+
+    def matches(self, locator):
+        """Return True if a locator starts with one of the prefixes."""
+        locator = locator.upper()
+        return any(locator[0:n] in self.prefixes for n in self.lengths)
+
+    def common_prefix(self):
+        """Return the longest prefix shared by all of the grids (FN for FN42,FN31), or None if they share none."""
+        prefix = os.path.commonprefix(sorted(self.prefixes))
+        return prefix or None
+
+    def mask(self, locators):
+        """Return a boolean array of which of a sequence of locators match."""
+        return np.fromiter((self.matches(locator) for locator in locators), dtype=bool, count=len(locators))
+
+
+def to_latlon(locators):
+    """Convert a sequence of locators to arrays of the latitudes and longitudes (degrees) of their centres.
+
+    Only the leading valid pairs of each locator are used; one without a valid field gives NaN.
+    """
+    text = np.char.upper(np.asarray(locators, dtype=str).reshape(-1))
+    raw = np.char.encode(text, "ascii", "replace").astype("S8")
+    chars = np.frombuffer(raw.tobytes(), dtype=np.uint8).reshape(-1, 8).astype(np.int32)
+    letters = chars - ord("A")
+    digits = chars - ord("0")
+
+    # precision is the number of valid leading pairs, 0 to 4
+    valid = [
+        (letters[:, 0] >= 0) & (letters[:, 0] < 18) & (letters[:, 1] >= 0) & (letters[:, 1] < 18),
+        (digits[:, 2] >= 0) & (digits[:, 2] < 10) & (digits[:, 3] >= 0) & (digits[:, 3] < 10),
+        (letters[:, 4] >= 0) & (letters[:, 4] < 24) & (letters[:, 5] >= 0) & (letters[:, 5] < 24),
+        (digits[:, 6] >= 0) & (digits[:, 6] < 10) & (digits[:, 7] >= 0) & (digits[:, 7] < 10),
+    ]
+    precision = np.zeros(len(chars), dtype=np.int32)
+    leading = np.ones(len(chars), dtype=bool)
+    for pair_valid in valid:
+        leading &= pair_valid
+        precision += leading
+
+    lon = np.full(len(chars), -180.0)
+    lat = np.full(len(chars), -90.0)
+    offsets = [(letters, 0), (digits, 2), (letters, 4), (digits, 6)]
+    for pair, (values, column) in enumerate(offsets):
+        used = precision > pair
+        lon += np.where(used, values[:, column] * LON_STEPS[pair], 0.0)
+        lat += np.where(used, values[:, column + 1] * LAT_STEPS[pair], 0.0)
+    known = precision > 0
+    last = np.maximum(precision - 1, 0)
+    lon = np.where(known, lon + LON_STEPS[last] / 2, np.nan)
+    lat = np.where(known, lat + LAT_STEPS[last] / 2, np.nan)
+    return lat, lon
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance in km between points given in degrees; arrays broadcast."""
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Initial great-circle bearing in degrees (0-360, clockwise from north) from the first points to the second."""
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def home_latlon(locator):
+    """Return the (latitude, longitude) of a single locator, raising ValueError if it is not one."""
+    lat, lon = to_latlon([locator])
+    if np.isnan(lat[0]) or not GRID_PREFIX.match(locator):
+        raise ValueError(f"Not a Maidenhead locator: {locator!r}")
+    return float(lat[0]), float(lon[0])
+
+
+def parse_sector(text):
+    """Parse a "start-end" bearing sector in degrees (clockwise, so 300-60 wraps through north) into a tuple."""
+    try:
+        start, end = (float(x) % 360 for x in text.split("-"))
+    except ValueError:
+        raise ValueError(f"A bearing sector is start-end in degrees (e.g. 300-60), not {text!r}")
+    return start, end
+
+
+def sector_mask(bearings, sector):
+    """Mask of bearings inside a (start, end) sector; NaN bearings are outside."""
+    start, end = sector
+    if start <= end:
+        return (bearings >= start) & (bearings <= end)
+    return (bearings >= start) | (bearings <= end)
@@ -0,0 +1,184 @@
+"""A dense DXCC x band x mode group matrix of worked and confirmed QSO counts.
+
+dx.py uses it to decide which spots are needed: a DXCC entity is still needed on a band (and optionally a mode group)
+while it has no confirmed QSO there. Counts are kept in NumPy arrays, so lookups are plain index operations, matrices
+from several logs or callsigns can be merged with one addition, and the whole matrix serializes to tens of KiB.
+"""
+
+import io
+import zipfile
+
+import numpy as np
+
+from bands import ALL_BANDS
+
+MAX_DXCC_NUM = 600
+MODE_GROUPS = ["CW", "PHONE", "DATA"]
+
+# ADIF modes counted as PHONE and CW; every other mode is DATA (LoTW's APP_LoTW_MODEGROUP takes precedence)
+PHONE_MODES = {"SSB", "USB", "LSB", "AM", "FM", "DIGITALVOICE", "DSTAR", "C4FM", "DMR", "FREEDV"}
+CW_MODES = {"CW"}
+
+_BAND_INDEX = {band: i for i, band in enumerate(ALL_BANDS)}
+_MODE_GROUP_INDEX = {group: i for i, group in enumerate(MODE_GROUPS)}
+
+
+def mode_group(mode, lotw_mode_group=None):
+    """Return the mode group (CW, PHONE or DATA) of an ADIF or PSKReporter mode."""
+    if lotw_mode_group and lotw_mode_group.upper() in _MODE_GROUP_INDEX:
+        return lotw_mode_group.upper()
+    mode = (mode or "").upper()
+    if mode in CW_MODES:
+        return "CW"
+    if mode in PHONE_MODES:
+        return "PHONE"
+    return "DATA"
+
+
+class NeedsMatrix:
+    """Worked/confirmed QSO counts indexed by (DXCC number, band, mode group).
+
+    For each confirmed slot the matrix also remembers one example QSO as a (log path, record number) pair, which
+    ADIFMappedFile can read back.
+    """
+
+    def __init__(self):
+        """Initialize an empty NeedsMatrix object."""
+        shape = (MAX_DXCC_NUM, len(ALL_BANDS), len(MODE_GROUPS))
+        self.worked = np.zeros(shape, dtype=np.uint32)
+        self.confirmed = np.zeros(shape, dtype=np.uint32)
+        self.example_log = np.full(shape, -1, dtype=np.int16)  # index into self.logs
+        self.example_record = np.full(shape, -1, dtype=np.int32)
+        self.logs = []
+
+    @staticmethod
+    def index(dxcc, band, group=None):
+        """Return the array index of a slot, or raise KeyError for an unknown band/mode group or DXCC number."""
+        if not 0 < dxcc < MAX_DXCC_NUM:
+            raise KeyError(f"DXCC number {dxcc} out of range")
+        if group is None:
+            return dxcc, _BAND_INDEX[band]
+        return dxcc, _BAND_INDEX[band], _MODE_GROUP_INDEX[group]
+
+    def add(self, dxcc, band, group, confirmed, path=None, record_number=None):
+        """Count one QSO, remembering it as the slot's example if it is confirmed and its record number is given."""
+        i = self.index(dxcc, band, group)
+        self.worked[i] += 1
+        if confirmed:
+            self.confirmed[i] += 1
+            if record_number is not None:
+                self.example_log[i] = self._log_index(path)
+                self.example_record[i] = record_number
+
+    def add_many(self, slots, confirmed, path=None, record_numbers=None):
+        """Count a batch of QSOs given as (dxcc, band, mode group) slots with one vectorized update per array.
+
+        confirmed is a parallel sequence of booleans. With record_numbers, the last confirmed QSO of the batch in
+        each slot becomes its example.
+        """
+        if not slots:
+            return
+        i = tuple(np.array([self.index(*slot) for slot in slots]).T)
+        confirmed = np.asarray(confirmed, dtype=bool)
+        np.add.at(self.worked, i, 1)
+        ci = tuple(axis[confirmed] for axis in i)
+        np.add.at(self.confirmed, ci, 1)
+        if record_numbers is not None and confirmed.any():
+            self.example_record[ci] = -1
+            np.maximum.at(self.example_record, ci, np.asarray(record_numbers)[confirmed])
+            self.example_log[ci] = self._log_index(path)
+
+    def clear(self):
+        """Reset every count and example."""
+        self.worked[:] = 0
+        self.confirmed[:] = 0
+        self.example_log[:] = -1
+        self.example_record[:] = -1
+        self.logs = []
+
+    def worked_count(self, dxcc, band, group=None):
+        """Return the number of QSOs with a DXCC entity on a band, in one mode group or in all of them."""
+        return int(self.worked[self.index(dxcc, band, group)].sum())
+
+    def confirmed_count(self, dxcc, band, group=None):
+        """Return the number of confirmed QSOs with a DXCC entity on a band, in one mode group or in all of them."""
+        return int(self.confirmed[self.index(dxcc, band, group)].sum())
+
+    def is_confirmed(self, dxcc, band, group=None):
+        """Return True if a DXCC entity is confirmed on a band (in a mode group, if given)."""
+        return self.confirmed_count(dxcc, band, group) > 0
+
+    def examples(self):
+        """Yield (dxcc, band, mode group, path, record number) for each confirmed slot with an example QSO."""
+        for dxcc, b, g in zip(*np.nonzero(self.example_log >= 0)):
+            yield (int(dxcc), ALL_BANDS[b], MODE_GROUPS[g], self.logs[self.example_log[dxcc, b, g]],
+                   int(self.example_record[dxcc, b, g]))
+
+    def merge(self, other):
+        """Add the counts of another matrix (another log or callsign) into this one and return self.
+
+        Examples from other only fill slots that do not have one yet.
+        """
+        self.worked += other.worked
+        self.confirmed += other.confirmed
+        remap = np.array([self._log_index(path) for path in other.logs] + [-1], dtype=np.int16)
+        fill = (self.example_log < 0) & (other.example_log >= 0)
+        self.example_log[fill] = remap[other.example_log[fill]]
+        self.example_record[fill] = other.example_record[fill]
+        return self
+
+    def _log_index(self, path):
+        """Return the index of a log path in self.logs, adding it if needed."""
+        if path not in self.logs:
+            self.logs.append(path)
+        return self.logs.index(path)
+
+    def to_bytes(self):
+        """Serialize the matrix to a compressed .npz blob; only the non-zero slots take any real space."""
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer, worked=self.worked, confirmed=self.confirmed, example_log=self.example_log,
+            example_record=self.example_record, logs=np.array(self.logs, dtype=str),
+            bands=np.array(ALL_BANDS), mode_groups=np.array(MODE_GROUPS)
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load a matrix serialized by to_bytes.
+
+        Raises ValueError if the data is not such a matrix, was built with a different band or mode group list, or
+        has arrays of the wrong shape or type, so that a bad file or upload cannot break later lookups.
+        """
+        matrix = cls()
+        try:
+            with np.load(io.BytesIO(data)) as blob:
+                if blob["bands"].tolist() != ALL_BANDS or blob["mode_groups"].tolist() != MODE_GROUPS:
+                    raise ValueError("Needs matrix was saved with a different band or mode group list")
+                arrays = {name: blob[name] for name in ("worked", "confirmed", "example_log", "example_record")}
+                logs = blob["logs"]
+        except (OSError, EOFError, KeyError, zipfile.BadZipFile) as e:
+            raise ValueError(f"Not a saved needs matrix: {e}")
+        for name, array in arrays.items():
+            expected = getattr(matrix, name)
+            if array.shape != expected.shape or array.dtype != expected.dtype:
+                raise ValueError(f"Needs matrix {name} is {array.dtype}{list(array.shape)}, "
+                                 f"not {expected.dtype}{list(expected.shape)}")
+            setattr(matrix, name, array)
+        if logs.ndim != 1 or logs.dtype.kind != "U":
+            raise ValueError("Needs matrix logs must be a list of paths")
+        matrix.logs = logs.tolist()
+        if matrix.example_log.min() < -1 or matrix.example_log.max() >= len(matrix.logs):
+            raise ValueError("Needs matrix examples refer to logs it does not list")
+        return matrix
+
+    def save(self, file_path):
+        """Write the serialized matrix to a file."""
+        with open(file_path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, file_path):
+        """Read a matrix written by save."""
+        with open(file_path, "rb") as f:
+            return cls.from_bytes(f.read())
@@ -9,11 +9,8 @@ if __name__ == "__main__":
     parks = []
     out_paths = []
     
-    file_in = open(in_path, "r")
-    
     log = ADIFFile()
-    log.parse(file_in, verbose=False)
-    file_in.close()
+    log.parse(in_path, verbose=False)
     
     allowed_fields = ["COMMENT", "STATION_CALLSIGN", "CALL", "QSO_DATE", "TIME_ON","BAND","MODE","SUBMODE","OPERATOR","MY_SIG","MY_SIG_INFO","SIG","SIG_INFO","MY_STATE"]
     
@@ -26,7 +23,7 @@ if __name__ == "__main__":
     log.set_all("STATION_CALLSIGN", "WQ9N") # identifies activator
     print("   [DONE]")
     
-    contacts = []
+    contacts = set()
     print(f'Total contacts in log.records: {len(log.records)}')
     for r in log.records:
         comment = r.get("comment")
@@ -77,7 +74,7 @@ if __name__ == "__main__":
             r.set("remove", "true")
         else:
             print(f'Did not find duplicate in log for contact {log_date}, {call}, {band}')
-            contacts.append(sig)
+            contacts.add(sig)
             print(f'Adding sig "{sig}" into dictionary')
 
     print(f'End of parsing...')
@@ -0,0 +1,75 @@
+"""A local stand-in for PSKReporter's pskquery5.pl that serves recorded responses, for testing dx.py --watch."""
+
+import argparse
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from adif import open_compressed
+
+EMPTY_RESPONSE = b'doNothing({"receptionReport":[]});\n'
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Answer each GET with the next recorded response, whatever its query string."""
+
+    def do_GET(self):
+        body = self.server.next_response()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/javascript")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """An HTTP server that hands out recorded response files in order."""
+
+    def __init__(self, address, paths, loop=False):
+        super().__init__(address, ReplayHandler)
+        self.paths = paths
+        self.loop = loop
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def next_response(self):
+        """Return the body of the next recorded response, or an empty response once they have all been served."""
+        with self._lock:
+            if self.served >= len(self.paths) and not self.loop:
+                return EMPTY_RESPONSE
+            path = self.paths[self.served % len(self.paths)]
+            self.served += 1
+        with open_compressed(path, "rb") as f:
+            return f.read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    prog='pskr-replay',
+                    description="Serves recorded PSKReporter responses in order as a stand-in for pskquery5.pl",
+                    epilog='End Transmission')
+
+    parser.add_argument('responses', nargs='+', help="Saved pskquery5.pl responses (e.g. dx.py -t files), in order")
+    parser.add_argument('--host', default="127.0.0.1", help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8073, help="Port to listen on")
+    parser.add_argument(
+        '--loop',
+        action='store_true',
+        help="Start over at the first response after the last one instead of answering with no reports"
+    )
+    args = parser.parse_args()
+
+    try:
+        server = ReplayServer((args.host, args.port), args.responses, loop=args.loop)
+    except OSError as e:
+        print(f"Error listening on {args.host}:{args.port}: {e}")
+        sys.exit(1)
+    print(f"Serving {len(args.responses)} responses at http://{args.host}:{args.port}/cgi-bin/pskquery5.pl")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
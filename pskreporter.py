@@ -0,0 +1,388 @@
+"""Fetching and incrementally reading PSKReporter (pskquery5.pl) responses.
+
+Responses are streamed from the server straight to disk, and ReportReader walks the saved JSON (optionally wrapped in
+a JSONP callback such as doNothing(...)) one reception report at a time, so neither step holds the whole response in
+memory as text. fetch_many runs several queries (e.g. one per receiver grid) on a thread pool, spaced out by a shared
+TokenBucket so that the process never queries PSKReporter more than once every MIN_POLL_INTERVAL seconds: the queries
+of a multi-grid fetch are serialized, or served from a ResponseCache directory, which lets runs, and several
+operators' scripts sharing the directory, reuse a recent response instead of querying again.
+"""
+
+import concurrent.futures
+import hashlib
+import http.client
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from adif import open_compressed
+
+PSKR_QUERY_URL = 'https://pskreporter.info/cgi-bin/pskquery5.pl'
+MIN_POLL_INTERVAL = 300  # PSKReporter asks for no more than one query every five minutes
+MAX_WORKERS = 4
+
+DEFAULT_CACHE_DIR = ".pskr-cache"
+CACHE_RETENTION = 24 * 3600  # cached responses older than this are deleted
+LOCK_POLL_INTERVAL = 0.25
+
+READ_SIZE = 1 << 20
+MAX_WRAPPER_LENGTH = 4096  # how far into a response to look for the start of the JSON object
+
+USER_AGENT = (
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+)
+
+_WHITESPACE_RE = re.compile(r'\s*')
+_CALLBACK_RE = re.compile(r'\s*(?:/\*.*?\*/)?\s*[A-Za-z_$][\w$.]*\s*\(\s*$', re.S)
+
+
+def query_url(app_contact, grid=None, seconds=300, lastseqno=None, base_url=PSKR_QUERY_URL):
+    """Build a pskquery5.pl URL for the reception reports of the last seconds heard by receivers in a grid.
+
+    With lastseqno (the lastSequenceNumber of a previous response), only reports newer than that response are
+    returned.
+    """
+    params = {
+        "encap": 1, "callback": "doNothing", "statistics": 1, "noactive": "true", "rronly": "true", "nolocator": 1,
+        "flowStartSeconds": -int(seconds),
+    }
+    if grid:
+        params.update(modify="grid", receiverCallsign=grid)
+    if lastseqno is not None:
+        params["lastseqno"] = lastseqno
+    params["appcontact"] = app_contact
+    return f'{base_url}?{urllib.parse.urlencode(params)}'
+
+
+def sequence_number(meta):
+    """Return the lastSequenceNumber of a response's top-level values, or None."""
+    value = meta.get("lastSequenceNumber")
+    if isinstance(value, dict):
+        value = value.get("value")
+    return None if value is None else int(value)
+
+
+def current_seconds(meta):
+    """Return the server time of a response (currentSeconds) from its top-level values, or None."""
+    value = meta.get("currentSeconds")
+    if isinstance(value, dict):
+        value = value.get("value")
+    return None if value is None else int(value)
+
+
+def fetch_to_file(url, file_path, timeout=120):
+    """Stream the body of a GET request to a file (compressed if the name ends in .gz, .xz, .bz2 or .zst).
+
+    Returns the number of bytes received.
+    """
+    request = urllib.request.Request(url, data=None, headers={'User-Agent': USER_AGENT})
+    received = 0
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        with open_compressed(file_path, "wb") as f:
+            for block in iter(lambda: response.read(READ_SIZE), b''):
+                f.write(block)
+                received += len(block)
+    return received
+
+
+class TokenBucket:
+    """A thread-safe token bucket rate limiter: burst requests at once, then rate requests per second."""
+
+    def __init__(self, rate, burst=1):
+        """Initialize a full bucket."""
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until it is available, and return the number of seconds waited.
+
+        Tokens are reserved in call order (the bucket may go into debt), so waiting callers are served first come,
+        first served.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = max(0.0, -self._tokens / self.rate)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+# Shared by every fetch_many call in the process, so concurrent and successive fetches together stay within
+# PSKReporter's one query every MIN_POLL_INTERVAL seconds
+RATE_LIMITER = TokenBucket(1 / MIN_POLL_INTERVAL)
+
+
+class ResponseCache:
+    """A directory of compressed PSKReporter responses, keyed by query and reused while younger than ttl seconds.
+
+    Entries are named by a hash of the query URL without its appcontact, so scripts run by different operators share
+    them. Each entry is a gzipped response plus a small .meta file recording when it was fetched. Fetches of one
+    query are serialized by a lock file: a process that finds the lock taken waits for it and then uses the response
+    the lock holder stored, so concurrent runs coalesce into one upstream request.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=MIN_POLL_INTERVAL, lock_timeout=150):
+        """Initialize a cache in a directory, which is created when the first response is stored."""
+        self.directory = directory
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout  # a lock older than this was left behind by a crashed fetch
+
+    @staticmethod
+    def key(url):
+        """Return the cache key of a query URL: a hash of its base and sorted parameters, less appcontact."""
+        base, _, query = url.partition("?")
+        params = sorted((k, v) for k, v in urllib.parse.parse_qsl(query, keep_blank_values=True) if k != "appcontact")
+        return hashlib.sha256(f"{base}?{urllib.parse.urlencode(params)}".encode()).hexdigest()[:32]
+
+    def path(self, url):
+        """Return the path of the cached response for a query URL (which may not exist yet)."""
+        return os.path.join(self.directory, f"{self.key(url)}.json.gz")
+
+    def age(self, url):
+        """Return the seconds since the cached response for a query URL was fetched, or None if there is none."""
+        try:
+            with open(f"{self.path(url)}.meta", "r", encoding="utf-8") as f:
+                fetched = json.load(f)["fetched"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return max(0.0, time.time() - fetched) if os.path.exists(self.path(url)) else None
+
+    def get(self, url, download=None):
+        """Return (path, age) of the response for a query URL, calling download(file_path) to fetch it if needed.
+
+        An entry younger than ttl is used as is (age is its age in seconds). Otherwise the entry's lock is taken and
+        download, which must write the response to the given file path and may raise, fetches it (age is None). With
+        download None, the entry is used whatever its age, and (None, None) is returned if there is none.
+        """
+        path = self.path(url)
+        while True:
+            age = self.age(url)
+            if age is not None and (age < self.ttl or download is None):
+                return path, age
+            if download is None:
+                return None, None
+            if self._lock(path):
+                break
+            time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            age = self.age(url)  # another process may have stored it while we waited for the lock
+            if age is not None and age < self.ttl:
+                return path, age
+            self._store(url, path, download)
+            return path, None
+        finally:
+            self._unlock(path)
+
+    def _store(self, url, path, download):
+        """Download a response into a temporary entry and move it and its .meta file into place."""
+        tmp_path = f"{path[:-len('.json.gz')]}.{os.getpid()}.{threading.get_ident()}.json.gz"  # written compressed
+        try:
+            download(tmp_path)
+            with open(f"{tmp_path}.meta", "w", encoding="utf-8") as f:
+                json.dump({"fetched": time.time(), "query": url.partition("?")[2]}, f)
+            os.replace(tmp_path, path)
+            os.replace(f"{tmp_path}.meta", f"{path}.meta")
+        finally:
+            for leftover in (tmp_path, f"{tmp_path}.meta"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self.prune()
+
+    def _lock(self, path):
+        """Try to take an entry's lock, breaking one left behind by a crashed fetch, and return True on success."""
+        lock_path = f"{path}.lock"
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            return False
+
+    def _unlock(self, path):
+        """Release an entry's lock."""
+        try:
+            os.remove(f"{path}.lock")
+        except OSError:
+            pass
+
+    def prune(self, retention=CACHE_RETENTION):
+        """Delete cached responses (and leftover temporary files) older than retention seconds."""
+        cutoff = time.time() - retention
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.name.endswith(".lock") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def fetch_many(jobs, limiter=RATE_LIMITER, workers=MAX_WORKERS, timeout=120, cache=None):
+    """Fetch several queries concurrently, each streamed to its own file, and return per-query stats.
+
+    jobs maps a name (e.g. a grid) to a (url, file_path) pair. Each query first takes a token from limiter (None for no
+    limit); with a cache, only queries whose cached response is missing or stale do, and before taking the entry's lock,
+    so a long wait on the limiter does not look like a crashed fetch to other processes. The result maps each name to a
+    dict of path (the response file), bytes received, wait (seconds spent waiting on the limiter), seconds (transfer
+    time), age (seconds, if the response came from cache, else None) and error (None, or the exception that made the
+    query fail). With a ResponseCache, a fresh cached response is used instead of querying, and file_path is ignored in
+    favour of the cache entry.
+    """
+    def run(url, file_path):
+        stats = {"path": file_path, "bytes": 0, "wait": 0.0, "seconds": 0.0, "age": None, "error": None}
+
+        def download(path):
+            started = time.perf_counter()
+            try:
+                stats["bytes"] = fetch_to_file(url, path, timeout)
+            finally:
+                stats["seconds"] = time.perf_counter() - started
+
+        try:
+            age = cache.age(url) if cache is not None else None
+            if limiter is not None and (age is None or age >= cache.ttl):
+                stats["wait"] = limiter.acquire()
+            if cache is None:
+                download(file_path)
+            else:
+                stats["path"], stats["age"] = cache.get(url, download)
+        except (OSError, http.client.HTTPException) as e:  # includes URLError, HTTPError and timeouts
+            stats["error"] = e
+        return stats
+
+    if not jobs:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as pool:
+        futures = {name: pool.submit(run, url, file_path) for name, (url, file_path) in jobs.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+class ReportReader:
+    """Iterate over the reception reports of a saved PSKReporter response without loading it whole.
+
+    The JSONP wrapper is found by looking for the opening brace of the response object rather than by fixed offsets.
+    Top-level values other than receptionReport (lastSequenceNumber, currentSeconds, ...) are collected in meta as
+    they are passed; meta is complete once iteration finishes.
+    """
+
+    def __init__(self, file_path):
+        """Initialize a reader for a response file (plain or compressed)."""
+        self.file_path = file_path
+        self.meta = {}
+        self.count = 0
+        self._decoder = json.JSONDecoder()
+
+    def __iter__(self):
+        self.meta = {}
+        self.count = 0
+        with open_compressed(self.file_path, "rt", encoding="utf-8") as f:
+            self._file = f
+            self._buf = ""
+            self._pos = 0
+            self._eof = False
+            self._skip_wrapper()
+            yield from self._object()
+
+    def _fill(self):
+        """Drop consumed text and read more, growing the read with the pending text so large values parse quickly."""
+        if self._eof:
+            raise ValueError(f"{self.file_path}: PSKReporter response ends early")
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        data = self._file.read(max(READ_SIZE, len(self._buf)))
+        self._eof = not data
+        self._buf += data
+
+    def _next_char(self):
+        """Skip whitespace and return the next character without consuming it."""
+        while True:
+            self._pos = _WHITESPACE_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            self._fill()
+
+    def _expect(self, chars):
+        """Consume the next non-whitespace character, which must be one of chars, and return it."""
+        char = self._next_char()
+        if char not in chars:
+            raise ValueError(f"{self.file_path}: expected one of {chars!r} in PSKReporter response, got {char!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """Decode the next JSON value, reading more of the file until it is complete."""
+        self._next_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a number or literal that ends exactly at the buffer end may continue in the next read
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError(f"{self.file_path}: truncated PSKReporter response") from e
+            self._fill()
+
+    def _skip_wrapper(self):
+        """Consume an optional JSONP callback prefix such as 'doNothing(' before the response object."""
+        while "{" not in self._buf[self._pos:]:
+            if self._eof or len(self._buf) - self._pos > MAX_WRAPPER_LENGTH:
+                break
+            self._fill()
+        start = self._buf.find("{", self._pos)
+        prefix = self._buf[self._pos:start]
+        if start < 0 or (prefix.strip() and not _CALLBACK_RE.match(prefix)):
+            raise ValueError(f"{self.file_path}: not a PSKReporter JSON response")
+        self._pos = start
+
+    def _reports(self):
+        """Yield the reports of a non-empty receptionReport array and consume its closing bracket."""
+        scan = self._decoder.scan_once  # raw_decode minus its Python wrapper
+        while True:
+            # fast path: the whole report object is already in the buffer
+            self._pos = _WHITESPACE_RE.match(self._buf, self._pos).end()
+            try:
+                report, self._pos = scan(self._buf, self._pos)
+            except (StopIteration, json.JSONDecodeError):
+                report = self._value()
+            self.count += 1
+            yield report
+            if self._buf.startswith(",", self._pos):  # a comma right after the report, as in compact JSON
+                self._pos += 1
+            elif self._expect(",]") == "]":
+                return
+
+    def _object(self):
+        """Walk the response object, yielding each reception report and collecting the other values in meta."""
+        self._expect("{")
+        if self._next_char() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "receptionReport" and self._next_char() == "[":
+                self._expect("[")
+                if self._next_char() == "]":
+                    self._pos += 1
+                else:
+                    yield from self._reports()
+            else:
+                self.meta[key] = self._value()
+            if self._expect(",}") == "}":
+                return
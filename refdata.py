@@ -0,0 +1,124 @@
+"""Reference data used by dx.py: DXCC entity names (dxcc.txt) and most wanted ranks (most_wanted.txt).
+
+Both files are parsed once into dict indexes. The compiled indexes are saved with marshal next to dxcc.txt, and later
+runs load them from there unless either source file's mtime or size has changed.
+"""
+
+import json
+import marshal
+import os
+
+_CACHE_MAGIC = b'REFDATA2'  # version tag of the compiled cache format
+
+
+def dxcc_name_strip(dxcc_input):
+    """Strip and normalize DXCC entity names for consistent comparison."""
+    return (dxcc_input.strip().upper()
+            .replace(".", "")
+            .replace(" ISLANDS", "")
+            .replace(" ISLAND", "")
+            .replace(" IS", ""))
+
+
+def _data_lines(file_path):
+    """Yield (line number, line) for each line of a reference file that is not blank or a # comment."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            yield line_number, line.rstrip("\n")
+
+
+def parse_dxcc(file_path):
+    """Parse dxcc.txt lines like "1,CANADA" into (dxcc2name, name2dxcc) dicts.
+
+    An entity may have several lines with alternate spellings; dxcc2name keeps the last one.
+    """
+    dxcc2name = {}
+    name2dxcc = {}
+    for line_number, line in _data_lines(file_path):
+        items = line.split(",")
+        try:
+            dxcc_number = int(items[0])
+        except ValueError:
+            raise ValueError(f'{file_path}:{line_number}: expected "<DXCC number>,<name>", got {line!r}')
+        dxcc_name = dxcc_name_strip(" ".join(items[1:]))
+        dxcc2name[dxcc_number] = dxcc_name
+        name2dxcc[dxcc_name] = dxcc_number
+    return dxcc2name, name2dxcc
+
+
+def parse_most_wanted(file_path):
+    """Parse most_wanted.txt lines like "1. P5 DPRK (NORTH KOREA)" into a prefix -> rank dict.
+
+    The rank is the entry's position in the file (counting from 0). A prefix listed more than once keeps the
+    position of its first entry.
+    """
+    code2rank = {}
+    for position, (line_number, line) in enumerate(_data_lines(file_path)):
+        items = line.split()
+        if len(items) < 2:
+            raise ValueError(f'{file_path}:{line_number}: expected "<rank>. <prefix> <name>", got {line!r}')
+        code2rank.setdefault(items[1], position)
+    return code2rank
+
+
+def _source_key(file_path):
+    """Fingerprint a source file as (absolute path, size, mtime_ns)."""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+class ReferenceData:
+    """DXCC names and most wanted ranks, indexed for O(1) lookups."""
+
+    def __init__(self, dxcc2name=None, name2dxcc=None, code2rank=None):
+        self.dxcc2name = dxcc2name or {}
+        self.name2dxcc = name2dxcc or {}
+        self.code2rank = code2rank or {}
+
+    @classmethod
+    def load(cls, dxcc_path="dxcc.txt", most_wanted_path="most_wanted.txt", cache_path=None, verbose=False):
+        """Load the reference files, going through the compiled cache when it is still current.
+
+        The cache lives next to dxcc_path by default and is rebuilt whenever either source file's size or mtime
+        changes; its format tag and key (a line of JSON) are checked before the indexes are loaded. Raises OSError
+        if a source file cannot be read and ValueError if one is malformed.
+        """
+        cache_path = cache_path or os.path.join(os.path.dirname(dxcc_path), ".refdata.cache")
+        key = (_source_key(dxcc_path), _source_key(most_wanted_path))
+        header = _CACHE_MAGIC + b'\n' + json.dumps(key).encode('utf-8') + b'\n'
+        try:
+            with open(cache_path, "rb") as cache_file:
+                if cache_file.read(len(header)) == header:
+                    indexes = marshal.loads(cache_file.read())
+                    if not (isinstance(indexes, tuple) and len(indexes) == 3
+                            and all(isinstance(index, dict) for index in indexes)):
+                        raise TypeError("unexpected contents")
+                    if verbose: print(f'   Loaded reference data from cache {cache_path}')
+                    return cls(*indexes)
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            if verbose: print(f'   Ignoring reference data cache {cache_path}: {e}')
+
+        indexes = parse_dxcc(dxcc_path) + (parse_most_wanted(most_wanted_path),)
+        tmp_path = f'{cache_path}.tmp'
+        try:
+            with open(tmp_path, "wb") as cache_file:
+                cache_file.write(header)
+                cache_file.write(marshal.dumps(indexes))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Unable to write reference data cache {cache_path}: {e}")
+        return cls(*indexes)
+
+    def get_rank(self, code):
+        """Return the most wanted rank of a DXCC prefix (0 is the most wanted), or None if it is unranked."""
+        return self.code2rank.get(code)
+
+    def get_dxcc_number(self, name):
+        """Return the DXCC entity number for an entity name in any spelling dxcc.txt knows, or None."""
+        return self.name2dxcc.get(dxcc_name_strip(name))
+
+    def get_dxcc_name(self, dxcc_number):
+        """Return the normalized name of a DXCC entity number, or None."""
+        return self.dxcc2name.get(dxcc_number)
@@ -0,0 +1,407 @@
+"""Columnar PSKReporter reception reports for vectorized filtering.
+
+A SpotTable reads the report dicts once into NumPy columns: frequency, band, DXCC entity number, most wanted rank,
+mode group and receiver grid. String columns are dictionary-encoded first, so name normalization and reference-data
+lookups run once per distinct value rather than once per report. Filters are then boolean masks over the columns;
+receiver and sender locators are matched and placed on the map with maidenhead.py.
+
+SpotWindow keeps the reports of successive polls for a sliding time window, and SpotAggregator folds reports into
+per-(callsign, band, mode) statistics for display.
+"""
+
+import gc
+from bisect import insort
+
+import numpy as np
+
+from bands import ALL_BANDS
+from maidenhead import GridMatcher, bearing, distance_km, to_latlon
+from needs import MAX_DXCC_NUM, MODE_GROUPS, mode_group
+from refdata import dxcc_name_strip
+
+# A report missing any of these cannot be filtered and is set aside as odd
+REQUIRED_FIELDS = frozenset(["senderDXCCCode", "senderDXCC", "receiverLocator", "senderLocator", "frequency"])
+
+
+def _encode(values):
+    """Dictionary-encode a sequence of strings as (distinct values, int32 index of each value)."""
+    distinct = list(dict.fromkeys(values))
+    index = {v: i for i, v in enumerate(distinct)}
+    return distinct, np.fromiter(map(index.__getitem__, values), dtype=np.int32, count=len(values))
+
+
+class SpotTable:
+    """PSKReporter reports as NumPy columns; -1 marks a missing band, DXCC number or rank."""
+
+    def __init__(self, reports, band_plan, refdata, resolver=None):
+        """Load report dicts (a list, or any iterable such as a ReportReader) into columns.
+
+        As before the columnar path, each report with a frequency has it converted to MHz in place and gains a
+        "band" key, since the rendering code reads both from the dicts. With a cty.CallsignResolver, reports whose
+        senderDXCC is missing or unknown to refdata get the entity resolved from their senderCallsign, written back
+        to senderDXCC and senderDXCCCode.
+        """
+        self.reports = reports if isinstance(reports, list) else list(reports)
+        reports = self.reports
+        count = len(reports)
+        self.complete = np.fromiter((REQUIRED_FIELDS <= r.keys() for r in reports), dtype=bool, count=count)
+        self.has_frequency = np.fromiter(("frequency" in r for r in reports), dtype=bool, count=count)
+
+        with_frequency = [r for r in reports if "frequency" in r]
+        frequencies = [int(r["frequency"])/1000000 for r in with_frequency]
+        band_names = band_plan.bands(frequencies).tolist()
+        for r, frequency, band in zip(with_frequency, frequencies, band_names):
+            r["frequency"] = frequency
+            r["band"] = band
+        self.frequency = np.full(count, np.nan)
+        self.frequency[self.has_frequency] = frequencies
+        band_index = {band: i for i, band in enumerate(ALL_BANDS)}
+        self.band_index = np.full(count, -1, dtype=np.int32)
+        self.band_index[self.has_frequency] = [band_index.get(band, -1) for band in band_names]
+
+        # each per-value lookup list ends in a default entry so that it keeps its dtype when there are no reports
+        names, codes = _encode([r.get("senderDXCC", "") for r in reports])
+        self.dxcc_name = np.array([dxcc_name_strip(name) for name in names] + [""], dtype=object)[codes]
+        self.dxcc = np.array([refdata.name2dxcc.get(dxcc_name_strip(name), -1) for name in names] + [-1],
+                             dtype=np.int32)[codes]
+        self.resolved = 0  # reports whose entity came from the resolver
+        if resolver is not None:
+            self._resolve_senders(resolver, refdata)
+
+        prefixes, codes = _encode([r.get("senderDXCCCode", "") for r in reports])
+        self.dxcc_code = np.array(prefixes + [""], dtype=object)[codes]
+        ranks = [refdata.get_rank(prefix) for prefix in prefixes]
+        self.rank = np.array([-1 if rank is None else rank for rank in ranks] + [-1], dtype=np.int32)[codes]
+
+        modes, codes = _encode([r.get("mode", "") for r in reports])
+        self.mode_group = np.array([MODE_GROUPS.index(mode_group(mode)) for mode in modes] + [0],
+                                   dtype=np.int32)[codes]
+
+        # kept dictionary-encoded, since masks and positions are computed once per distinct locator
+        self.rx_grids, self.rx_grid_codes = _encode([r.get("receiverLocator", "") for r in reports])
+        self._tx_grids = None  # (distinct senderLocators, codes), encoded on first use
+
+    def __len__(self):
+        return len(self.reports)
+
+    def _resolve_senders(self, resolver, refdata):
+        """Fill in the entity of reports with an unknown senderDXCC or no senderDXCCCode from their callsign."""
+        reports = self.reports
+        has_code = np.fromiter(("senderDXCCCode" in r for r in reports), dtype=bool, count=len(reports))
+        for i in np.flatnonzero((self.dxcc < 0) | ~has_code).tolist():
+            r = reports[i]
+            entity = resolver.resolve(r["senderCallsign"]) if "senderCallsign" in r else None
+            if entity is None:
+                continue
+            name = dxcc_name_strip(entity.name)
+            dxcc = refdata.name2dxcc.get(name)
+            if dxcc is None:
+                continue
+            r["senderDXCC"] = entity.name
+            r["senderDXCCCode"] = entity.prefix
+            self.dxcc_name[i] = name
+            self.dxcc[i] = dxcc
+            self.complete[i] = REQUIRED_FIELDS <= r.keys()
+            self.resolved += 1
+
+    def rx_mask(self, grids):
+        """Mask of reports heard in one of a comma-separated string of grids (or a GridMatcher), matched as locator
+        prefixes."""
+        if grids is None or grids == []:
+            return np.ones(len(self), dtype=bool)
+        matcher = grids if isinstance(grids, GridMatcher) else GridMatcher(grids)
+        return np.append(matcher.mask(self.rx_grids), False)[self.rx_grid_codes]
+
+    def rx_radius_mask(self, home, radius_km):
+        """Mask of reports heard within radius_km of a (latitude, longitude); unknown receiver locators are not."""
+        lat, lon = to_latlon(self.rx_grids + [""])
+        return (distance_km(home[0], home[1], lat, lon) <= radius_km)[self.rx_grid_codes]
+
+    def tx_distance(self, home):
+        """Distance in km from a (latitude, longitude) to each report's sender, NaN where its locator is unknown."""
+        grids, codes = self._sender_grids()
+        lat, lon = to_latlon(grids)
+        return distance_km(home[0], home[1], lat, lon)[codes]
+
+    def tx_bearing(self, home):
+        """Bearing in degrees from a (latitude, longitude) to each report's sender, NaN where its locator is unknown."""
+        grids, codes = self._sender_grids()
+        lat, lon = to_latlon(grids)
+        return bearing(home[0], home[1], lat, lon)[codes]
+
+    def _sender_grids(self):
+        if self._tx_grids is None:
+            grids, codes = _encode([r.get("senderLocator", "") for r in self.reports])
+            self._tx_grids = (grids + [""], codes)
+        return self._tx_grids
+
+    def callsign_mask(self, callsigns):
+        """Mask of reports sent by one of the given callsigns."""
+        return np.fromiter((r.get("senderCallsign") in callsigns for r in self.reports), dtype=bool, count=len(self))
+
+    def band_mask(self, bands):
+        """Mask of reports on one of the given bands."""
+        return np.isin(self.band_index, [ALL_BANDS.index(band) for band in bands if band in ALL_BANDS])
+
+    def rank_mask(self, max_rank):
+        """Mask of reports from unranked entities or entities ranked better than max_rank."""
+        return (self.rank < 0) | (self.rank < max_rank)
+
+    def confirmed_mask(self, needs, by_mode=False):
+        """Mask of reports whose entity is already confirmed on their band (and mode group, with by_mode).
+
+        Reports without a known DXCC number or band are never confirmed.
+        """
+        valid = (self.dxcc > 0) & (self.dxcc < MAX_DXCC_NUM) & (self.band_index >= 0)
+        dxcc = np.where(valid, self.dxcc, 0)
+        band = np.where(valid, self.band_index, 0)
+        if by_mode:
+            confirmed = needs.confirmed[dxcc, band, self.mode_group] > 0
+        else:
+            confirmed = needs.confirmed.sum(axis=2)[dxcc, band] > 0
+        return valid & confirmed
+
+    def select(self, mask):
+        """Return the report dicts selected by a mask, in their original order."""
+        return [self.reports[i] for i in np.flatnonzero(mask).tolist()]
+
+
+class SpotWindow:
+    """Reports from successive polls, deduplicated and kept for a sliding window of seconds.
+
+    A report's age is taken from its flowStartSeconds, or from when it was added if it has none.
+    """
+
+    def __init__(self, seconds):
+        """Initialize an empty window of the given length."""
+        self.seconds = seconds
+        self._reports = {}  # report key -> (report, time)
+
+    @staticmethod
+    def key(report):
+        """Identify a report by sender, receiver, frequency, mode and time."""
+        return tuple(report.get(field) for field in
+                     ("senderCallsign", "receiverCallsign", "frequency", "mode", "flowStartSeconds"))
+
+    def __len__(self):
+        return len(self._reports)
+
+    def add(self, reports, now):
+        """Add reports not seen before and return how many were new."""
+        added = 0
+        for r in reports:
+            key = self.key(r)
+            if key not in self._reports:
+                self._reports[key] = (r, int(r.get("flowStartSeconds", now)))
+                added += 1
+        return added
+
+    def newest(self):
+        """Return the time of the newest report, or None if the window is empty."""
+        return max((seen for _, seen in self._reports.values()), default=None)
+
+    def evict(self, now):
+        """Drop reports older than the window as of now and return how many were dropped."""
+        cutoff = now - self.seconds
+        expired = [key for key, (_, seen) in self._reports.items() if seen < cutoff]
+        for key in expired:
+            del self._reports[key]
+        return len(expired)
+
+    def reports(self):
+        """Return copies of the reports in the window, which SpotTable can annotate without touching the originals."""
+        return [dict(r) for r, _ in self._reports.values()]
+
+
+class SpotAggregate:
+    """Running statistics of the reports of one (callsign, band, mode), updated in O(1) per report.
+
+    SNRs are kept as a histogram (SNR -> count), from which the median is read. Receiver grids are kept as a sorted
+    list of the first max_receivers distinct grids in sort order, so a busy station's thousands of repeat reports cost
+    no memory. Frequencies are clustered by rounding to frequency_digits decimal places of MHz (1 kHz by default).
+    Most stations are heard only once, so the containers are only created when a second report arrives.
+    """
+
+    __slots__ = ("report", "count", "first_seen", "last_seen", "best_snr", "_snr_counts", "_receivers", "_clusters",
+                 "max_receivers", "frequency_digits")
+
+    def __init__(self, report, max_receivers=20, frequency_digits=3):
+        """Initialize empty statistics; report is the first report, kept for the station's static details."""
+        self.report = report
+        self.count = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.best_snr = None
+        self._snr_counts = None
+        self._receivers = None
+        self._clusters = None  # rounded frequency -> report count, in first-seen order
+        self.max_receivers = max_receivers
+        self.frequency_digits = frequency_digits
+
+    def add(self, report, now=None):
+        """Count one report, timed by its flowStartSeconds (or now, if it has none).
+
+        Like SpotTable and SpotWindow, times and SNRs are read with int(), as responses may carry them as strings.
+        """
+        seen = report.get("flowStartSeconds", now)
+        if seen is not None:
+            seen = int(seen)
+            if self.first_seen is None:
+                self.first_seen = self.last_seen = seen
+            elif seen > self.last_seen:
+                self.last_seen = seen
+            elif seen < self.first_seen:
+                self.first_seen = seen
+        snr = report.get("sNR")
+        if snr is not None and (self.best_snr is None or int(snr) > self.best_snr):
+            self.best_snr = int(snr)
+        self.count += 1
+        if self.count == 1:
+            self.report = report
+            return
+        if self._clusters is None:
+            self._snr_counts, self._receivers, self._clusters = {}, [], {}
+            self._count(self.report)
+        self._count(report)
+
+    def _count(self, report):
+        """Add a report's SNR, receiver and frequency to the containers."""
+        snr = report.get("sNR")
+        if snr is not None:
+            snr = int(snr)
+            snr_counts = self._snr_counts
+            snr_counts[snr] = snr_counts[snr] + 1 if snr in snr_counts else 1
+        receiver = report.get("receiverLocator", "")[0:4]
+        receivers = self._receivers
+        if receiver not in receivers and (len(receivers) < self.max_receivers or receiver < receivers[-1]):
+            insort(receivers, receiver)
+            if len(receivers) > self.max_receivers:
+                receivers.pop()
+        frequency = round(report["frequency"], self.frequency_digits)
+        clusters = self._clusters
+        clusters[frequency] = clusters[frequency] + 1 if frequency in clusters else 1
+
+    @property
+    def snr_counts(self):
+        """Return the SNR histogram as a dict of SNR -> report count."""
+        if self._snr_counts is not None:
+            return self._snr_counts
+        snr = self.report.get("sNR")
+        return {} if snr is None or not self.count else {int(snr): 1}
+
+    @property
+    def receivers(self):
+        """Return the (first max_receivers, in sort order) distinct receiver grids."""
+        if self._receivers is not None:
+            return self._receivers
+        return [self.report.get("receiverLocator", "")[0:4]] if self.count else []
+
+    @property
+    def clusters(self):
+        """Return the frequency clusters as a dict of rounded frequency (MHz) -> report count, in first-seen order."""
+        if self._clusters is not None:
+            return self._clusters
+        return {round(self.report["frequency"], self.frequency_digits): 1} if self.count else {}
+
+    @property
+    def median_snr(self):
+        """Return the median SNR (the lower median for an even count), or None if no report had one."""
+        snr_counts = self.snr_counts
+        total = sum(snr_counts.values())
+        seen = 0
+        for snr in sorted(snr_counts):
+            seen += snr_counts[snr]
+            if 2 * seen >= total:
+                return snr
+        return None
+
+
+class SpotAggregator:
+    """SpotAggregates keyed by (callsign, band, mode), for one-shot runs or a long-running process.
+
+    Reports must carry "band" and a frequency in MHz, as SpotTable leaves them.
+    """
+
+    def __init__(self, max_receivers=20, frequency_digits=3):
+        """Initialize an empty aggregator."""
+        self.max_receivers = max_receivers
+        self.frequency_digits = frequency_digits
+        self.aggregates = {}  # (callsign, band, mode) -> SpotAggregate, in first-seen order
+        self.callsigns = {}  # callsign -> its SpotAggregates, in first-seen order
+
+    def __len__(self):
+        return len(self.aggregates)
+
+    def add(self, report, now=None):
+        """Count one report into its (callsign, band, mode) aggregate."""
+        key = (report.get("senderCallsign"), report.get("band"), report.get("mode"))
+        aggregate = self.aggregates.get(key)
+        if aggregate is None:
+            aggregate = self.aggregates[key] = SpotAggregate(report, self.max_receivers, self.frequency_digits)
+            self.callsigns.setdefault(key[0], []).append(aggregate)
+        aggregate.add(report, now)
+
+    def add_all(self, reports, now=None):
+        """Count every report of an iterable and return self."""
+        # each new aggregate allocates a few containers; cyclic GC passes over them are wasted work
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        aggregates = self.aggregates
+        callsigns = self.callsigns
+        try:
+            for r in reports:
+                # add, inlined
+                key = (r.get("senderCallsign"), r.get("band"), r.get("mode"))
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregate = aggregates[key] = SpotAggregate(r, self.max_receivers, self.frequency_digits)
+                    callsigns.setdefault(key[0], []).append(aggregate)
+                aggregate.add(r, now)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return self
+
+    def by_callsign(self):
+        """Return a dict of callsign -> list of its aggregates, both in first-seen order (kept up to date by add)."""
+        return self.callsigns
+
+    def summary(self, callsign):
+        """Summarize a callsign's aggregates as (modes, bands, frequencies, receivers, spot count).
+
+        Modes, bands and frequency clusters (in MHz) are distinct and in first-seen order; receivers are the first
+        max_receivers distinct grids in sort order.
+        """
+        modes, bands, clusters = {}, {}, {}
+        receivers = set()
+        count = 0
+        for a in self.callsigns[callsign]:
+            r = a.report
+            modes[r["mode"]] = None
+            bands[r["band"]] = None
+            count += a.count
+            if a._clusters is None:  # a single report
+                clusters[round(r["frequency"], self.frequency_digits)] = None
+                receivers.add(r.get("receiverLocator", "")[0:4])
+            else:
+                clusters.update(a._clusters)
+                receivers.update(a._receivers)
+        return list(modes), list(bands), list(clusters), sorted(receivers)[0:self.max_receivers], count
+
+    def evict(self, before):
+        """Drop aggregates whose last report is older than before (in seconds) and return how many were dropped."""
+        expired = [key for key, aggregate in self.aggregates.items()
+                   if aggregate.last_seen is not None and aggregate.last_seen < before]
+        for key in expired:
+            aggregate = self.aggregates.pop(key)
+            remaining = [a for a in self.callsigns[key[0]] if a is not aggregate]
+            if remaining:
+                self.callsigns[key[0]] = remaining
+            else:
+                del self.callsigns[key[0]]
+        return len(expired)
+
+    def clear(self):
+        """Drop every aggregate."""
+        self.aggregates = {}
+        self.callsigns = {}
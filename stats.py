@@ -0,0 +1,123 @@
+"""Per-stage timing and counters for the scripts' --profile and --stats_json options.
+
+A RunStats records, for each named stage of a run, its wall time, CPU time (of all threads) and peak RSS, along with
+named counters (reports seen, records parsed, bytes fetched, ...). Stages entered more than once, like the polls of
+dx.py --watch, add up. On Linux the peak RSS is reset at the start of each stage so that each stage reports its own;
+elsewhere a stage's peak is the process's peak so far. Since the peak is the process's, stages run on other threads
+alongside the main one (a dx.py --hub client's render) are timed as thread stages, which leave the peak alone.
+"""
+
+import datetime
+import json
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS (VmHWM) of this process, returning False where that is not supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Return the peak RSS of this process in MB, since the last reset where resets are supported."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1e6 if sys.platform == "darwin" else 1e3)
+
+
+class RunStats:
+    """Stage timings and counters of one run of a script."""
+
+    def __init__(self, script):
+        """Start the clock on a run of the named script."""
+        self.script = script
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.stages = {}  # name -> {"calls", "wall_s", "cpu_s", "peak_rss_mb"}, in first-entered order
+        self.counters = {}
+        self._lock = threading.Lock()  # stages and counters are also updated from the threads of dx.py --hub
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name, thread=False):
+        """Time the body of a with statement as the named stage.
+
+        A thread stage, for code running alongside the main thread, counts the CPU time of its own thread only and
+        neither resets nor records the peak RSS (its peak_rss_mb is None).
+        """
+        clock = time.thread_time if thread else time.process_time
+        if not thread:
+            _reset_peak_rss()
+        wall, cpu = time.perf_counter(), clock()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, clock() - cpu
+            peak = None if thread else peak_rss_mb()
+            with self._lock:
+                stage = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": peak})
+                stage["calls"] += 1
+                stage["wall_s"] += wall
+                stage["cpu_s"] += cpu
+                if peak is not None:
+                    stage["peak_rss_mb"] = max(stage["peak_rss_mb"], peak)
+
+    def count(self, name, n=1):
+        """Add n to the named counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        """Return the run's stats as a JSON-serializable dict."""
+        with self._lock:
+            stages = {name: dict(s) for name, s in self.stages.items()}
+            counters = dict(self.counters)
+        peaks = [s["peak_rss_mb"] for s in stages.values() if s["peak_rss_mb"] is not None]
+        return {
+            "script": self.script,
+            "argv": sys.argv[1:],
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_s": round(time.perf_counter() - self._wall, 6),
+            "cpu_s": round(time.process_time() - self._cpu, 6),
+            "peak_rss_mb": max([peak_rss_mb()] + peaks),
+            "stages": {name: dict(s, wall_s=round(s["wall_s"], 6), cpu_s=round(s["cpu_s"], 6))
+                       for name, s in stages.items()},
+            "counters": counters,
+        }
+
+    def print_report(self):
+        """Print a table of the stages followed by the counters."""
+        run = self.to_dict()
+        print()
+        print(f'{"Stage":<24} {"Calls":>6} {"Wall s":>9} {"CPU s":>9} {"Peak MB":>9}')
+        for name, s in run["stages"].items():
+            peak = "-" if s["peak_rss_mb"] is None else f'{s["peak_rss_mb"]:.1f}'
+            print(f'{name:<24} {s["calls"]:>6} {s["wall_s"]:>9.3f} {s["cpu_s"]:>9.3f} {peak:>9}')
+        print(f'{"total":<24} {"":>6} {run["wall_s"]:>9.3f} {run["cpu_s"]:>9.3f} {run["peak_rss_mb"]:>9.1f}')
+        for name, value in run["counters"].items():
+            print(f'   {name}: {value}')
+
+    def save(self, file_path):
+        """Write the run's stats as JSON; a .jsonl file gets one line appended per run, to track runs over time."""
+        if file_path.endswith(".jsonl"):
+            with open(file_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.to_dict()) + "\n")
+        else:
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, indent=2)
+                f.write("\n")
@@ -0,0 +1,212 @@
+"""Tests of adif.py: the length-driven tokenizer and writer round trip, parse_parallel, ADIFMerger and ADIFTail."""
+
+import io
+
+import pytest
+
+from adif import ADIFFile, ADIFMerger, ADIFTail, ADIFWriter
+
+HEADER = "<ADIF_VER:5>3.1.0 <PROGRAMID:4>LoTW <eoh>\n\n\n"
+RECORDS = [
+    "<CALL:5>K1ABC    <BAND:3>20m <MODE:3>FT8 <QSO_DATE:8:D>20240102 <QSL_RCVD:1>Y <eor>\n",
+    # a non-ASCII value (length in bytes), and a value holding '<' and a newline
+    "<CALL:6>DL1XYZ   <NAME:5>Jörg <COMMENT:11>73 <eor>\nGL <eor>\n",
+    "<CALL:4>JA1A     <BAND:3>40m <MODE:2>CW <eor>\n",
+]
+
+
+def fields(records):
+    return [(r.type, r.fields) for r in records]
+
+
+def write(records, exact=True):
+    output = io.StringIO()
+    with ADIFWriter(output, exact=exact) as writer:
+        writer.write_all(records)
+    return output.getvalue()
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / "log.adi"
+    path.write_bytes((HEADER + "".join(RECORDS)).encode("utf-8"))
+    return str(path)
+
+
+def test_parse(log_path):
+    log = ADIFFile()
+    log.parse(log_path)
+    header, *records = log.records
+    assert header.type == "header"
+    assert header.get("PROGRAMID") == "LoTW"
+    assert [r.get("CALL") for r in records] == ["K1ABC", "DL1XYZ", "JA1A"]
+    assert records[1].get("NAME") == "Jörg"
+    assert records[1].get("COMMENT") == "73 <eor>\nGL"
+    assert records[0].fields["QSO_DATE"] == ("QSO_DATE", "20240102", "D")
+
+
+def test_one_record_per_line_and_single_field_per_line_parse_alike(tmp_path):
+    lines = tmp_path / "lines.adi"
+    lines.write_text("<CALL:5>K1ABC\n<BAND:3>20m\n<eor>\n<CALL:4>JA1A\n<BAND:3>40m\n<eor>\n")
+    packed = tmp_path / "packed.adi"
+    packed.write_text("<call:5>K1ABC<band:3>20m<EOR><call:4>JA1A<band:3>40m<EOR>")
+    a, b = ADIFFile(), ADIFFile()
+    a.parse(str(lines))
+    b.parse(str(packed))
+    assert [(r.get("CALL"), r.get("BAND")) for r in a.records] == [("K1ABC", "20m"), ("JA1A", "40m")]
+    assert [(r.get("CALL"), r.get("BAND")) for r in b.records] == [("K1ABC", "20m"), ("JA1A", "40m")]
+
+
+def test_round_trip_is_byte_exact(log_path):
+    log = ADIFFile()
+    log.parse(log_path)
+    text = write(log.records)
+    with open(log_path, encoding="utf-8") as f:
+        assert text == f.read()
+    assert text == "".join(str(r) + "\n" for r in log.records)
+
+
+def test_round_trip_keeps_length_specifiers(tmp_path):
+    # values that are not UTF-8 (Latin-1, or cut mid-character) are written back with the length read
+    path = tmp_path / "latin1.adi"
+    path.write_bytes(b"<CALL:5>K1ABC    <QTH:4>K\xf6ln <NAME:3>Zo\xc3\xab <eor>\n")
+    log = ADIFFile()
+    log.parse(str(path))
+    assert write(log.records) == "<CALL:5>K1ABC    <QTH:4>K\ufffdln <NAME:3>Zo\ufffd <eor>\n"
+    log.records[0].set("QTH", "Zürich")
+    assert write(log.records) == "<CALL:5>K1ABC    <QTH:6>Zürich <NAME:3>Zo\ufffd <eor>\n"
+
+
+def test_compact_writer(log_path):
+    log = ADIFFile()
+    log.parse(log_path)
+    text = write(log.records[2:3], exact=False)
+    assert text == "<CALL:6>DL1XYZ <NAME:5>Jörg <COMMENT:11>73 <eor>\nGL<eor>\n"
+    reparsed = ADIFFile()
+    reparsed.parse(io.StringIO(text))
+    assert fields(reparsed.records) == fields(log.records[2:3])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 16, 50, 1000])
+def test_parse_parallel_matches_parse(tmp_path, chunk_size):
+    path = tmp_path / "big.adi"
+    # "<eor>" inside values makes some cut points land in the middle of a record
+    records = [RECORDS[i % len(RECORDS)] for i in range(60)]
+    path.write_bytes((HEADER + "".join(records)).encode("utf-8"))
+    serial, parallel = ADIFFile(), ADIFFile()
+    serial.parse(str(path))
+    parallel.parse_parallel(str(path), workers=2, chunk_size=chunk_size)
+    assert fields(parallel.records) == fields(serial.records)
+
+
+def test_tail_holds_back_a_partial_record(tmp_path):
+    path = tmp_path / "wsjtx_log.adi"
+    path.write_bytes((HEADER + RECORDS[0]).encode("utf-8"))
+    tail = ADIFTail(str(path))
+    assert [r.get("CALL") for r in tail.poll()] == ["K1ABC"]
+    assert tail.header.get("PROGRAMID") == "LoTW"
+
+    partial = RECORDS[1].encode("utf-8")
+    cut = partial.index(b"<eor>") + 2  # in the middle of the COMMENT value
+    with open(path, "ab") as f:
+        f.write(partial[:cut])
+    assert tail.poll() == []
+    with open(path, "ab") as f:
+        f.write(partial[cut:])
+    (record,) = tail.poll()
+    assert record.get("COMMENT") == "73 <eor>\nGL"
+    assert tail.poll() == []
+    assert tail.records_read == 2 and tail.resets == 0
+
+
+def test_tail_restarts_after_truncation(tmp_path):
+    path = tmp_path / "wsjtx_log.adi"
+    path.write_text(RECORDS[0] + RECORDS[2])
+    tail = ADIFTail(str(path))
+    assert len(tail.poll()) == 2
+    path.write_text(RECORDS[2])
+    assert [r.get("CALL") for r in tail.poll()] == ["JA1A"]
+    assert tail.resets == 1
+
+
+def qso(date, time_on, confirmed=False):
+    text = f"<CALL:5>K1ABC <QSO_DATE:8>{date} <TIME_ON:4>{time_on} <BAND:3>20m <MODE:3>FT8 "
+    if confirmed:
+        text += "<QSL_RCVD:1>Y "
+    log = ADIFFile()
+    log.parse(io.StringIO(text + "<eor>\n"))
+    return log.records[0]
+
+
+def merged_times(*records):
+    merger = ADIFMerger(time_tolerance=2)
+    merger.merge(records)
+    return [(r.get("QSO_DATE"), r.get("TIME_ON")) for r in merger.records], merger.duplicates
+
+
+def test_merger_does_not_chain_near_duplicates():
+    # 1204 is within the tolerance of 1202, but 1202 was dropped in favour of 1200
+    times = merged_times(qso("20240102", "1200"), qso("20240102", "1202"), qso("20240102", "1204"))
+    assert times == ([("20240102", "1200"), ("20240102", "1204")], 1)
+
+
+def test_merger_compares_against_the_kept_record():
+    # the confirmed 0004 replaces 0002, so 0006 is a duplicate of it even though 0002 was indexed first
+    times = merged_times(qso("20240102", "0002"), qso("20240102", "0004", confirmed=True), qso("20240102", "0006"))
+    assert times == ([("20240102", "0004")], 2)
+
+
+def test_merger_matches_across_midnight():
+    times = merged_times(qso("20231231", "2359"), qso("20240101", "0001"), qso("20240102", "0001"))
+    assert times == ([("20231231", "2359"), ("20240102", "0001")], 1)
+
+
+def test_repeated_fields_are_kept(tmp_path):
+    path = tmp_path / "repeated.adi"
+    text = "<CALL:5>K1ABC    <NOTES:3>one <BAND:3>20m <NOTES:3>two <notes:5>three <eor>\n"
+    path.write_text(text)
+    serial, parallel = ADIFFile(), ADIFFile()
+    serial.parse(str(path))
+    parallel.parse_parallel(str(path), workers=2, chunk_size=16)
+    assert fields(parallel.records) == fields(serial.records)
+    (record,) = serial.records
+    assert record.get("NOTES") == "one"
+    assert [(row.field_name, row.field_data) for row in record.rows][3:] == [("NOTES", "two"), ("notes", "three")]
+    assert write(serial.records) == text
+    assert str(record) + "\n" == text
+
+    record.remove_except(["CALL", "NOTES"])
+    assert str(record) == "<CALL:5>K1ABC    <NOTES:3>one <NOTES:3>two <NOTES:5>three <eor>"
+    record.set("NOTES", "all")
+    assert str(record) == "<CALL:5>K1ABC    <NOTES:3>all <NOTES:3>all <NOTES:3>all <eor>"
+
+
+def test_set_keeps_the_comment(log_path):
+    log = ADIFFile()
+    log.parse(log_path)
+    record = log.records[1]
+    record.set("QTH", "Zürich", comment="portable")
+    (row,) = [row for row in record.rows if row.field_name == "QTH"]
+    assert (row.field_data, row.field_length, row.comment) == ("Zürich", 6, "portable")
+    assert record.get("QTH") == "Zürich"
+    assert str(record).endswith("<QTH:6>Zürich <eor>")
+    assert write([record]) == str(record) + "\n"
+
+
+def test_parse_cached(log_path):
+    first, second = ADIFFile(), ADIFFile()
+    assert first.parse_cached(log_path) is False
+    assert second.parse_cached(log_path) is True
+    assert fields(second.records) == fields(first.records)
+
+
+def test_parse_cached_checks_the_key_before_loading(log_path, tmp_path):
+    ADIFFile().parse_cached(log_path)
+    with open(log_path, "a") as f:
+        f.write(RECORDS[2])
+    # a cache for another file (or version of it) is reparsed, not loaded, whatever follows its key
+    cache = tmp_path / "log.adi.cache"
+    cache.write_bytes(cache.read_bytes().split(b"\n", 2)[0] + b"\n[]\nnot marshal data")
+    log = ADIFFile()
+    assert log.parse_cached(log_path) is False
+    assert len(log.records) == 5
@@ -0,0 +1,49 @@
+"""Tests of hub.py: needs matrix uploads to a running HubServer."""
+
+import http.client
+import threading
+
+import numpy as np
+import pytest
+
+from hub import HubServer, SpotHub
+from needs import NeedsMatrix
+from test_needs import blob
+
+
+@pytest.fixture
+def server():
+    hub = SpotHub(lambda snapshot, query, needs: {"dx": []}, {})
+    server = HubServer(("127.0.0.1", 0), hub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, path, body, headers=None):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=5)
+    connection.request("POST", path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
+
+
+def test_upload_needs(server):
+    assert post(server, "/needs/k1abc", NeedsMatrix().to_bytes()) == 200
+    assert list(server.hub.needs) == ["k1abc"]
+
+
+@pytest.mark.parametrize("body", [
+    blob(worked=np.zeros((2, 2, 2), dtype=np.uint32), confirmed=np.zeros((2, 2, 2), dtype=np.uint32)),
+    b"garbage",
+    b"",
+])
+def test_malformed_uploads_are_rejected(server, body):
+    assert post(server, "/needs/k1abc", body) == 400
+    assert server.hub.needs == {}
+
+
+def test_negative_content_length_is_rejected(server):
+    assert post(server, "/needs/k1abc", b"", {"Content-Length": "-1"}) == 400
@@ -0,0 +1,49 @@
+"""Tests of needs.py: NeedsMatrix serialization and the checks on loading it."""
+
+import io
+
+import numpy as np
+import pytest
+
+from bands import ALL_BANDS
+from needs import MODE_GROUPS, NeedsMatrix
+
+
+def blob(**arrays):
+    """Serialize a matrix like NeedsMatrix.to_bytes, with some of its arrays replaced."""
+    matrix = NeedsMatrix()
+    contents = dict(worked=matrix.worked, confirmed=matrix.confirmed, example_log=matrix.example_log,
+                    example_record=matrix.example_record, logs=np.array([], dtype=str), bands=np.array(ALL_BANDS),
+                    mode_groups=np.array(MODE_GROUPS))
+    contents.update(arrays)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **contents)
+    return buffer.getvalue()
+
+
+def test_round_trip():
+    matrix = NeedsMatrix()
+    matrix.add_many([(291, "20m", "CW"), (230, "40m", "DATA")], [True, False], "log.adi", [0, 1])
+    loaded = NeedsMatrix.from_bytes(matrix.to_bytes())
+    assert (loaded.worked == matrix.worked).all() and (loaded.confirmed == matrix.confirmed).all()
+    assert loaded.logs == ["log.adi"]
+    assert list(loaded.examples()) == list(matrix.examples())
+
+
+@pytest.mark.parametrize("arrays", [
+    {"worked": np.zeros((2, 2, 2), dtype=np.uint32)},
+    {"confirmed": np.zeros((2, 2, 2), dtype=np.uint32)},
+    {"example_record": np.zeros((2, 2, 2), dtype=np.int32)},
+    {"worked": np.zeros((600, len(ALL_BANDS), len(MODE_GROUPS)), dtype=np.float64)},
+    {"example_log": np.full((600, len(ALL_BANDS), len(MODE_GROUPS)), 3, dtype=np.int16)},
+    {"bands": np.array(["20m"])},
+])
+def test_malformed_matrices_are_rejected(arrays):
+    with pytest.raises(ValueError):
+        NeedsMatrix.from_bytes(blob(**arrays))
+
+
+@pytest.mark.parametrize("data", [b"", b"garbage", b"PK\x03\x04junk"])
+def test_other_data_is_rejected(data):
+    with pytest.raises(ValueError):
+        NeedsMatrix.from_bytes(data)
@@ -0,0 +1,32 @@
+"""Tests of pskreporter.py: streaming a saved response with ReportReader."""
+
+import gzip
+import re
+
+import pytest
+
+from pskreporter import ReportReader
+
+RESPONSE = ('doNothing({"currentSeconds": 1700000000, "receptionReport": [{"senderCallsign": "K1ABC", "frequency": '
+            '14074000}, {"senderCallsign": "JA1A", "frequency": 7074000}], "lastSequenceNumber": 42});\n')
+
+
+def test_reads_reports_and_meta(tmp_path):
+    path = tmp_path / "response.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(RESPONSE)
+    reader = ReportReader(str(path))
+    assert [r["senderCallsign"] for r in reader] == ["K1ABC", "JA1A"]
+    assert reader.count == 2
+    assert reader.meta == {"currentSeconds": 1700000000, "lastSequenceNumber": 42}
+
+
+@pytest.mark.parametrize("cut, message", [
+    (RESPONSE.index("JA1A") + 2, "truncated PSKReporter response"),  # in the middle of a report
+    (RESPONSE.index("42") + 1, "PSKReporter response ends early"),  # after a complete value
+])
+def test_truncated_response(tmp_path, cut, message):
+    path = tmp_path / "response.json"
+    path.write_text(RESPONSE[:cut])
+    with pytest.raises(ValueError, match=f"^{re.escape(str(path))}: {message}$"):
+        list(ReportReader(str(path)))